@@ -0,0 +1,364 @@
+"""Benchmarks for the worker's Python runtime (public/static/js/init.py).
+
+init.py is loaded under plain CPython with stand-ins for the browser: a js
+module whose calls do the work a Pyodide crossing would (converting, copying),
+pyodide.ffi.to_js, and an XMLHttpRequest answering the synchronous requests
+the service worker would (input, breakpoints, turtle). Absolute numbers differ
+from Pyodide in the browser, but changes to init.py show up in the ratios.
+
+The baseline is measured in the same run, on the same machine: init.py of a
+git revision (HEAD unless --against says otherwise) and the working tree's
+each load in a process of their own, and every benchmark alternates between
+them round by round, so load on the machine affects both alike.
+
+    python bench/init_bench.py                       # working tree vs HEAD
+    python bench/init_bench.py --against origin/main # working tree vs main
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+INIT_PY_PATH = "public/static/js/init.py"
+RESULTS = os.path.join(HERE, "results.json")
+RESULT_PREFIX = "@bench "  # marks result lines among what init.py prints
+
+# stand-ins
+
+
+def to_js(value, dict_converter=None):
+    # deep copy, like Pyodide's conversion into JS objects
+    if isinstance(value, dict):
+        items = [(k, to_js(v, dict_converter)) for k, v in value.items()]
+        return dict_converter(items) if dict_converter else dict(items)
+    if isinstance(value, (list, tuple)):
+        return [to_js(v, dict_converter) for v in value]
+    return value
+
+
+class JsProxy(dict):
+    # test requirements arrive as JS objects
+    def as_object_map(self):
+        return self
+
+
+class XMLHttpRequest:
+    # synchronous requests answered the way the service worker would
+    responses = {
+        "/@input@/req.js": json.dumps({"data": "7"}),
+        "/@debug@/break.js": json.dumps({}),
+        "/@turtle@/req.js": json.dumps({"data": ""}),
+    }
+
+    @classmethod
+    def new(cls):
+        return cls()
+
+    def open(self, method, url, is_async):
+        self.url = url.split("?")[0]
+
+    def setRequestHeader(self, name, value):
+        pass
+
+    def send(self):
+        self.status = 200
+        self.response = self.responses.get(self.url, "{}")
+
+
+def make_js_module():
+    js = types.ModuleType("js")
+    posted = []
+
+    def workerPostMessage(msg):
+        # structured clone on the way to the page
+        posted.append(json.dumps(msg))
+        if len(posted) > 1000:
+            posted.clear()
+
+    js.Object = types.SimpleNamespace(fromEntries=dict)
+    js.console = types.SimpleNamespace(log=lambda *args: None)
+    js.XMLHttpRequest = XMLHttpRequest
+    js.workerPostMessage = workerPostMessage
+    js.workerDraw = lambda msg: workerPostMessage({"cmd": "draw", "msg": msg})
+    js.workerMemoryPeak = lambda: 0
+    js.workerArmPatternBudget = lambda ms: None
+    js.workerArmOutputFlush = lambda ms: None
+    js.workerMaterialiseLazyFile = lambda path, keep: None
+    js.workerInterrupted = lambda: False
+    js.workerCheckKeyDown = lambda key: False
+    js.workerKeysDown = lambda: bytes(256)
+    js.workerPollEvents = lambda: []
+    return js
+
+
+def load_runtime(init_py):
+    sys.modules["js"] = make_js_module()
+    pyodide = types.ModuleType("pyodide")
+    pyodide.ffi = types.ModuleType("pyodide.ffi")
+    pyodide.ffi.to_js = to_js
+    pyodide.code = types.ModuleType("pyodide.code")
+    pyodide.code.find_imports = lambda code: []
+    sys.modules.update({"pyodide": pyodide, "pyodide.ffi": pyodide.ffi, "pyodide.code": pyodide.code})
+    # init.py writes turtle.py into the working directory
+    os.chdir(tempfile.mkdtemp(prefix="init-bench-"))
+    sys.path.insert(0, os.getcwd())
+    runtime = {"__name__": "init"}
+    with open(init_py) as file:
+        source = file.read()
+    stdout = sys.stdout
+    exec(compile(source, init_py, "exec"), runtime)
+    sys.stdout = stdout
+    exec("import turtle", runtime)  # as the worker does before capturing the baseline
+    if "capture_baseline" in runtime:  # older init.py didn't reset runs
+        runtime["capture_baseline"]()
+    return runtime
+
+# benchmarks: each returns (value, unit, higher_is_better)
+
+
+def best_time(function, repeat):
+    # fastest of several runs after a warm-up, with the run reset in between
+    # as in the worker
+    times = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        if "reset_run" in runtime:
+            runtime["reset_run"]()
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    return min(times[1:])
+
+
+def bench_pyexec_plain(repeat):
+    code = "n = int(input())\nfor i in range(n):\n    print(i * i)\n"
+    runs = 200
+    seconds = best_time(lambda: [runtime["pyexec"](code, ["20"], "0\n1\n4\n9\n16\n.*") for _ in range(runs)], repeat)
+    return runs / seconds, "runs/s", True
+
+
+def bench_pyexec_advanced(repeat):
+    code = "name = input()\nfor i in range(int(input())):\n    print(f'Hello, {name}! Line {i}.')\n"
+    out = [JsProxy(pattern="hello,? alice", ignore="wcp", count=30),
+           JsProxy(pattern=r"Line \d+\.", count=30),
+           JsProxy(typ="-", pattern="Goodbye"),
+           JsProxy(typ="c+", pattern=r"int\(input\(", ignore="w"),
+           JsProxy(pattern="Hello.*Line 29")]
+    runs = 100
+    seconds = best_time(lambda: [runtime["pyexec"](code, ["Alice", "30"], out) for _ in range(runs)], repeat)
+    return runs / seconds, "runs/s", True
+
+
+def bench_pydebug_instrumentation(repeat):
+    # a long program that does little, so instrumenting dominates
+    lines = []
+    for i in range(400):
+        lines += [f"if x{i % 7} > {i}:", f"    y = {i}", "else:", f"    y = -{i}", f"x{i % 7} = y"]
+    code = "\n".join(f"x{i} = 0" for i in range(7)) + "\n" + "\n".join(lines) + "\n"
+    seconds = best_time(lambda: runtime["pydebug"](code, []), repeat)
+    return seconds * 1000, "ms", False
+
+
+def bench_pydebug_per_line(repeat):
+    iterations = 20000
+    code = f"total = 0\nfor i in range({iterations}):\n    total += i\n    if i % 3 == 0:\n        total -= 1\n"
+    executed_lines = iterations * 3  # for, +=, if (and its test)
+    plain = best_time(lambda: exec(code, {}), repeat)
+    debug = best_time(lambda: runtime["pydebug"](code, []), repeat)
+    return (debug - plain) / executed_lines * 1e9, "ns/line", False
+
+
+def bench_breakpoint_snapshot(repeat):
+    # a breakpoint hit with many and large variables in scope
+    scope = {f"value{i}": i for i in range(500)}
+    scope.update(numbers=list(range(5000)), names={str(i): "x" * 20 for i in range(500)}, text="y" * 10000)
+    hits = 50
+
+    def hit():
+        for _ in range(hits):
+            runtime["active_breakpoints"].clear()
+            runtime["active_breakpoints"].add(1)
+            runtime["hit_breakpoint"](1, scope, dict(scope))
+    seconds = best_time(hit, repeat)
+    return seconds / hits * 1000, "ms/hit", False
+
+
+def bench_debug_context(repeat):
+    commands = 5000
+    context = runtime["debug_context"]
+
+    def draw():
+        context.reset()
+        context.double_buffering = False
+        for i in range(commands):
+            context.fillStyle = "red" if i % 2 else "blue"
+            context.fillRect(i % 500, i % 400, 10, 10)
+    seconds = best_time(draw, repeat)
+    return commands * 2 / seconds, "commands/s", True
+
+
+def bench_debug_context_buffered(repeat):
+    commands = 5000
+    context = runtime["debug_context"]
+
+    def draw():
+        context.reset()
+        context.double_buffering = True
+        for i in range(commands):
+            context.fillStyle = "red" if i % 2 else "blue"
+            context.fillRect(i % 500, i % 400, 10, 10)
+            if i % 100 == 99:
+                context.present()
+    seconds = best_time(draw, repeat)
+    return commands * 2 / seconds, "commands/s", True
+
+
+def bench_turtle(repeat):
+    import turtle
+    commands = 2000
+
+    def draw():
+        for i in range(commands // 2):
+            turtle.forward(i % 50)
+            turtle.left(91)
+    seconds = best_time(draw, repeat)
+    return commands / seconds, "commands/s", True
+
+
+BENCHMARKS = {
+    "pyexec_plain": bench_pyexec_plain,
+    "pyexec_advanced": bench_pyexec_advanced,
+    "pydebug_instrumentation": bench_pydebug_instrumentation,
+    "pydebug_per_line": bench_pydebug_per_line,
+    "breakpoint_snapshot": bench_breakpoint_snapshot,
+    "debug_context": bench_debug_context,
+    "debug_context_buffered": bench_debug_context_buffered,
+    "turtle": bench_turtle,
+}
+
+
+def serve(init_py):
+    # in a process of its own: run the benchmarks the parent names on stdin, one
+    # round each, and answer on stdout
+    global runtime
+    runtime = load_runtime(init_py)
+    for line in sys.stdin:
+        name = line.strip()
+        try:
+            value, unit, higher_is_better = BENCHMARKS[name](1)
+            result = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        except Exception as e:  # e.g. an older init.py without what the benchmark uses
+            result = {"error": f"{type(e).__name__}: {e}"}
+        sys.__stdout__.write(RESULT_PREFIX + json.dumps(result) + "\n")
+        sys.__stdout__.flush()
+
+
+class Runner:
+    # a serving process for one init.py
+    def __init__(self, init_py):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", init_py],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    def measure(self, name):
+        self.process.stdin.write(name + "\n")
+        self.process.stdin.flush()
+        for line in self.process.stdout:
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):])
+        raise RuntimeError(f"benchmark process ended during {name}")
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def better(result, best):
+    # the faster of two rounds
+    if best is None or "error" in best:
+        return result
+    if "error" in result:
+        return best
+    if result["higher_is_better"]:
+        return result if result["value"] > best["value"] else best
+    return result if result["value"] < best["value"] else best
+
+
+def baseline_source(revision, directory):
+    # init.py as it is in the revision
+    source = subprocess.run(["git", "show", f"{revision}:{INIT_PY_PATH}"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    path = os.path.join(directory, "init.py")
+    with open(path, "w") as file:
+        file.write(source)
+    return path
+
+
+def compare(results, baseline):
+    print(f"{'benchmark':<26}{'result':>16}{'baseline':>16}{'change':>10}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        if "error" in result:
+            print(f"{name:<26}  {result['error']}")
+            continue
+        line = f"{name:<26}{result['value']:>12.4g} {result['unit']:<3}"
+        if "error" in base:
+            line += f"{'n/a':>16}"
+        elif base["unit"] == result["unit"] and base["value"]:
+            ratio = result["value"] / base["value"]
+            faster = ratio if result["higher_is_better"] else 1 / ratio
+            line += f"{base['value']:>16.4g}{(faster - 1) * 100:>+9.1f}%"
+        print(line)
+    print("change: positive is faster")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark; the fastest counts")
+    parser.add_argument("--output", default=RESULTS, help="where to write the results")
+    parser.add_argument("--against", default="HEAD", help="git revision whose init.py is the baseline")
+    parser.add_argument("--serve", metavar="INIT_PY", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+    args.output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory(prefix="init-bench-") as directory:
+        runners = {"baseline": Runner(baseline_source(args.against, directory)),
+                   "results": Runner(os.path.join(ROOT, INIT_PY_PATH))}
+        best = {key: {} for key in runners}
+        try:
+            for name in args.names or BENCHMARKS:
+                if name not in BENCHMARKS:
+                    parser.error(f"unknown benchmark {name}")
+                for round in range(args.repeat):
+                    # who goes first alternates, so a trend in the load cancels out
+                    for key in sorted(runners, reverse=round % 2 == 1):
+                        best[key][name] = better(runners[key].measure(name), best[key].get(name))
+        finally:
+            for runner in runners.values():
+                runner.close()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "against": args.against,
+        **best,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    compare(best["results"], best["baseline"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+from sys import stdctx
+
+stdctx.fillStyle = "lightgrey"
+stdctx.fillRect(0, 0, 500, 400)
+
+# relative to the page
+stdctx.drawImage("logo192.png", 20, 100, 192, 192)
+
+# from another site
+stdctx.drawImage("https://www.python.org/static/img/python-logo.png", 240, 160, 240, 70)
@@ -1,10 +1,38 @@
-addEventListener('install', () => {
+// the page registers pysw.js?v=<release>; caches of other releases are purged
+// when this one activates
+const VERSION = new URL(location.href).searchParams.get('v') || 'dev'
+const STATIC_CACHE = `ps-static-${VERSION}`
+const PRECACHE = ['/static/js/init.py']
+
+addEventListener('install', (e) => {
   self.skipWaiting()
+  e.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then((cache) => cache.addAll(PRECACHE))
+      .catch((err) => console.log('Error precaching', err))
+  )
 })
-addEventListener('activate', () => {
-  self.clients.claim()
+addEventListener('activate', (e) => {
+  e.waitUntil(purgeOldCaches().then(() => self.clients.claim()))
 })
 
+async function purgeOldCaches() {
+  for (const name of await caches.keys()) {
+    if (name.startsWith('ps-static-') && name !== STATIC_CACHE) {
+      await caches.delete(name)
+    }
+  }
+}
+
+// hits and misses per cache since the service worker started, see
+// serviceWorkerCacheStats.ts
+const cacheStats = {}
+
+function count(cache, outcome) {
+  const stats = cacheStats[cache] ?? (cacheStats[cache] = {})
+  stats[outcome] = (stats[outcome] ?? 0) + 1
+}
+
 let inputPromiseResolve = null
 let debugPromiseResolve = null
 let sleepPromiseResolve = null
@@ -58,7 +86,18 @@ addEventListener('message', (event) => {
       // We can hit this point if TS received ps-input-req and responded with ps-input resp
       // before Python called synchronise
       // unlikely, but can happen with fixed inputs
-      inputLookahead = data  
+      // If several responses pile up, queue all their lines into a single response
+      if (inputLookahead === null) {
+        inputLookahead = data
+      } else {
+        inputLookahead = {
+          ...data,
+          lines: (inputLookahead.lines ?? [inputLookahead.data]).concat(data.lines ?? [data.data]),
+          data: inputLookahead.data,
+          breakpoints: data.breakpoints ?? inputLookahead.breakpoints,
+          watches: data.watches ?? inputLookahead.watches,
+        }
+      }
     }
   } else if (data.cmd === 'ps-debug-continue') {
     
@@ -67,6 +106,8 @@ addEventListener('message', (event) => {
     if (local) {
       local(new Response(JSON.stringify(data), { status: 200 }))
     }
+  } else if (data.cmd === 'ps-cache-stats') {
+    event.ports[0]?.postMessage({ cmd: 'ps-cache-stats', stats: cacheStats })
   }
 });
 
@@ -120,6 +161,14 @@ addEventListener('fetch', e => {
     }))
     const t = new URLSearchParams(u.search).get('time')
     sleepTimeout = setTimeout(sleepPromiseResolve, t * 1000, new Response(null, { status: 304 }))
+  } else if (u.pathname.startsWith('/@lazy@/')) {
+    e.respondWith(serveLazyFile(e.request))
+  } else if (e.request.method === 'GET' && PYODIDE_PATH.test(u.pathname)) {
+    e.respondWith(servePyodideFile(e, u.pathname.match(PYODIDE_PATH)[1]))
+  } else if (e.request.method === 'GET' && u.origin === location.origin && PRECACHE.includes(u.pathname)) {
+    e.respondWith(servePrecached(e.request))
+  } else if (isBookContent(e.request, u)) {
+    e.respondWith(serveBookContent(e))
   } else if (e.request.cache === 'only-if-cached' && e.request.mode !== 'same-origin') {
 
   } else if (e.request.url.includes('bk=') || e.request.url.includes('book=') || (e.request.url.includes('coop=1')) || e.request.url.includes('pyworker') || u.pathname?.startsWith("/static")) {
@@ -148,3 +197,200 @@ addEventListener('fetch', e => {
 	  )
   }
 })
+
+// Pyodide and its packages (CDN or standalone mirror) never change within a
+// release, so they are served cache first from a cache named after the release.
+// Second and later loads then work offline
+const PYODIDE_PATH = /\/pyodide\/(v[\d.]+)\/full\//
+// fetched in parallel as soon as pyodide.js is, rather than one after the other
+// as loadPyodide asks for them
+const PYODIDE_CORE = ['pyodide.asm.js', 'pyodide.asm.wasm', 'python_stdlib.zip', 'pyodide-lock.json']
+// downloads in progress by URL, so warming and the worker's own requests share them
+const inFlight = new Map()
+let purgedPyodideVersion = null
+
+async function servePyodideFile(event, version) {
+  const cache = await caches.open(`ps-pyodide-${version}`)
+  const cached = await cache.match(event.request)
+  if (cached) {
+    count('pyodide', 'hit')
+    return cached
+  }
+  count('pyodide', 'miss')
+  if (event.request.url.endsWith('/pyodide.js')) {
+    const base = event.request.url.slice(0, -'pyodide.js'.length)
+    event.waitUntil(warmPyodide(cache, base, version))
+  }
+  return fetchIntoCache(cache, event.request)
+}
+
+function fetchIntoCache(cache, request) {
+  const url = typeof request === 'string' ? request : request.url
+  let pending = inFlight.get(url)
+  if (!pending) {
+    // shared until the response is stored, after that the cache answers
+    const done = () => inFlight.delete(url)
+    pending = fetch(request).then((response) => {
+      if (response.ok && response.type !== 'opaque') {
+        cache.put(url, response.clone()).then(done, done)
+      } else {
+        done()
+      }
+      return response
+    }, (err) => {
+      done()
+      throw err
+    })
+    inFlight.set(url, pending)
+  }
+  return pending.then((response) => response.clone())
+}
+
+async function warmPyodide(cache, base, version) {
+  if (purgedPyodideVersion !== version) {
+    // Pyodide and its memory snapshots of other versions are no use any more
+    purgedPyodideVersion = version
+    for (const name of await caches.keys()) {
+      if (name.startsWith('ps-pyodide-') && name !== `ps-pyodide-${version}` && name !== `ps-pyodide-snapshot-${version}`) {
+        await caches.delete(name)
+      }
+    }
+  }
+  await Promise.all(PYODIDE_CORE.map(async (file) => {
+    if (!(await cache.match(base + file))) {
+      await fetchIntoCache(cache, base + file).catch((err) => console.log('Error precaching', file, err))
+    }
+  }))
+}
+
+// init.py, precached on install. It has to match the pyworker.js the page
+// loads, and a deploy doesn't always change ?v=, so the cached copy is checked
+// with the server (ETag) on every load and served alone only when offline
+async function servePrecached(request) {
+  const cache = await caches.open(STATIC_CACHE)
+  const cached = await cache.match(request.url)
+  try {
+    return await revalidate(cache, request, cached, 'static')
+  } catch (err) {
+    if (cached) {
+      count('static', 'hit')
+      return cached
+    }
+    throw err
+  }
+}
+
+// Book content (book.json, guides, code and data files) the page fetches from
+// its own origin is served stale-while-revalidate: from the cache straight
+// away, then checked against the server with its ETag for the next load.
+// Pages in edit mode (?edit=...) get it checked before it is served, so
+// authors see their changes at once. Requests with credentials are left alone
+const CONTENT_CACHE = 'ps-book-content'
+const CONTENT_PATH = /\.(json|md|py|txt|csv)$/i
+const MAX_CONTENT_ENTRIES = 1000
+
+function isBookContent(request, u) {
+  return request.method === 'GET' &&
+    request.destination === '' &&
+    u.origin === location.origin &&
+    CONTENT_PATH.test(u.pathname) &&
+    !u.pathname.startsWith('/static/') &&
+    !request.headers.has('Authorization')
+}
+
+async function serveBookContent(event) {
+  const request = event.request
+  const cache = await caches.open(CONTENT_CACHE)
+  const cached = await cache.match(request)
+  if (cached && isEditingSession(request)) {
+    return revalidate(cache, request, cached, 'content').catch(() => cached)
+  }
+  if (cached) {
+    count('content', 'hit')
+    event.waitUntil(revalidate(cache, request, cached, 'content').catch(() => {}))
+    return cached
+  }
+  count('content', 'miss')
+  const response = await fetch(request)
+  if (response.ok) {
+    event.waitUntil(cache.put(request, response.clone()).then(() => trimCache(cache, MAX_CONTENT_ENTRIES)))
+  }
+  return response
+}
+
+function isEditingSession(request) {
+  try {
+    return new URL(request.referrer).searchParams.has('edit')
+  } catch (err) {
+    return false // no referrer
+  }
+}
+
+// the up-to-date response, from the server or the cached copy if the server
+// says it is unchanged (or fails); rejects when the server can't be reached
+async function revalidate(cache, request, cached, stats) {
+  const headers = new Headers(request.headers)
+  const etag = cached?.headers.get('ETag')
+  if (etag) {
+    headers.set('If-None-Match', etag)
+  }
+  const response = await fetch(request.url, { headers, credentials: request.credentials })
+  if (response.status === 304 && cached) {
+    count(stats, 'unchanged')
+    return cached
+  } else if (response.ok) {
+    count(stats, 'updated')
+    await cache.put(request.url, response.clone())
+    return response
+  } else if (response.status === 404) {
+    await cache.delete(request.url)
+    return response
+  }
+  return cached || response
+}
+
+// keys come back oldest first
+async function trimCache(cache, maxEntries) {
+  const keys = await cache.keys()
+  for (const request of keys.slice(0, Math.max(0, keys.length - maxEntries))) {
+    await cache.delete(request)
+  }
+}
+
+// large data files are put into this cache by the page (LazyFileStore.ts) and
+// read by Python in blocks, using HEAD + Range requests
+const LAZY_CACHE = 'ps-lazy-files'
+
+async function serveLazyFile(request) {
+  const cache = await caches.open(LAZY_CACHE)
+  const cached = await cache.match(request.url)
+  if (!cached) {
+    return new Response(null, { status: 404 })
+  }
+  const blob = await cached.blob()
+  const headers = {
+    'Accept-Ranges': 'bytes',
+    'Content-Length': `${blob.size}`,
+    'Cache-Control': 'no-store'
+  }
+  if (request.method === 'HEAD') {
+    return new Response(null, { status: 200, headers })
+  }
+  const range = /bytes=(\d+)-(\d*)/.exec(request.headers.get('Range') || '')
+  if (!range) {
+    return new Response(blob, { status: 200, headers })
+  }
+  const start = Number(range[1])
+  const end = Math.min(range[2] ? Number(range[2]) : blob.size - 1, blob.size - 1)
+  if (start > end) {
+    return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } })
+  }
+  return new Response(blob.slice(start, end + 1), {
+    status: 206,
+    headers: {
+      ...headers,
+      'Content-Length': `${end - start + 1}`,
+      'Content-Range': `bytes ${start}-${end}/${blob.size}`
+    }
+  })
+}
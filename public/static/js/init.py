@@ -4,19 +4,37 @@ import ast
 import traceback
 import copy
 import time
+import datetime
 import os
 import json
 import re
+import bisect
+import random
+import signal
+import array
+import importlib.util
+import gc
+import sysconfig
+import builtins
+import io
 from collections import deque
 from pyodide.ffi import to_js
+from pyodide.code import find_imports
 
 print(sys.version)
 
+_monotonic = time.monotonic  # keep a reference; user code may patch the time module
+
 
 class NotEnoughInputsError(Exception):
     pass
 
 
+class MemoryLimitExceeded(BaseException):
+    # not an Exception, so the program's own error handling doesn't catch it
+    pass
+
+
 class DebugAudio:
     def load(self, source):
         json_map = {"action": "load", "source": source}
@@ -51,11 +69,28 @@ class DebugContext:
         # when double buffering is enabled, draw calls are batched
         # and only committed when calling present()
         self.__double_buffering = False
+        # while capturing (tests), committed commands are kept here instead of posted
+        self.__capture = None
 
     def _present(self):
-        post_message({"cmd": "draw", "msg": json.dumps(self.__commands)})
+        if self.__capture is not None:
+            self.__capture.extend(self.__commands)
+        else:
+            # to the canvas worker if the page has one, else through the page
+            start = _monotonic()
+            msg = json.dumps(self.__commands)
+            js.workerDraw(msg)
+            bridge_stats.record("post:draw", len(msg), start)
         self.__commands = []
 
+    def start_capture(self):
+        self.__capture = []
+
+    def end_capture(self):
+        commands = self.__capture or []
+        self.__capture = None
+        return commands
+
     def _add_command(self, cmd):
         self.__commands.append(cmd)
         if not self.__double_buffering:
@@ -63,6 +98,8 @@ class DebugContext:
 
     def present(self):
         self._present()
+        if self.__capture is not None:
+            self.__capture.append({"action": "present"})  # frame boundary
         # public call of this endpoint implies double buffering
         self.__double_buffering = True
 
@@ -174,7 +211,36 @@ class DebugContext:
         self._add_command(json_map)
 
     def check_key(self, key_code):
-        return js.workerCheckKeyDown(key_code)
+        start = _monotonic()
+        pressed = js.workerCheckKeyDown(key_code)
+        bridge_stats.record("keys", 1, start)
+        return pressed
+
+    # event types as laid out by EventQueue.ts
+    _EVENT_TYPES = {1: "keydown", 2: "keyup", 3: "mousedown", 4: "mouseup", 5: "mousemove"}
+
+    # every key and mouse event since the last call, oldest first, in a single JS call
+    def poll_events(self):
+        start = _monotonic()
+        raw = array.array("i", js.workerPollEvents().to_bytes())
+        bridge_stats.record("events", raw.itemsize * len(raw), start)
+        events = []
+        for i in range(0, len(raw), 4):
+            typ = self._EVENT_TYPES.get(raw[i])
+            if typ is None:
+                continue
+            if raw[i] <= 2:
+                events.append({"type": typ, "key": raw[i + 1]})
+            else:
+                events.append({"type": typ, "x": raw[i + 1], "y": raw[i + 2], "button": raw[i + 3]})
+        return events
+
+    # snapshot of the whole keyboard: keys_down()[key_code] is 1 while the key is held
+    def keys_down(self):
+        start = _monotonic()
+        keys = js.workerKeysDown().to_bytes()
+        bridge_stats.record("keys", len(keys), start)
+        return keys
 
     @property
     def double_buffering(self):
@@ -346,10 +412,48 @@ class DebugContext:
 
 
 class DebugOutput:
+    # coalesce writes into as few print messages as possible. The buffer is flushed when
+    # it holds too many lines or bytes, when a time slice has passed since the last flush,
+    # before anything that blocks (input, sleep, breakpoint, turtle) and at program end.
+    # The time slice is also enforced by the worker's signal check (see
+    # output_flush_handler), so output shows up even if nothing more is written
+    MAX_LINES = 100
+    MAX_BYTES = 8192
+    TIME_SLICE = 0.016
+
+    def __init__(self):
+        self._parts = []
+        self._lines = 0
+        self._bytes = 0
+        self._last_flush = _monotonic()
+
     def write(self, text):
-        post_message({"cmd": "print", "msg": text})
+        was_empty = not self._parts
+        self._parts.append(text)
+        self._lines += text.count("\n")
+        self._bytes += len(text)
+        if self._lines >= self.MAX_LINES or self._bytes >= self.MAX_BYTES:
+            self.flush()
+        else:
+            self.tick()
+            if was_empty and self._parts and OUTPUT_FLUSH_SIGNAL:
+                remaining = self.TIME_SLICE - (_monotonic() - self._last_flush)
+                js.workerArmOutputFlush(max(remaining, 0) * 1000)
+
+    def tick(self):
+        # flush if the time slice has run out; cheap enough to call on every line
+        if self._parts and _monotonic() - self._last_flush >= self.TIME_SLICE:
+            self.flush()
+
     def flush(self):
-        pass
+        # taken first: the flush signal may interrupt this flush
+        parts, self._parts = self._parts, []
+        if not parts:
+            return  # the next write goes out straight away
+        self._last_flush = _monotonic()
+        self._lines = 0
+        self._bytes = 0
+        post_message({"cmd": "print", "msg": "".join(parts)})
 
 
 class TestOutput:
@@ -366,7 +470,76 @@ class TestOutput:
         pass
 
 
+class BridgeStats:
+    # crossings between Python and the page during a run, per kind: how many,
+    # roughly how many bytes, and a histogram of how long they took. Kinds are
+    # post:<cmd> for messages, sync:<route> for blocking requests, keys, events
+    # and console
+    BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500)  # ms; the last bucket is everything above
+
+    def __init__(self):
+        self.kinds = {}
+        self.last = {}  # of the previous run
+
+    def record(self, kind, size, start):
+        elapsed = (_monotonic() - start) * 1000
+        entry = self.kinds.get(kind)
+        if entry is None:
+            entry = self.kinds[kind] = [0, 0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+        entry[0] += 1
+        entry[1] += size
+        entry[2] += elapsed
+        entry[3][bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+
+    def end_run(self):
+        self.last, self.kinds = self.kinds, {}
+
+    def report(self):
+        return {"buckets": list(self.BUCKETS),
+                "kinds": {kind: {"count": count, "bytes": size, "time": elapsed, "histogram": histogram}
+                          for kind, (count, size, elapsed, histogram) in self.last.items()}}
+
+
+def message_size(value):
+    # rough size of what is cloned to the page: the characters of its strings
+    if type(value) is str:
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + message_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(message_size(item) for item in value)
+    return 8
+
+
+def console_log(*args):
+    start = _monotonic()
+    js.console.log(*args)
+    bridge_stats.record("console", sum(len(str(arg)) for arg in args), start)
+
+
+def bridge_report():
+    # crossings of the last finished run, for the developer overlay
+    return to_js(bridge_stats.report(), dict_converter=js.Object.fromEntries)
+
+
+bridge_stats = BridgeStats()
+sys.bridge_stats = bridge_stats  # for the turtle module
 debug_output = DebugOutput()
+
+
+# output flush: the worker raises SIGALRM from its periodic signal check once the
+# time slice of buffered output has run out, e.g. during a long computation
+
+
+def output_flush_handler(signum, frame):
+    debug_output.flush()
+
+
+try:
+    signal.signal(signal.SIGALRM, output_flush_handler)
+    OUTPUT_FLUSH_SIGNAL = int(signal.SIGALRM)
+except (AttributeError, ValueError, OSError):
+    OUTPUT_FLUSH_SIGNAL = 0  # output waits for the next write or blocking call
 debug_context = DebugContext()
 debug_audio = DebugAudio()
 test_output = TestOutput()
@@ -380,25 +553,34 @@ in_watch = False  # in a watch expression; if so, ignore breakpoints
 last_seen_lineno = -1
 last_seen_breakpoint_id = None
 test_inputs = []
+# lines already delivered by the page but not yet consumed by input()
+pending_inputs = deque()
 
 # setup turtle library
+# the source is kept, so turtle.py can be written again into the fresh file
+# system of a worker that booted from a memory snapshot
 
-with open("turtle.py", "w") as file:
-    file.write('''
+TURTLE_SOURCE = '''
 import js
+import sys
+import time
 import struct
 from pyodide.ffi import to_js
 import json as J
-import inspect
 _A = "action"
 _V = "value"
 _idc = 0
 _col_mode = 255
+_stats = sys.bridge_stats
+_clock = time.monotonic
 def synchronise():
+    sys.stdout.flush()
+    start = _clock()
     x = js.XMLHttpRequest.new()
     x.open('get', '/@turtle@/req.js', False)
     x.setRequestHeader('cache-control', 'no-cache, no-store, max-age=0')
     x.send()
+    _stats.record("sync:turtle", len(x.response or ""), start)
     if x.status != 200:
         try:
             error = J.loads(x.response).get("data", {}).get("error", "unknown turtle error")
@@ -407,7 +589,10 @@ def synchronise():
         raise Exception("Turtle command failed: " + error)
     return x.response
 def post_message(data):
+    sys.stdout.flush()  # output printed before a turtle command comes first
+    start = _clock()
     js.workerPostMessage(to_js(data, dict_converter=js.Object.fromEntries))
+    _stats.record("post:turtle", len(data.get("msg", "")), start)
 def mode(mode_type):
     msg = {_A:"mode", _V:mode_type}
     post_message({"cmd": "turtle", "msg": J.dumps(msg)})
@@ -482,14 +667,53 @@ class Turtle:
     def end_fill(self):self.send({_A:"end_fill"})
     def fillcolor(self, color, color2=-1, color3=-1): self.__send_col(color, color2, color3, "fillcolor")
 _t0 = Turtle()
-for m in [m for m in dir(_t0) if not m.startswith("_")]:  # reflection magic to expose default turtle
-  args = str(inspect.signature(eval(f"Turtle.{m}")))
-  args = args.replace("self, ", "").replace("self", "")
-  exec(f"def {m}{args}: _t0.{m}{args}")
-''')
-
-
-def pyexec(code, expected_input, expected_output, reveal_expected=True):
+# module level functions drive the default turtle (generated from Turtle's public methods)
+def back(dist): _t0.back(dist)
+def backward(dist): _t0.backward(dist)
+def begin_fill(): _t0.begin_fill()
+def bk(dist): _t0.bk(dist)
+def circle(radius, extent=360): _t0.circle(radius, extent)
+def color(color, color2=-1, color3=-1): _t0.color(color, color2, color3)
+def down(): _t0.down()
+def end_fill(): _t0.end_fill()
+def fd(dist): _t0.fd(dist)
+def fillcolor(color, color2=-1, color3=-1): _t0.fillcolor(color, color2, color3)
+def forward(dist): _t0.forward(dist)
+def goto(x, y): _t0.goto(x, y)
+def hideturtle(): _t0.hideturtle()
+def home(): _t0.home()
+def left(angle): _t0.left(angle)
+def lt(angle): _t0.lt(angle)
+def pd(): _t0.pd()
+def pencolor(color, color2=-1, color3=-1): _t0.pencolor(color, color2, color3)
+def pendown(): _t0.pendown()
+def pensize(size): _t0.pensize(size)
+def penup(): _t0.penup()
+def pu(): _t0.pu()
+def reset(): _t0.reset()
+def right(angle): _t0.right(angle)
+def rt(angle): _t0.rt(angle)
+def send(msg=None): _t0.send(msg)
+def setheading(angle): _t0.setheading(angle)
+def setpos(x, y): _t0.setpos(x, y)
+def setposition(x, y): _t0.setposition(x, y)
+def showturtle(): _t0.showturtle()
+def speed(speed_value): _t0.speed(speed_value)
+def up(): _t0.up()
+def width(size): _t0.width(size)
+'''
+
+
+def write_runtime_files():
+    with open("turtle.py", "w") as file:
+        file.write(TURTLE_SOURCE)
+
+
+write_runtime_files()
+
+
+def pyexec(code, expected_input, expected_output, reveal_expected=True, use_virtual_clock=False,
+           virtual_clock_start=None):
     global test_inputs
     sys.stdout = test_output
     sys.stderr = test_output
@@ -499,6 +723,10 @@ def pyexec(code, expected_input, expected_output, reveal_expected=True):
     sys.stdaud = debug_audio
     time.sleep = test_sleep
     os.system = test_shell
+    if use_virtual_clock:
+        virtual_clock.install(virtual_clock_start)
+    else:
+        virtual_clock.uninstall()
     code = code.replace("import turtle", "import turtle;turtle.mode('standard')")
     input = test_input
 
@@ -516,16 +744,25 @@ def pyexec(code, expected_input, expected_output, reveal_expected=True):
     # run test
     test_output.clear()
     parsed_stmts = ast.parse(code)
+    compiled = compile(parsed_stmts, filename="YourPythonCode.py", mode="exec")
+    # a test case of only generated criteria has no inputs of its own
+    only_generated = not isinstance(expected_output, str) and len(expected_output) > 0 and all(
+        requirement.as_object_map().get("typ") == "g" for requirement in expected_output)
+    debug_context.start_capture()  # drawings are graded, not shown
     try:
         global_vars = {'hit_breakpoint': hit_breakpoint,
                        'traceback': traceback, 'input': test_input}
-        exec(compile(parsed_stmts, filename="YourPythonCode.py",
-             mode="exec"), global_vars)
+        if not only_generated:
+            exec(compiled, global_vars)
     except NotEnoughInputsError:
         return js.Object.fromEntries(to_js({"err": "You've requested too many inputs", "ins": expected_input}))
+    except MemoryLimitExceeded as e:
+        return js.Object.fromEntries(to_js({"outcome": False, "err": "Memory limit exceeded", "peak": e.args[0], "ins": expected_input}))
     except Exception as e:
-        js.console.log("error executing code", str(e))
+        console_log("error executing code", str(e))
         return js.Object.fromEntries(to_js({"err": "Runtime error", "ins": expected_input}))
+    finally:
+        canvas_commands = debug_context.end_capture()
 
     if len(test_inputs) == 1 and test_inputs[0] == '':
         test_inputs = []  # if we have one last blank input stuck in the queue, just ignore it
@@ -538,9 +775,7 @@ def pyexec(code, expected_input, expected_output, reveal_expected=True):
 
     if isinstance(expected_output, str):
         # Simple case: just a string. We respect \n and .* as special characters and ignore \n* at the end
-        expected_output = re.escape(expected_output).replace(
-            "\\\n", r"\n").replace("\.\*", ".*") + r"\n*$"
-        if not re.match(expected_output, test_output.buffer):
+        if not match_expected_output(expected_output, test_output.buffer):
             if reveal_expected:
                 return js.Object.fromEntries(to_js({"outcome": False, "err": "Incorrect output", "expected": str(original_expected_output), "actual": str(test_output.buffer), "ins": expected_input}))
             else:
@@ -602,15 +837,50 @@ def pyexec(code, expected_input, expected_output, reveal_expected=True):
                             exp = json.loads(screen_dump_soln).get('data') or None if reveal_expected and screen_dump_soln else None
                             act = json.loads(screen_dump_user).get('data') or None if reveal_expected and screen_dump_user else None
                         except Exception as e:
-                            js.console.log("error fetching Turtle data", str(e))
+                            console_log("error fetching Turtle data", str(e))
                             exp = None
                             act = None
                         return js.Object.fromEntries(to_js({"outcome": False, "err": "Incorrect turtle output", "ins": expected_input, "expected": exp, "actual": act}))
                     else:
                         return js.Object.fromEntries(to_js({"outcome": True, "ins": expected_input}))
                 except Exception as e:
-                    js.console.log("error", str(e))
+                    console_log("error", str(e))
                     return js.Object.fromEntries(to_js({"outcome": False, "err": "Error evaluating turtle canvas test-case", "ins": expected_input}))
+            elif typ[0] == "d":
+                # compare what was drawn on sys.stdctx with the solution's drawing
+                if "filename" not in requirement:
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Missing canvas solution filename in test case", "ins": expected_input}))
+                try:
+                    # the filename has been replaced with the soln code
+                    expected_canvas = solution_canvas(requirement.get("filename"), test_input_copy)
+                except Exception as e:
+                    console_log("error", str(e))
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Error evaluating canvas test-case", "ins": expected_input}))
+                criteria_outcomes.append(compare_canvas(
+                    canonical_canvas(canvas_commands), expected_canvas,
+                    float(requirement.get("tolerance", 0.01)), requirement.get("ordered", True)))
+                continue
+            elif typ[0] == "g":
+                # run on generated inputs and compare the output with the solution's
+                if "filename" not in requirement:
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Missing solution filename in test case", "ins": expected_input}))
+                try:
+                    # the filename has been replaced with the soln code
+                    failure = differential_test(
+                        compiled, requirement.get("filename"), requirement.get("generator", ""),
+                        int(requirement.get("count", -1)), requirement.get("ignore", ""))
+                except MemoryLimitExceeded as e:
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Memory limit exceeded", "peak": e.args[0], "ins": expected_input}))
+                except Exception as e:
+                    console_log("error", str(e))
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Error evaluating generated test-case", "ins": expected_input}))
+                if failure:
+                    ins, expected, actual = failure
+                    if reveal_expected:
+                        return js.Object.fromEntries(to_js({"outcome": False, "err": "Incorrect output", "expected": expected, "actual": actual, "ins": ins}))
+                    return js.Object.fromEntries(to_js({"outcome": False, "err": "Incorrect output", "expected": "hidden", "actual": "hidden", "ins": "hidden"}))
+                criteria_outcomes.append(True)
+                continue
             else:
                 test_string = test_output.buffer
 
@@ -636,10 +906,13 @@ def pyexec(code, expected_input, expected_output, reveal_expected=True):
                     r";|:|£|%|&|<|>|\\\$|\\\^|\\\(|\\\)|\\\[|\\\]|\\\{|\\\}|\\\.|,|\\\?|\\\*|\\\!|\"|'|\\\/", "", pattern)
 
             # leaving this in to help with pattern debugging when writing books!
-            js.console.log("pattern", pattern)
-            js.console.log("test_string", test_string)
+            console_log("pattern", pattern)
+            console_log("test_string", test_string)
 
-            actual_count = len(re.findall(pattern, test_string, flags))
+            try:
+                actual_count = count_matches(pattern, test_string, flags)
+            except PatternTooExpensive:
+                return js.Object.fromEntries(to_js({"outcome": False, "err": "Pattern too expensive", "ins": expected_input}))
             outcome = True
             if "+" in typ:
                 if actual_count == 0 or ((expected_count != -1) and (expected_count != actual_count)):
@@ -670,6 +943,7 @@ def pydebug(code, breakpoints, watches=[]):
     step_into = False
     last_seen_lineno = -1
     last_seen_breakpoint_id = None
+    pending_inputs.clear()
     sys.stdout = debug_output
     sys.stderr = debug_output
     sys.stdctx = debug_context
@@ -740,7 +1014,10 @@ def pydebug(code, breakpoints, watches=[]):
         breakpoint_map[lineno] = nextbrk
     update_breakpoints(breakpoints)
     update_watches(watches)
-    exec(compile(parsed_stmts, filename="YourPythonCode.py", mode="exec"), global_vars)
+    try:
+        exec(compile(parsed_stmts, filename="YourPythonCode.py", mode="exec"), global_vars)
+    finally:
+        debug_output.flush()
 
 
 def pyrun(code):
@@ -750,6 +1027,7 @@ def pyrun(code):
     code = code.replace(
         "import turtle", "import turtle;turtle.mode('standard')")
 
+    pending_inputs.clear()
     sys.stdout = debug_output
     sys.stderr = debug_output
     sys.stdctx = debug_context
@@ -759,7 +1037,10 @@ def pyrun(code):
     time.sleep = debug_sleep
     os.system = debug_shell
     input = debug_input
-    exec(code, global_vars)
+    try:
+        exec(code, global_vars)
+    finally:
+        debug_output.flush()
 
 
 def update_breakpoints(breakpoints):
@@ -777,15 +1058,21 @@ def update_watches(new_watches):
 
 
 def post_message(data):
+    start = _monotonic()
     js.workerPostMessage(to_js(data, dict_converter=js.Object.fromEntries))
+    bridge_stats.record("post:" + data.get("cmd", ""), message_size(data), start)
 
 
 def synchronise(typ):
+    sys.stdout.flush()  # anything printed so far must be visible while we block
+    start = _monotonic()
     x = js.XMLHttpRequest.new()
     x.open('get', typ, False)
     x.setRequestHeader('cache-control', 'no-cache, no-store, max-age=0')
     x.send()
-    return x.response
+    response = x.response
+    bridge_stats.record("sync:" + typ.split("@")[1], len(response or ""), start)
+    return response
 
 # input functions
 
@@ -794,13 +1081,24 @@ def debug_input(prompt=""):
     if prompt:
         print(prompt, end="")
 
+    if pending_inputs:
+        # typed or pasted ahead; the page only echoed the first line of the batch
+        line = pending_inputs.popleft()
+        print(line)
+        return line
+
+    debug_output.flush()  # the prompt must arrive before the input request
     post_message({"cmd": "input"})
     resp = json.loads(synchronise('/@input@/req.js'))
     if (js.workerInterrupted()):
         raise KeyboardInterrupt()
     update_breakpoints(resp.get("breakpoints"))
     update_watches(resp.get("watches"))
-    return resp.get("data")
+    lines = resp.get("lines")
+    if not lines:
+        return resp.get("data")
+    pending_inputs.extend(lines[1:])
+    return lines[0]
 
 
 def test_input(prompt=""):
@@ -815,6 +1113,7 @@ def test_input(prompt=""):
 
 def debug_shell(cmd):
     if cmd == "cls" or cmd == "clear":
+        debug_output.flush()
         post_message({"cmd": "cls"})
 
 
@@ -825,16 +1124,752 @@ def test_shell():
 
 
 def debug_sleep(time_in_s):
+    debug_output.flush()
     synchronise(f'/@sleep@/sleep.js?time={time_in_s}')
 
 
 def test_sleep(time_in_s):
     pass
 
+# virtual clock for tests (opt-in per book node): sleeping advances the clock
+# instead of waiting, and time queries read it. Every query also moves it on
+# a little, so busy waits for a deadline end too. The clock starts at a fixed
+# epoch (or one the book node pins), so programs that wait, measure time or
+# print dates finish instantly with the same output on every run
+
+
+class _VirtualClassMeta(type):
+    # values made by the real class (e.g. by date arithmetic) still pass
+    # isinstance checks against the virtual one
+    def __instancecheck__(cls, obj):
+        return isinstance(obj, cls.real)
+
+
+class VirtualClock:
+    TICK = 0.001  # seconds each time query advances the clock
+    EPOCH = "2024-01-01T00:00:00+00:00"  # default start of the clock
+    TIME_FUNCTIONS = ("time", "time_ns", "monotonic", "monotonic_ns", "perf_counter", "perf_counter_ns",
+                      "process_time", "process_time_ns", "sleep", "localtime", "gmtime", "ctime", "strftime")
+
+    def __init__(self):
+        self.real = {name: getattr(time, name) for name in self.TIME_FUNCTIONS}
+        self.real_datetime = datetime.datetime
+        self.real_date = datetime.date
+        self.start = 0.0
+        self.now = 0.0
+        self.installed = False
+
+    def epoch(self, start=None):
+        # ISO date (time) to start at; naive values are UTC
+        start = self.real_datetime.fromisoformat(start or self.EPOCH)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=datetime.timezone.utc)
+        return start.timestamp()
+
+    def install(self, start=None):
+        self.start = self.now = self.epoch(start)
+        clock = self
+
+        class VirtualDate(self.real_date, metaclass=_VirtualClassMeta):
+            real = self.real_date
+
+            @classmethod
+            def today(cls):
+                return cls.fromtimestamp(clock.time())
+
+        class VirtualDatetime(self.real_datetime, metaclass=_VirtualClassMeta):
+            real = self.real_datetime
+
+            @classmethod
+            def now(cls, tz=None):
+                return cls.fromtimestamp(clock.time(), tz)
+
+            @classmethod
+            def today(cls):
+                return cls.fromtimestamp(clock.time())
+
+        for name in self.TIME_FUNCTIONS:
+            setattr(time, name, getattr(self, name))
+        datetime.date = VirtualDate
+        datetime.datetime = VirtualDatetime
+        self.installed = True
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        for name, function in self.real.items():
+            if name != "sleep":  # pyexec/pyrun/pydebug set their own
+                setattr(time, name, function)
+        datetime.date = self.real_date
+        datetime.datetime = self.real_datetime
+        self.installed = False
+
+    def time(self):
+        self.now += self.TICK
+        return self.now
+
+    def time_ns(self):
+        return int(self.time() * 1e9)
+
+    def monotonic(self):
+        return self.time() - self.start
+
+    def monotonic_ns(self):
+        return int(self.monotonic() * 1e9)
+
+    perf_counter = process_time = monotonic
+    perf_counter_ns = process_time_ns = monotonic_ns
+
+    def sleep(self, time_in_s):
+        if time_in_s < 0:
+            raise ValueError("sleep length must be non-negative")
+        self.now += time_in_s
+
+    def localtime(self, secs=None):
+        return self.real["localtime"](self.time() if secs is None else secs)
+
+    def gmtime(self, secs=None):
+        return self.real["gmtime"](self.time() if secs is None else secs)
+
+    def ctime(self, secs=None):
+        return self.real["ctime"](self.time() if secs is None else secs)
+
+    def strftime(self, format, t=None):
+        return self.real["strftime"](format, self.localtime() if t is None else t)
+
+
+virtual_clock = VirtualClock()
+
+# imports
+
+
+def missing_imports(code):
+    # top level modules the code imports that can't be found yet
+    try:
+        names = find_imports(code)
+    except SyntaxError:
+        return []
+    return [name for name in names
+            if name not in sys.modules and importlib.util.find_spec(name) is None]
+
+# copy-on-write for lazily loaded data files: they are mounted read-only and
+# replaced by a regular file when first opened for writing
+
+
+_builtin_open = builtins.open
+
+
+def cow_open(file, mode="r", *args, **kwargs):
+    if isinstance(file, (str, bytes, os.PathLike)) and any(c in mode for c in "wa+"):
+        js.workerMaterialiseLazyFile(os.path.abspath(os.fsdecode(file)), "w" not in mode)
+    return _builtin_open(file, mode, *args, **kwargs)
+
+
+builtins.open = io.open = cow_open
+
+# memory limit: the worker raises SIGUSR1 from its periodic signal check when a
+# run grew the Wasm heap beyond its limit. The argument is how much it grew
+
+
+def memory_limit_handler(signum, frame):
+    raise MemoryLimitExceeded(js.workerMemoryPeak())
+
+
+try:
+    signal.signal(signal.SIGUSR1, memory_limit_handler)
+    MEMORY_LIMIT_SIGNAL = int(signal.SIGUSR1)
+except (AttributeError, ValueError, OSError):
+    MEMORY_LIMIT_SIGNAL = 0  # runs can't be limited
+
+# run reset: user code leaves its own modules, monkey patches and garbage
+# behind. After each run the interpreter goes back to the baseline captured
+# once initialisation is done
+
+
+_LIBRARY_PATHS = tuple(sysconfig.get_paths()[k] for k in ("stdlib", "platstdlib", "purelib", "platlib"))
+_RESTORED_MODULES = ("builtins", "sys", "os", "io", "time")
+_baseline = None
+
+
+def capture_baseline():
+    global _baseline
+    _baseline = {
+        "modules": dict(sys.modules),
+        "attrs": {name: dict(vars(sys.modules[name])) for name in _RESTORED_MODULES},
+        "path": list(sys.path),
+        "recursion_limit": sys.getrecursionlimit(),
+    }
+
+
+def _is_library_module(module):
+    # stdlib and installed packages stay imported; they are expensive to load again
+    origin = getattr(getattr(module, "__spec__", None), "origin", None) or getattr(module, "__file__", None)
+    if origin in ("built-in", "frozen"):
+        return True
+    return isinstance(origin, str) and os.path.abspath(origin).startswith(_LIBRARY_PATHS)
+
+
+def reset_run():
+    global test_inputs
+    virtual_clock.uninstall()
+    if _baseline is not None:
+        modules = _baseline["modules"]
+        for name in [n for n in sys.modules if n not in modules]:
+            if not _is_library_module(sys.modules[name]):
+                del sys.modules[name]
+        for name, module in modules.items():
+            if sys.modules.get(name) is not module:
+                sys.modules[name] = module
+        for name, attrs in _baseline["attrs"].items():
+            namespace = vars(sys.modules[name])
+            for key in [k for k in namespace if k not in attrs]:
+                del namespace[key]
+            for key, value in attrs.items():
+                if namespace.get(key) is not value:
+                    namespace[key] = value
+        sys.path[:] = _baseline["path"]
+        sys.setrecursionlimit(_baseline["recursion_limit"])
+    test_inputs = []
+    pending_inputs.clear()
+    test_output.clear()
+    bridge_stats.end_run()
+    unreachable = gc.collect()
+    return to_js({
+        "blocks": sys.getallocatedblocks(),
+        "objects": len(gc.get_objects()),
+        "modules": len(sys.modules),
+        "unreachable": unreachable,
+    }, dict_converter=js.Object.fromEntries)
+
+# canvas criterion ("d"): what the program drew on sys.stdctx is compared with
+# the solution's drawing without rendering either. Both command streams are
+# canonicalised first: state changes are folded into the drawing operations
+# they affect and path building into the fill/stroke/clip using the path.
+# Each present() ends a frame, whose operations can be compared in any order
+
+
+CANVAS_DEFAULTS = {
+    "fillStyle": "black", "strokeStyle": "black", "lineWidth": 1.0, "lineCap": "butt", "lineJoin": "miter",
+    "miterLimit": 10, "lineDash": [], "lineDashOffset": 0.0, "font": "10px sans-serif", "textAlign": "start",
+    "textBaseline": "alphabetic", "direction": "inherit", "shadowBlur": 0, "shadowColor": "fully-transparent black",
+    "shadowOffsetX": 0, "shadowOffsetY": 0, "filter": "none",
+}
+_SHADOW_STATE = ("shadowBlur", "shadowColor", "shadowOffsetX", "shadowOffsetY", "filter")
+_FILL_STATE = ("fillStyle",) + _SHADOW_STATE
+_STROKE_STATE = ("strokeStyle", "lineWidth", "lineCap", "lineJoin", "miterLimit",
+                 "lineDash", "lineDashOffset") + _SHADOW_STATE
+_TEXT_STATE = ("font", "textAlign", "textBaseline", "direction")
+# drawing operation -> state it depends on
+_CANVAS_OPERATIONS = {
+    "fill": _FILL_STATE, "fillRect": _FILL_STATE, "fillText": _FILL_STATE + _TEXT_STATE,
+    "stroke": _STROKE_STATE, "strokeRect": _STROKE_STATE, "strokeText": _STROKE_STATE + _TEXT_STATE,
+    "clip": (), "clearRect": (), "drawImage": _SHADOW_STATE,
+}
+_PATH_ACTIONS = {"moveTo", "lineTo", "arc", "ellipse", "bezierCurveTo", "quadraticCurveTo", "rect", "closePath"}
+_PATH_OPERATIONS = {"fill", "stroke", "clip"}
+_COLOR_STATE = {"fillStyle", "strokeStyle", "shadowColor"}
+
+
+def _canvas_args(command):
+    return tuple(sorted((k, v) for k, v in command.items() if k not in ("action", "clearCanvas")))
+
+
+def canonical_canvas(commands):
+    frames = []
+    operations = []
+    state = dict(CANVAS_DEFAULTS)
+    saved = []
+    path = []
+    for command in commands:
+        action = command.get("action")
+        if action == "present":
+            frames.append(operations)
+            operations = []
+        elif action == "reset":
+            operations, state, saved, path = [], dict(CANVAS_DEFAULTS), [], []
+        elif action == "save":
+            saved.append(dict(state))
+        elif action == "restore":
+            if saved:
+                state = saved.pop()
+        elif action == "beginPath":
+            path = []
+        elif action in _PATH_ACTIONS:
+            path.append((action, _canvas_args(command)))
+        elif action in _CANVAS_OPERATIONS:
+            if command.get("clearCanvas"):
+                operations = []
+            folded = tuple((k, state[k]) for k in _CANVAS_OPERATIONS[action])
+            shape = tuple(path) if action in _PATH_OPERATIONS else ()
+            operations.append((action, _canvas_args(command), shape, folded))
+        elif action in CANVAS_DEFAULTS or action == "setLineDash":
+            key = "lineDash" if action == "setLineDash" else action
+            value = command.get("color", command.get("value"))
+            if key in _COLOR_STATE and isinstance(value, str):
+                value = value.lower().replace(" ", "")
+            state[key] = list(value) if key == "lineDash" else value
+    frames.append(operations)
+    return [frame for frame in frames if frame]
+
+
+def _canvas_sort_key(value, tolerance):
+    # numbers on a tolerance grid, so operations that match sort alike
+    if isinstance(value, (list, tuple)):
+        return tuple(_canvas_sort_key(v, tolerance) for v in value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return ("n", round(value / tolerance) if tolerance else value)
+    return ("s", repr(value))
+
+
+def _canvas_equal(a, b, tolerance):
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(_canvas_equal(x, y, tolerance) for x, y in zip(a, b))
+    numbers = (int, float)
+    if isinstance(a, numbers) and isinstance(b, numbers) and not isinstance(a, bool) and not isinstance(b, bool):
+        return abs(a - b) <= tolerance
+    return a == b
+
+
+def compare_canvas(actual, expected, tolerance=0.01, ordered=True):
+    if not ordered:
+        actual = [sorted(frame, key=lambda op: _canvas_sort_key(op, tolerance)) for frame in actual]
+        expected = [sorted(frame, key=lambda op: _canvas_sort_key(op, tolerance)) for frame in expected]
+    return _canvas_equal(actual, expected, tolerance)
+
+
+# the solution's canonical drawing per (solution code, inputs)
+_canvas_solutions = {}
+CANVAS_SOLUTION_CACHE_SIZE = 32
+
+
+def solution_canvas(solution_code, inputs):
+    global test_inputs
+    key = (solution_code, tuple(inputs))
+    if key not in _canvas_solutions:
+        saved_inputs, saved_output = test_inputs, test_output.buffer
+        test_inputs = list(inputs)
+        debug_context.start_capture()
+        debug_context.reset()
+        try:
+            exec(solution_code, {'input': test_input})
+        finally:
+            commands = debug_context.end_capture()
+            test_inputs, test_output.buffer = saved_inputs, saved_output
+        if len(_canvas_solutions) >= CANVAS_SOLUTION_CACHE_SIZE:
+            del _canvas_solutions[next(iter(_canvas_solutions))]
+        _canvas_solutions[key] = canonical_canvas(commands)
+    return _canvas_solutions[key]
+
+# generated criterion ("g"): the program runs on inputs made by a generator and
+# its output is compared with the solution's for the same inputs. The generator
+# is one line per input ("int 1 100", "float 0 1 2" for two decimals, "word red
+# green blue") or Python code defining generate(random), which returns the list
+# of inputs for one run. Inputs are the same on every run. The smallest failing
+# input is shrunk towards simpler values before it is shown
+
+
+GENERATED_CASES = 100
+SHRINK_RUNS = 200
+# the solution's output per (solution code, inputs); None if it failed
+_solution_outputs = {}
+SOLUTION_OUTPUT_CACHE_SIZE = 4096
+
+
+def parse_generator(source):
+    # (kind, arguments...) per input, or None for a generate function
+    if "def generate" in source:
+        return None
+    specs = []
+    for line in source.splitlines():
+        kind, *args = line.split() or [None]
+        if kind is None:
+            continue
+        elif kind == "int":
+            specs.append(("int", int(args[0]), int(args[1])))
+        elif kind == "float":
+            specs.append(("float", float(args[0]), float(args[1]), int(args[2]) if len(args) > 2 else 2))
+        elif kind == "word" and args:
+            specs.append(("word", args))
+        else:
+            raise ValueError(f"Can't generate input from '{line}'")
+    return specs
+
+
+def _generate_value(spec, rng):
+    if spec[0] == "int":
+        return str(rng.randint(spec[1], spec[2]))
+    elif spec[0] == "float":
+        return str(round(rng.uniform(spec[1], spec[2]), spec[3]))
+    return rng.choice(spec[1])
+
+
+def generate_inputs(source, cases):
+    rng = random.Random(0)
+    specs = parse_generator(source)
+    if specs is None:
+        generator = {}
+        exec(source, generator)
+        return [[str(value) for value in generator["generate"](rng)] for _ in range(cases)], None
+    return [[_generate_value(spec, rng) for spec in specs] for _ in range(cases)], specs
+
+
+def _simpler_values(value, spec):
+    # candidates strictly closer to 0 (or the first word) within the generator's
+    # range; none once the value is there, so shrinking always ends
+    if spec[0] == "word":
+        words = spec[1]
+        return words[:words.index(value)] if value in words else []
+    number = float(value) if spec[0] == "float" else int(value)
+    target = min(max(0, spec[1]), spec[2])
+    if spec[0] == "int":
+        step = 1 if number > target else -1
+        candidates = [target, target + (number - target) // 2, number - step]
+    else:
+        candidates = [target, round(number), (number + target) / 2]
+        candidates = [round(c, spec[3]) for c in candidates if spec[1] <= c <= spec[2]]
+    distance = abs(number - target)
+    return list(dict.fromkeys(str(c) for c in candidates if abs(c - target) < distance))
+
+
+def _run_compiled(compiled, inputs):
+    # the output of one run, or None if it failed, and what went wrong
+    global test_inputs
+    test_inputs = list(inputs)
+    test_output.clear()
+    debug_context.reset()
+    try:
+        exec(compiled, {'hit_breakpoint': hit_breakpoint, 'traceback': traceback, 'input': test_input})
+    except NotEnoughInputsError:
+        return None, "You've requested too many inputs"
+    except Exception:
+        return None, "Runtime error"
+    if test_inputs and test_inputs != [""]:
+        return None, "Unconsumed input"
+    return test_output.buffer, None
+
+
+def normalise_output(text, ignore):
+    # the same ignore options as pattern criteria
+    if "w" in ignore:
+        text = re.sub(r"\s+", "", text)
+    if "p" in ignore:
+        text = re.sub(r"[^\w*\s]", "", text)
+    if "c" in ignore:
+        text = text.casefold()
+    return text.rstrip("\n")
+
+
+def differential_test(compiled, solution_code, source, cases, ignore):
+    # (inputs, expected, actual) for the simplest generated inputs on which
+    # the program's output differs from the solution's, or None
+    global test_inputs
+    vectors, specs = generate_inputs(source, GENERATED_CASES if cases < 0 else cases)
+    solution = compile(solution_code, filename="solution.py", mode="exec")
+
+    def compare(inputs):
+        # (expected, actual) if the program fails on inputs the solution handles
+        key = (solution_code, tuple(inputs))
+        if key not in _solution_outputs:
+            if len(_solution_outputs) >= SOLUTION_OUTPUT_CACHE_SIZE:
+                del _solution_outputs[next(iter(_solution_outputs))]
+            _solution_outputs[key] = _run_compiled(solution, inputs)[0]
+        expected = _solution_outputs[key]
+        if expected is None:
+            return None  # not an input the task is about
+        actual, err = _run_compiled(compiled, inputs)
+        if actual is not None and normalise_output(actual, ignore) == normalise_output(expected, ignore):
+            return None
+        return expected, actual if actual is not None else err
+
+    saved_inputs, saved_output = test_inputs, test_output.buffer
+    debug_context.start_capture()
+    try:
+        failing = [inputs for inputs in vectors if compare(inputs)]
+        if not failing:
+            return None
+        inputs = min(failing, key=lambda v: (sum(len(x) for x in v), v))
+        runs = SHRINK_RUNS
+        improved = specs is not None and len(specs) == len(inputs)
+        while improved and runs > 0:
+            improved = False
+            for i, spec in enumerate(specs):
+                for value in _simpler_values(inputs[i], spec):
+                    runs -= 1
+                    candidate = inputs[:i] + [value] + inputs[i + 1:]
+                    if compare(candidate):
+                        inputs, improved = candidate, True
+                        break
+        expected, actual = compare(inputs)
+        return inputs, expected, actual
+    finally:
+        debug_context.end_capture()
+        test_inputs, test_output.buffer = saved_inputs, saved_output
+
+# solution coverage, for authors: the solution runs through pyexec against every
+# test case with a trace function on its own frames only, recording the lines
+# run and the arcs between them. Branches (if, while, for) are worked out from
+# the syntax tree; a branch is covered in a direction once an arc from its
+# header leads into its body, or anywhere else
+
+
+COVERAGE_FILENAME = "YourPythonCode.py"  # as pyexec compiles the program
+
+
+class CoverageCollector:
+    def __init__(self):
+        self.runs = []  # (lines, arcs) per test case
+        self.lines = self.arcs = None
+
+    def _trace(self, frame, event, arg):
+        if frame.f_code.co_filename != COVERAGE_FILENAME:
+            return None
+        lines, arcs = self.lines, self.arcs
+        previous = -frame.f_code.co_firstlineno  # entering the frame
+
+        def trace_lines(frame, event, arg):
+            nonlocal previous
+            if event == "line":
+                lines.add(frame.f_lineno)
+                arcs.add((previous, frame.f_lineno))
+                previous = frame.f_lineno
+            elif event == "return":
+                arcs.add((previous, -frame.f_code.co_firstlineno))
+            return trace_lines
+        return trace_lines
+
+    def begin(self):
+        self.lines, self.arcs = set(), set()
+        sys.settrace(self._trace)
+
+    def end(self):
+        sys.settrace(None)
+        self.runs.append((self.lines, self.arcs))
+        self.lines = self.arcs = None
+
+
+coverage_collector = CoverageCollector()
+
+
+def pyexec_covered(*args):
+    # pyexec, recording the coverage of the program as one more test case
+    coverage_collector.begin()
+    try:
+        return pyexec(*args)
+    finally:
+        coverage_collector.end()
+
+
+def _is_docstring(node, parent):
+    return (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str)
+            and isinstance(parent, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+            and parent.body[0] is node)
+
+
+def executable_lines(tree):
+    # lines that start a statement which runs; docstrings and global statements don't
+    lines = set()
+    for parent in ast.walk(tree):
+        blocks = [getattr(parent, name, None) for name in ("body", "orelse", "finalbody")]
+        for node in [node for block in blocks if isinstance(block, list) for node in block]:
+            if isinstance(node, ast.stmt) and not isinstance(node, (ast.Global, ast.Nonlocal)) \
+                    and not _is_docstring(node, parent):
+                lines.add(node.lineno)
+        for handler in getattr(parent, "handlers", []):
+            lines.add(handler.lineno)
+    return lines
+
+
+def branch_points(tree):
+    # (header lines, body line) per if, while and for whose directions can be told apart
+    points = {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.If, ast.While)):
+            header = node.test
+        elif isinstance(node, (ast.For, ast.AsyncFor)):
+            header = node.iter
+        else:
+            continue
+        if isinstance(node, ast.While) and isinstance(header, ast.Constant) and header.value:
+            continue  # while True only ever goes into its body
+        sources = set(range(node.lineno, header.end_lineno + 1))
+        if node.body[0].lineno not in sources:
+            points[node.lineno] = (sources, node.body[0].lineno)
+    return points
+
+
+def _covered_branches(points, arcs):
+    # "line:body" and "line:skip" for the directions arcs went
+    covered = set()
+    for line, (sources, body) in points.items():
+        for source, target in arcs:
+            if source in sources and target not in sources:
+                covered.add(f"{line}:body" if target == body else f"{line}:skip")
+    return covered
+
+
+def coverage_report(code):
+    # what the test cases run since the last report covered of the solution
+    runs, coverage_collector.runs = coverage_collector.runs, []
+    tree = ast.parse(code)
+    executable = executable_lines(tree)
+    points = branch_points(tree)
+    items = []  # lines and branch directions per test case
+    for lines, arcs in runs:
+        items.append({str(line) for line in lines & executable} | _covered_branches(points, arcs))
+    union = set().union(*items)
+    # the most covering test cases first; one that adds nothing to those before
+    # it is a candidate for removal, and without all candidates the suite still
+    # covers as much
+    kept = set()
+    redundant = set()
+    for i in sorted(range(len(items)), key=lambda i: -len(items[i])):
+        if items[i] <= kept:
+            redundant.add(i)
+        kept |= items[i]
+    tests = []
+    for i, covered in enumerate(items):
+        others = set().union(*(items[:i] + items[i + 1:]))
+        tests.append({
+            "lines": sorted(int(item) for item in covered if ":" not in item),
+            "unique": len(covered - others),
+            "redundant": i in redundant,
+        })
+    return to_js({
+        "lines": sorted(executable),
+        "uncovered": sorted(line for line in executable if str(line) not in union),
+        "branches": [{"line": line, "body": f"{line}:body" in union, "skip": f"{line}:skip" in union}
+                     for line in sorted(points)],
+        "tests": tests,
+    }, dict_converter=js.Object.fromEntries)
+
+# pattern criteria run book patterns against whatever the program printed, and
+# a backtracking pattern like (.*a)*b against a long wrong output can take
+# minutes. Patterns without repetition are linear in re, and patterns of only
+# literal text and .* are matched without backtracking. Any other pattern gets
+# a time budget: the worker raises SIGUSR2 from its periodic signal check once
+# it is used up
+
+
+class PatternTooExpensive(Exception):
+    pass
+
+
+def pattern_budget_handler(signum, frame):
+    raise PatternTooExpensive()
+
+
+try:
+    signal.signal(signal.SIGUSR2, pattern_budget_handler)
+    PATTERN_BUDGET_SIGNAL = int(signal.SIGUSR2)
+except (AttributeError, ValueError, OSError):
+    PATTERN_BUDGET_SIGNAL = 0  # patterns run without a budget
+PATTERN_BUDGET = 1000  # ms
+
+_REPEATS = {re._parser.MAX_REPEAT, re._parser.MIN_REPEAT, re._parser.POSSESSIVE_REPEAT}
+
+
+def _pattern_items(items):
+    # every (op, argument) of a parsed pattern, nested ones included
+    for op, av in items:
+        yield op, av
+        if op in _REPEATS:
+            yield from _pattern_items(av[2])
+        elif op is re._parser.SUBPATTERN:
+            yield from _pattern_items(av[3])
+        elif op is re._parser.BRANCH:
+            for branch in av[1]:
+                yield from _pattern_items(branch)
+        elif op in (re._parser.ASSERT, re._parser.ASSERT_NOT):
+            yield from _pattern_items(av[1])
+        elif op is re._parser.ATOMIC_GROUP:
+            yield from _pattern_items(av)
+        elif op is re._parser.GROUPREF_EXISTS:
+            yield from _pattern_items(av[1])
+            if av[2]:
+                yield from _pattern_items(av[2])
+
+
+def _is_wildcard(op, av):
+    return (op is re._parser.MAX_REPEAT and av[:2] == (0, re._parser.MAXREPEAT)
+            and list(av[2]) == [(re._parser.ANY, None)])
+
+
+def wildcard_segments(items):
+    # the literal text between the .* of a parsed pattern of only literal text
+    # and .* (in DOTALL mode, case sensitive), or None for any other pattern
+    if items.state.flags & re.IGNORECASE or not items.state.flags & re.DOTALL:
+        return None
+    segments = [""]
+    for op, av in items:
+        if op is re._parser.LITERAL:
+            segments[-1] += chr(av)
+        elif _is_wildcard(op, av):
+            if segments[-1] or len(segments) == 1:
+                segments.append("")  # .*.* is .*
+        else:
+            return None
+    if len(segments) == 1 or not any(segments):
+        return None
+    return segments
+
+
+def _within_budget(function, *args):
+    if not PATTERN_BUDGET_SIGNAL:
+        return function(*args)
+    js.workerArmPatternBudget(PATTERN_BUDGET)
+    try:
+        return function(*args)
+    finally:
+        js.workerArmPatternBudget(0)
+
+
+def count_matches(pattern, text, flags):
+    # len(re.findall(pattern, text, flags)), or PatternTooExpensive
+    items = re._parser.parse(pattern, flags)
+    segments = wildcard_segments(items)
+    if segments is not None:
+        # .* takes everything up to the last possible match of the rest, so
+        # there is at most one match: when the segments occur in order
+        position = 0
+        for segment in segments:
+            position = text.find(segment, position)
+            if position < 0:
+                return 0
+            position += len(segment)
+        return 1
+    if not any(op in _REPEATS or op is re._parser.GROUPREF for op, av in _pattern_items(items)):
+        return len(re.findall(pattern, text, flags))
+    return len(_within_budget(re.findall, pattern, text, flags))
+
+
+def match_expected_output(expected, text):
+    # expected output is literal text in which .* stands for anything on the
+    # same line, and new lines at the end of the output are ignored. The same as
+    # re.match of the escaped text with .* and \n*$ appended, without backtracking
+    segments = expected.split(".*")
+    if not text.startswith(segments[0]):
+        return False
+    position = len(segments[0])
+    content_end = len(text.rstrip("\n"))
+    if len(segments) == 1:
+        return position >= content_end
+    # the earliest match of each segment leaves the most room for the rest
+    for segment in segments[1:-1]:
+        found = text.find(segment, position)
+        if found < 0 or text.find("\n", position, found) >= 0:
+            return False
+        position = found + len(segment)
+    # the last one has to reach the trailing new lines
+    last = segments[-1]
+    found = text.find(last, max(position, content_end - len(last)))
+    return found >= 0 and text.find("\n", position, found) < 0
+
 # turtle
 
 
 def run_turtle_cmd(msg):
+    debug_output.flush()
     post_message({"cmd": "turtle", "msg": json.dumps(msg)})
     return synchronise('/@turtle@/req.js')
 
@@ -849,6 +1884,7 @@ def hit_breakpoint(lineno, alocals, aglobals, is_secondary=False, node_id=None):
         return True
     last_seen_lineno = lineno
     last_seen_breakpoint_id = node_id
+    debug_output.tick()
     if not in_watch and (step_into or lineno in active_breakpoints):
         step_into = False
         # remove wrapper and breakpt method
@@ -876,6 +1912,7 @@ def hit_breakpoint(lineno, alocals, aglobals, is_secondary=False, node_id=None):
                 finally:
                     in_watch = False
                     
+            debug_output.flush()
             post_message({"cmd": "breakpt", "lineno": lineno,
                         "globals": globals, "locals": locals,
                         "watches": watch_resp})
@@ -67,11 +67,15 @@ const AppContainer = () => {
   };
 
   useEffect(() => {
-    navigator.serviceWorker.register("pysw.js").then(function (reg) {
-      if (navigator.serviceWorker.controller === null || !reg.active) {
-        window.location.reload();
-      }
-    });
+    // the release names the service worker's precache, see pysw.js
+    const release = import.meta.env.DEV ? "dev" : packageJson.version;
+    navigator.serviceWorker
+      .register(`pysw.js?v=${release}`)
+      .then(function (reg) {
+        if (navigator.serviceWorker.controller === null || !reg.active) {
+          window.location.reload();
+        }
+      });
     console.log("PythonSponge version: " + packageJson.version);
   }, []);
 
@@ -271,6 +271,16 @@ const Book = (props: BookProps) => {
     }
   }, [rootNode, bookChallengeId, bookFetcher]);
 
+  // the challenges after the open one (or the first ones, from the cover)
+  // are fetched ahead, so moving on doesn't wait for them
+  useEffect(() => {
+    const node = activeNode || rootNode;
+    if (node) {
+      bookFetcher.prefetchAfter?.(node, authContext);
+    }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [activeNode, rootNode, bookFetcher]);
+
   const openDrawer = (open: boolean) => {
     setDrawerOpen(open);
   };
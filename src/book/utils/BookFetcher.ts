@@ -4,13 +4,29 @@ import {
   splitToParts,
 } from "../../utils/pathTools";
 import JSZip from "jszip";
-import BookNodeModel, { getSinglePage } from "../../models/BookNodeModel";
+import BookNodeModel, {
+  getSinglePage,
+  nextBookNode,
+} from "../../models/BookNodeModel";
 import { AllTestResults, emptyTestResults } from "../../models/Tests";
 import { loadTestStateLocal } from "./ProgressStorage";
 import UnauthorisedError from "../../auth/UnauthorisedException";
 import { SessionContextType } from "../../auth/contexts/SessionContext";
 import NotFoundError from "./NotFoundError";
 import IBookFetcher, { IBookFetchResult } from "./IBookFetcher";
+import contentCache from "./ContentCache";
+import { runTasksWithLimit } from "../../utils/runTasksWithLimit";
+
+const PREFETCH_AHEAD = 3; // challenges after the open one
+const PREFETCH_CONCURRENCY = 2;
+
+const whenIdle = (callback: () => void) => {
+  if (typeof requestIdleCallback !== "undefined") {
+    requestIdleCallback(callback, { timeout: 2000 });
+  } else {
+    setTimeout(callback, 200);
+  }
+};
 
 class BookFetcher implements IBookFetcher {
   constructor(
@@ -66,7 +82,19 @@ class BookFetcher implements IBookFetcher {
         ?.file(url.replace("pfzip://in.zip/", ""))
         ?.async("blob");
       return new Response(blob, { status: 200 });
-    } else if (sessionContext?.wsOpen && sessionContext?.wsSend) {
+    } else if (this.assets.has(url)) {
+      return contentCache.fetch(url, () =>
+        this.fetchRemote(url, sessionContext)
+      );
+    }
+    return this.fetchRemote(url, sessionContext);
+  }
+
+  private async fetchRemote(
+    url: string,
+    sessionContext?: SessionContextType
+  ) {
+    if (sessionContext?.wsOpen && sessionContext?.wsSend) {
       // use Websockets
       let response: any = undefined;
 
@@ -137,9 +165,10 @@ class BookFetcher implements IBookFetcher {
                 authContext
               );
             })
-            .then((res) =>
-              r({ ...res, singlePageBook: getSinglePage(res.book) })
-            )
+            .then((res) => {
+              this.indexAssets(res.book);
+              r({ ...res, singlePageBook: getSinglePage(res.book) });
+            })
         )
         .catch((t) => {
           if (t instanceof UnauthorisedError) {
@@ -163,6 +192,80 @@ class BookFetcher implements IBookFetcher {
 
   private zipFetchingFromPath = false;
 
+  // files of the challenges in the book, which are kept in the content cache
+  private root: BookNodeModel | null = null;
+  private assets = new Set<string>();
+  private prefetchGeneration = 0;
+
+  private nodeAssets(node: BookNodeModel) {
+    const base = node.bookMainUrl || this.bookPathAbsolute;
+    return [
+      ...[node.guide, node.py]
+        .filter((path): path is string => !!path)
+        .map((path) => absolutisePath(path, base)),
+      // additional files are relative to the book, as in useChallengeLoader
+      ...(node.additionalFiles || []).map((file) =>
+        absolutisePath(file.filename, this.bookPathAbsolute)
+      ),
+    ];
+  }
+
+  private indexAssets(book: BookNodeModel) {
+    this.root = book;
+    this.assets.clear();
+    const nodes = [book];
+    while (nodes.length > 0) {
+      const node = nodes.pop()!;
+      this.nodeAssets(node).forEach((url) => this.assets.add(url));
+      nodes.push(...(node.children || []));
+    }
+  }
+
+  // drops the book's files from the content cache, so they are fetched again
+  public clearCache() {
+    this.assets.forEach((url) => contentCache.forget(url));
+  }
+
+  // fetches the files of the next few challenges when the browser is idle, a
+  // few at a time; opening another challenge cancels what hasn't started yet
+  public prefetchAfter(node: BookNodeModel, authContext?: SessionContextType) {
+    const generation = ++this.prefetchGeneration;
+    const connection = (navigator as any).connection;
+    if (
+      !this.root ||
+      this.usesLocalZip() ||
+      this.localFolder ||
+      connection?.saveData
+    ) {
+      return;
+    }
+    const urls: string[] = [];
+    let current = node;
+    for (let i = 0; i < PREFETCH_AHEAD; i++) {
+      current = nextBookNode(
+        this.root,
+        current.id,
+        (n) => n.guide !== undefined
+      );
+      if (current === this.root) {
+        break;
+      }
+      urls.push(...this.nodeAssets(current));
+    }
+    const runLimited = runTasksWithLimit(PREFETCH_CONCURRENCY);
+    whenIdle(() =>
+      urls
+        .filter((url) => !contentCache.has(url))
+        .forEach((url) =>
+          runLimited(async () => {
+            if (generation === this.prefetchGeneration) {
+              await this.fetch(url, authContext);
+            }
+          }).catch((e) => console.log("Error prefetching", url, e))
+        )
+    );
+  }
+
   async expandBookLinks(
     bookNode: BookNodeModel,
     mainUrl: string,
@@ -173,7 +276,7 @@ class BookFetcher implements IBookFetcher {
   ) {
     bookNode.bookMainUrl = mainUrl;
     if (fileRoot) {
-      let localRes = loadTestStateLocal(bookNode);
+      let localRes = await loadTestStateLocal(bookNode);
       allRes.passed = new Set([...allRes.passed, ...localRes.passed]);
       allRes.failed = new Set([...allRes.failed, ...localRes.failed]);
     }
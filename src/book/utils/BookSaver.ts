@@ -83,6 +83,10 @@ const saveNode = (
       ? true
       : undefined;
   }
+  if (newBookNode.isVirtualClock !== bookNode.isVirtualClock) {
+    changed = true;
+    bookNode.isVirtualClock = newBookNode.isVirtualClock ? true : undefined;
+  }
   if (newBookNode.sol?.file !== bookNode.sol?.file) {
     changed = true;
     bookNode.sol = newBookNode.sol;
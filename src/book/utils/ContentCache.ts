@@ -0,0 +1,136 @@
+// Files of books (guides, starter code, additional files) kept in memory for
+// the session, shared by all books. Contents are stored once by a hash of the
+// text, and URLs map to contents, so template files that many challenges or
+// books copy take space only once. Least recently used contents are dropped
+// when the total goes over the byte budget. Across sessions, the service
+// worker keeps the files (see public/pysw.js).
+
+const BYTE_BUDGET = 32 * 1024 * 1024;
+
+type Content = {
+  text: string;
+  bytes: number;
+  urls: Set<string>;
+};
+
+// 53-bit string hash (cyrb53); contents are compared on a hash match
+const hashText = (text: string) => {
+  let h1 = 0xdeadbeef;
+  let h2 = 0x41c6ce57;
+  for (let i = 0; i < text.length; i++) {
+    const ch = text.charCodeAt(i);
+    h1 = Math.imul(h1 ^ ch, 2654435761);
+    h2 = Math.imul(h2 ^ ch, 1597334677);
+  }
+  h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507);
+  h1 ^= Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+  h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507);
+  h2 ^= Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+  return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(36);
+};
+
+const textResponse = (text: string) => new Response(text, { status: 200 });
+
+class ContentCache {
+  // by hash; in order of last use, least recent first
+  private contents = new Map<string, Content>();
+  private hashes = new Map<string, string>(); // by URL
+  private inFlight = new Map<string, Promise<string | null>>();
+  private bytes = 0;
+
+  get(url: string): string | undefined {
+    const hash = this.hashes.get(url);
+    const content = hash !== undefined ? this.contents.get(hash) : undefined;
+    if (hash === undefined || !content) {
+      return undefined;
+    }
+    this.contents.delete(hash);
+    this.contents.set(hash, content);
+    return content.text;
+  }
+
+  put(url: string, text: string) {
+    this.forget(url);
+    const hash = hashText(text);
+    let content = this.contents.get(hash);
+    if (content && content.text !== text) {
+      return; // hash collision: not worth keeping
+    }
+    if (content) {
+      this.contents.delete(hash);
+    } else {
+      content = { text, bytes: text.length * 2, urls: new Set() };
+      if (content.bytes > BYTE_BUDGET / 4) {
+        return;
+      }
+      this.bytes += content.bytes;
+    }
+    content.urls.add(url);
+    this.contents.set(hash, content);
+    this.hashes.set(url, hash);
+    this.evict();
+  }
+
+  forget(url: string) {
+    const hash = this.hashes.get(url);
+    if (hash === undefined) {
+      return;
+    }
+    this.hashes.delete(url);
+    const content = this.contents.get(hash);
+    content?.urls.delete(url);
+    if (content && content.urls.size === 0) {
+      this.drop(hash, content);
+    }
+  }
+
+  // the file at the URL, from memory, from a request for it already under
+  // way, or by `load`; contents of successful responses are kept
+  async fetch(url: string, load: () => Promise<Response>) {
+    const cached = this.get(url);
+    if (cached !== undefined) {
+      return textResponse(cached);
+    }
+    const pending = this.inFlight.get(url);
+    if (pending) {
+      const text = await pending.catch(() => null);
+      if (text !== null) {
+        return textResponse(text);
+      }
+      return load();
+    }
+    const response = load();
+    const text = response.then((res) => (res.ok ? res.clone().text() : null));
+    this.inFlight.set(url, text);
+    text
+      .then(
+        (text) => text !== null && this.put(url, text),
+        () => {}
+      )
+      .finally(() => this.inFlight.delete(url));
+    return response;
+  }
+
+  has(url: string) {
+    return this.hashes.has(url) || this.inFlight.has(url);
+  }
+
+  private drop(hash: string, content: Content) {
+    this.contents.delete(hash);
+    this.bytes -= content.bytes;
+    content.urls.forEach((url) => this.hashes.delete(url));
+  }
+
+  private evict() {
+    for (const [hash, content] of Array.from(this.contents.entries())) {
+      if (this.bytes <= BYTE_BUDGET) {
+        break;
+      }
+      this.drop(hash, content);
+    }
+  }
+}
+
+const contentCache = new ContentCache();
+
+export default contentCache;
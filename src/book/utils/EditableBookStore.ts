@@ -5,33 +5,7 @@ import { absolutisePath } from "../../utils/pathTools";
 import IBookFetcher, { IBookFetchResult } from "./IBookFetcher";
 import { AllTestResults, emptyTestResults } from "../../models/Tests";
 import { SessionContextType } from "../../auth/contexts/SessionContext";
-
-function runTasksWithLimit(limit: number) {
-  let active = 0;
-  const q: Array<() => void> = [];
-
-  const runNext = () => {
-    active--;
-    q.shift()?.();
-  };
-
-  return <T>(task: () => Promise<T>) =>
-    new Promise<T>((resolve, reject) => {
-      const run = () => {
-        active++;
-        task()
-          .then((v) => {
-            resolve(v);
-            runNext();
-          })
-          .catch((e) => {
-            reject(e);
-            runNext();
-          });
-      };
-      active < limit ? run() : q.push(run);
-    });
-}
+import { runTasksWithLimit } from "../../utils/runTasksWithLimit";
 
 async function addNode(
   node: BookNodeModel,
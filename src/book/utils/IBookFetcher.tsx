@@ -12,6 +12,12 @@ interface IBookFetcher {
   getBookPathAbsolute: () => string;
   fetch(url: string, authContext?: SessionContextType): Promise<Response>;
   fetchBook: (authContext?: SessionContextType) => Promise<IBookFetchResult>;
+  // fetching ahead of time, where the fetcher caches what it fetches
+  prefetchAfter?: (
+    node: BookNodeModel,
+    authContext?: SessionContextType
+  ) => void;
+  clearCache?: () => void;
 }
 
 export const clearBook = (b: BookNodeModel) => {
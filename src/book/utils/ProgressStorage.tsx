@@ -8,65 +8,20 @@ import {
   ResultsModel,
 } from "../../teacher/Models";
 import NotificationsContext from "../../components/NotificationsContext";
+import progressStore from "./ProgressStore";
 
-const loadTestStateLocal: (node: BookNodeModel) => AllTestResults = (node) => {
-  let passPath = encodeURIComponent(node.bookMainUrl + "-testsPassing");
-  let failPath = encodeURIComponent(node.bookMainUrl + "-testsFailing");
-
-  let cacheP = localStorage.getItem(passPath);
-  let cacheF = localStorage.getItem(failPath);
-
-  let cachedPass = cacheP ? JSON.parse(cacheP) : [];
-  let cachedFail = cacheF ? JSON.parse(cacheF) : [];
-
-  return {
-    passed: new Set(cachedPass),
-    failed: new Set(cachedFail),
-    comments: new Map(),
-  };
-};
+// outcomes of all challenges in the book file of the node, saved on this device
+const loadTestStateLocal: (node: BookNodeModel) => Promise<AllTestResults> = (
+  node,
+) => progressStore.loadOutcomes(`${node.bookMainUrl}`);
 
 const saveTestStateLocal: (
   node: BookNodeModel,
   pass: boolean | null,
 ) => void = (node, pass) => {
-  let passPath = encodeURIComponent(node.bookMainUrl + "-testsPassing");
-  let failPath = encodeURIComponent(node.bookMainUrl + "-testsFailing");
-
-  let cacheP = localStorage.getItem(passPath);
-  let cacheF = localStorage.getItem(failPath);
-
-  let cachedPass = cacheP ? JSON.parse(cacheP) : [];
-  let cachedFail = cacheF ? JSON.parse(cacheF) : [];
-  if (pass === true) {
-    if (cachedPass.indexOf(node.id) !== -1) {
-      // already stored in pass
-      return;
-    } else {
-      cachedPass.push(node.id);
-    }
-
-    let index = cachedFail.indexOf(node.id);
-    if (index !== -1) {
-      cachedFail.splice(index, 1);
-    }
-  } else if (pass === false) {
-    if (cachedFail.indexOf(node.id) !== -1) {
-      // already stored in fail
-      return;
-    } else {
-      cachedFail.push(node.id);
-    }
-
-    let index = cachedPass.indexOf(node.id);
-    if (index !== -1) {
-      cachedPass.splice(index, 1);
-    }
-  } else {
-    return;
+  if (pass === true || pass === false) {
+    progressStore.setOutcome(`${node.bookMainUrl}`, node.id, pass);
   }
-  localStorage.setItem(passPath, JSON.stringify([...cachedPass]));
-  localStorage.setItem(failPath, JSON.stringify([...cachedFail]));
 };
 
 type ProgressStorage = {
@@ -272,13 +227,10 @@ const useProgressStorage: (bookPath: string) => ProgressStorage = (
     let comments = new Map<string, string>();
     mergeResults(root, data, currentRes, newPasses, newCode, comments);
     for (let [id, code] of newCode) {
-      localStorage.setItem("code-" + encodeURIComponent(bookPath + id), code);
+      progressStore.saveCode(bookPath + id, code);
     }
     for (let [id, comment] of comments) {
-      localStorage.setItem(
-        "comment-" + encodeURIComponent(bookPath + id),
-        comment,
-      );
+      progressStore.saveComment(bookPath + id, comment);
     }
     updateResults(currentRes, {
       passed: newPasses,
@@ -0,0 +1,319 @@
+import { openDb, requestToPromise, transactionDone } from "../../utils/idb";
+import { AllTestResults, emptyTestResults } from "../../models/Tests";
+
+// Progress kept on this device: test outcomes, saved code and teacher comments,
+// one IndexedDB record per challenge instead of whole lists in localStorage.
+// Writes go to an in-memory buffer that is flushed when the browser is idle or
+// the page is hidden, so recording an outcome never blocks the page; reads see
+// buffered writes. What earlier versions kept in localStorage is moved over
+// when the database is first created, and localStorage is still used where
+// IndexedDB isn't available.
+
+const DB_NAME = "python-sponge-progress";
+const OUTCOMES = "outcomes";
+const CODE = "code";
+const FLUSH_TIMEOUT = 2000; // ms; longest wait for the browser to be idle
+
+// book is the URL of the book file the challenge is in
+type OutcomeRecord = { book: string; id: string; passed: boolean };
+// uid is the book path followed by the challenge id
+type CodeRecord = { uid: string; code?: string; comment?: string };
+
+const PASS_SUFFIX = "-testsPassing";
+const FAIL_SUFFIX = "-testsFailing";
+const CODE_PREFIX = "code-";
+const COMMENT_PREFIX = "comment-";
+
+const addOutcome = (results: AllTestResults, id: string, passed: boolean) => {
+  if (passed) {
+    results.passed.add(id);
+    results.failed.delete(id);
+  } else {
+    results.failed.add(id);
+    results.passed.delete(id);
+  }
+};
+
+const readList = (key: string): string[] => {
+  const value = localStorage.getItem(key);
+  return value ? JSON.parse(value) : [];
+};
+
+// localStorage, as earlier versions kept progress
+const legacy = {
+  loadOutcomes(book: string) {
+    const results = emptyTestResults();
+    readList(encodeURIComponent(book + PASS_SUFFIX)).forEach((id) =>
+      results.passed.add(id)
+    );
+    readList(encodeURIComponent(book + FAIL_SUFFIX)).forEach((id) =>
+      results.failed.add(id)
+    );
+    return results;
+  },
+
+  saveOutcomes(records: OutcomeRecord[]) {
+    const books = new Set(records.map((r) => r.book));
+    for (const book of Array.from(books)) {
+      const results = legacy.loadOutcomes(book);
+      records
+        .filter((r) => r.book === book)
+        .forEach((r) => addOutcome(results, r.id, r.passed));
+      localStorage.setItem(
+        encodeURIComponent(book + PASS_SUFFIX),
+        JSON.stringify(Array.from(results.passed))
+      );
+      localStorage.setItem(
+        encodeURIComponent(book + FAIL_SUFFIX),
+        JSON.stringify(Array.from(results.failed))
+      );
+    }
+  },
+
+  loadCode(uid: string) {
+    return (
+      localStorage.getItem(CODE_PREFIX + encodeURIComponent(uid)) ?? undefined
+    );
+  },
+
+  saveCode(records: CodeRecord[]) {
+    for (const record of records) {
+      if (record.code !== undefined) {
+        localStorage.setItem(
+          CODE_PREFIX + encodeURIComponent(record.uid),
+          record.code
+        );
+      }
+      if (record.comment !== undefined) {
+        localStorage.setItem(
+          COMMENT_PREFIX + encodeURIComponent(record.uid),
+          record.comment
+        );
+      }
+    }
+  },
+};
+
+const decodeKey = (key: string) => {
+  try {
+    return decodeURIComponent(key);
+  } catch {
+    return null;
+  }
+};
+
+// moves the progress earlier versions kept in localStorage into the database
+const migrateFromLocalStorage = async (db: IDBDatabase) => {
+  const outcomes: OutcomeRecord[] = [];
+  const code = new Map<string, CodeRecord>();
+  const migratedKeys: string[] = [];
+  for (let i = 0; i < localStorage.length; i++) {
+    const key = localStorage.key(i)!;
+    const prefix = [CODE_PREFIX, COMMENT_PREFIX].find((p) =>
+      key.startsWith(p)
+    );
+    if (prefix) {
+      const uid = decodeKey(key.substring(prefix.length));
+      if (uid === null) {
+        continue;
+      }
+      const record = code.get(uid) ?? { uid };
+      record[prefix === CODE_PREFIX ? "code" : "comment"] =
+        localStorage.getItem(key) ?? undefined;
+      code.set(uid, record);
+      migratedKeys.push(key);
+      continue;
+    }
+    const name = decodeKey(key);
+    const suffix = [PASS_SUFFIX, FAIL_SUFFIX].find((s) => name?.endsWith(s));
+    if (name && suffix) {
+      const book = name.substring(0, name.length - suffix.length);
+      for (const id of readList(key)) {
+        outcomes.push({ book, id, passed: suffix === PASS_SUFFIX });
+      }
+      migratedKeys.push(key);
+    }
+  }
+  if (migratedKeys.length === 0) {
+    return;
+  }
+  const tx = db.transaction([OUTCOMES, CODE], "readwrite");
+  outcomes.forEach((record) => tx.objectStore(OUTCOMES).put(record));
+  code.forEach((record) => tx.objectStore(CODE).put(record));
+  await transactionDone(tx);
+  migratedKeys.forEach((key) => localStorage.removeItem(key));
+};
+
+const whenIdle = (callback: () => void) => {
+  if (typeof requestIdleCallback !== "undefined") {
+    requestIdleCallback(callback, { timeout: FLUSH_TIMEOUT });
+  } else {
+    setTimeout(callback, 0);
+  }
+};
+
+class ProgressStore {
+  private db: Promise<IDBDatabase> | null = null;
+  // writes not yet in the database, by book and challenge id, and by uid
+  private outcomes = new Map<string, OutcomeRecord>();
+  private code = new Map<string, CodeRecord>();
+  private flushScheduled = false;
+  private flushing: Promise<void> = Promise.resolve();
+
+  constructor() {
+    if (typeof window !== "undefined") {
+      // buffered writes must not be lost when the tab is closed
+      window.addEventListener("pagehide", () => this.flush());
+      document.addEventListener("visibilitychange", () => {
+        if (document.visibilityState === "hidden") {
+          this.flush();
+        }
+      });
+    }
+  }
+
+  private getDb() {
+    if (!this.db) {
+      let created = false;
+      this.db = openDb(DB_NAME, 1, (db) => {
+        const outcomes = db.createObjectStore(OUTCOMES, {
+          keyPath: ["book", "id"],
+        });
+        outcomes.createIndex("book", "book");
+        db.createObjectStore(CODE, { keyPath: "uid" });
+        created = true;
+      }).then(async (db) => {
+        if (created) {
+          await migrateFromLocalStorage(db).catch((e) =>
+            console.log("Error migrating progress from localStorage", e)
+          );
+        }
+        return db;
+      });
+    }
+    return this.db;
+  }
+
+  // test outcomes of all challenges in a book file, in a single read
+  async loadOutcomes(book: string): Promise<AllTestResults> {
+    let results: AllTestResults;
+    try {
+      const db = await this.getDb();
+      const records = await requestToPromise<OutcomeRecord[]>(
+        db
+          .transaction(OUTCOMES)
+          .objectStore(OUTCOMES)
+          .index("book")
+          .getAll(book)
+      );
+      results = emptyTestResults();
+      records.forEach((r) => addOutcome(results, r.id, r.passed));
+    } catch (e) {
+      console.log("Error loading progress", e);
+      results = legacy.loadOutcomes(book);
+    }
+    this.outcomes.forEach((r) => {
+      if (r.book === book) {
+        addOutcome(results, r.id, r.passed);
+      }
+    });
+    return results;
+  }
+
+  setOutcome(book: string, id: string, passed: boolean) {
+    this.outcomes.set(`${book}\n${id}`, { book, id, passed });
+    this.scheduleFlush();
+  }
+
+  async loadCode(uid: string): Promise<string | undefined> {
+    const buffered = this.code.get(uid);
+    if (buffered?.code !== undefined) {
+      return buffered.code;
+    }
+    try {
+      const db = await this.getDb();
+      const record = await requestToPromise<CodeRecord | undefined>(
+        db.transaction(CODE).objectStore(CODE).get(uid)
+      );
+      return this.code.get(uid)?.code ?? record?.code;
+    } catch (e) {
+      console.log("Error loading saved code", e);
+      return legacy.loadCode(uid);
+    }
+  }
+
+  saveCode(uid: string, code: string) {
+    this.code.set(uid, { ...(this.code.get(uid) ?? { uid }), code });
+    this.scheduleFlush();
+  }
+
+  saveComment(uid: string, comment: string) {
+    this.code.set(uid, { ...(this.code.get(uid) ?? { uid }), comment });
+    this.scheduleFlush();
+  }
+
+  private scheduleFlush() {
+    if (!this.flushScheduled) {
+      this.flushScheduled = true;
+      whenIdle(() => this.flush());
+    }
+  }
+
+  // one flush at a time, so records are written in order
+  flush() {
+    this.flushScheduled = false;
+    this.flushing = this.flushing.then(() => this.write());
+    return this.flushing;
+  }
+
+  private async write() {
+    const outcomes = Array.from(this.outcomes.entries());
+    const code = Array.from(this.code.entries());
+    if (outcomes.length === 0 && code.length === 0) {
+      return;
+    }
+    try {
+      let db: IDBDatabase | null = null;
+      try {
+        db = await this.getDb();
+      } catch (e) {
+        console.log("Saving progress in localStorage", e);
+      }
+      if (db) {
+        const tx = db.transaction([OUTCOMES, CODE], "readwrite");
+        const outcomeStore = tx.objectStore(OUTCOMES);
+        outcomes.forEach(([, record]) => outcomeStore.put(record));
+        // code and comment of a challenge are saved separately
+        const codeStore = tx.objectStore(CODE);
+        for (const [uid, record] of code) {
+          const stored = await requestToPromise<CodeRecord | undefined>(
+            codeStore.get(uid)
+          );
+          codeStore.put({ ...stored, ...record });
+        }
+        await transactionDone(tx);
+      } else {
+        legacy.saveOutcomes(outcomes.map(([, record]) => record));
+        legacy.saveCode(code.map(([, record]) => record));
+      }
+      // unless they were overwritten in the meantime
+      outcomes.forEach(([key, record]) => {
+        if (this.outcomes.get(key) === record) {
+          this.outcomes.delete(key);
+        }
+      });
+      code.forEach(([uid, record]) => {
+        if (this.code.get(uid) === record) {
+          this.code.delete(uid);
+        }
+      });
+    } catch (e) {
+      // kept in the buffer for the next flush
+      console.log("Error saving progress", e);
+    }
+  }
+}
+
+const progressStore = new ProgressStore();
+
+export default progressStore;
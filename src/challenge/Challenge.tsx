@@ -37,11 +37,13 @@ import ChallengeGuide, {
   ChallengeGuideRef,
 } from "./components/Guide/ChallengeGuide";
 import saveNode from "../book/utils/BookSaver";
+import progressStore from "../book/utils/ProgressStore";
 import SaveDialog, { SaveDialogProps } from "../components/dialogs/SaveDialog";
 import NotificationsContext from "../components/NotificationsContext";
 import { SessionFile } from "../models/SessionFile";
 
 import { GuideToggleFab } from "./components/GuideToggleFab";
+import BridgeStatsOverlay from "../components/BridgeStatsOverlay";
 import { BookUploadType } from "../book/components/BookUpload";
 import BookServerUploader, {
   BookServerUploaderRef,
@@ -165,6 +167,7 @@ const Challenge = (props: ChallengeProps) => {
         outputsRef.current?.getCanvas()?.runCommand(commands);
       }
     },
+    canvasPort: () => outputsRef.current?.getCanvas()?.connect() ?? null,
     awaitCanvas: async () => {
       if (typ !== ChallengeTypes.canvas) {
         setTyp(ChallengeTypes.canvas);
@@ -263,6 +266,13 @@ const Challenge = (props: ChallengeProps) => {
     // eslint-disable-next-line
   }, [props.uid, props.bookNode]);
 
+  // Python keeps the session files of each book apart
+  const sessionBook = props.bookNode?.bookMainUrl || "";
+  useEffect(() => {
+    codeRunner.setSessionBook(sessionBook);
+    // eslint-disable-next-line
+  }, [sessionBook]);
+
   // results changed
   useEffect(() => {
     if (
@@ -459,7 +469,7 @@ const Challenge = (props: ChallengeProps) => {
       },
       "save-code": (code: string) => {
         if ((code || code === "") && props.uid) {
-          localStorage.setItem("code-" + encodeURIComponent(props.uid), code);
+          progressStore.saveCode(props.uid, code);
         }
       },
       "download-code": () => pyEditorRef.current?.download(),
@@ -477,6 +487,12 @@ const Challenge = (props: ChallengeProps) => {
       "canvas-keydown": (data: React.KeyboardEvent) =>
         codeRunner?.keyDown(data),
       "canvas-keyup": (data: React.KeyboardEvent) => codeRunner?.keyUp(data),
+      "canvas-mouse": (
+        type: "down" | "up" | "move",
+        x: number,
+        y: number,
+        button: number
+      ) => codeRunner?.mouse(type, x, y, button),
       "hide-turtle": () => {
         if (typ === ChallengeTypes.canvas) {
           setTyp(nodeTyp);
@@ -508,6 +524,9 @@ const Challenge = (props: ChallengeProps) => {
         props.onBookReloadRequested();
       },
       "has-made-edit": () => setHasEdited(true),
+      "code-changed": (code: string) => {
+        codeRunner?.prefetchImports(code);
+      },
       "has-changed-session-files": () => {
         setSessionFiles([...sessionFiles]); // trigger UI update
       },
@@ -605,6 +624,7 @@ const Challenge = (props: ChallengeProps) => {
         isGuideMinimised={isGuideMinimised}
         onGuideDisplayToggle={() => setGuideMinimised((x) => !x)}
       />
+      <BridgeStatsOverlay codeRunner={codeRunner} />
       {showBookUpload && props.onBookUploaded ? (
         <BookUploadModal
           visible={true}
@@ -16,9 +16,16 @@ type Actions = {
   "handle-code-upload": (file: File) => void;
   "canvas-keydown": (data: React.KeyboardEvent) => void;
   "canvas-keyup": (data: React.KeyboardEvent) => void;
+  "canvas-mouse": (
+    type: "down" | "up" | "move",
+    x: number,
+    y: number,
+    button: number
+  ) => void;
   "hide-turtle": () => void;
   reload: () => void;
   "has-made-edit": () => void;
+  "code-changed": (code: string) => void;
   "has-changed-session-files": () => void;
   "save-node": () => void;
   "save-book": (book: string) => void;
@@ -52,8 +59,15 @@ const wrapActions = (r: React.MutableRefObject<any>) => {
       r.current["canvas-keydown"](data),
     "canvas-keyup": (data: React.KeyboardEvent) =>
       r.current["canvas-keyup"](data),
+    "canvas-mouse": (
+      type: "down" | "up" | "move",
+      x: number,
+      y: number,
+      button: number
+    ) => r.current["canvas-mouse"](type, x, y, button),
     reload: () => r.current.reload(),
     "has-made-edit": () => r.current["has-made-edit"](),
+    "code-changed": (code: string) => r.current["code-changed"](code),
     "has-changed-session-files": () => r.current["has-changed-session-files"](),
     "save-node": () => r.current["save-node"](),
     "save-book": (book: string) => r.current["save-book"](book),
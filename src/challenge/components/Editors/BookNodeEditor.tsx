@@ -20,7 +20,6 @@ import {
 } from "@mui/material";
 import BookNodeModel from "../../../models/BookNodeModel";
 import ChallengeTypes from "../../../models/ChallengeTypes";
-import { AdditionalFile } from "../../../models/AdditionalFiles";
 
 import InputDialog from "../../../components/dialogs/InputDialog";
 
@@ -31,6 +30,12 @@ import TestEditor, { TestEditorHandle } from "./TestEditor/TestEditor";
 import type BookNodeEditorHandle from "../../refs/BookNodeEditorHandle";
 import AddIcon from "@mui/icons-material/Add";
 import TaskAltIcon from "@mui/icons-material/TaskAlt";
+import CoverageReport from "./TestEditor/CoverageReport";
+import { CodeRunnerRef } from "../../../coderunner/useCodeRunner";
+import {
+  AdditionalFile,
+  AdditionalFilesContents,
+} from "../../../models/AdditionalFiles";
 
 type BookNodeEditorProps = {
   onChange?: () => void;
@@ -39,6 +44,10 @@ type BookNodeEditorProps = {
   hasEdited?: boolean;
   guideMd?: string;
   starterCode?: string;
+  // for the solution coverage report
+  codeRunner?: CodeRunnerRef;
+  additionalFilesLoaded?: AdditionalFilesContents;
+  getSolution?: () => string | undefined;
 };
 
 const BookNodeEditor = React.forwardRef<
@@ -59,6 +68,9 @@ const BookNodeEditor = React.forwardRef<
   const [isSessionFilesAllowed, setisSessionFilesAllowed] = useState<boolean>(
     props.bookNode.isSessionFilesAllowed || false,
   );
+  const [isVirtualClock, setIsVirtualClock] = useState<boolean>(
+    props.bookNode.isVirtualClock || false,
+  );
   const [additionalFiles, setAdditionalFiles] = useState<AdditionalFile[]>([]);
 
   // visual state
@@ -72,6 +84,7 @@ const BookNodeEditor = React.forwardRef<
     setIsExample(props.bookNode.isExample || false);
     setIsAssessment(props.bookNode.isAssessment || false);
     setisSessionFilesAllowed(props.bookNode.isSessionFilesAllowed || false);
+    setIsVirtualClock(props.bookNode.isVirtualClock || false);
     setAdditionalFiles(props.bookNode.additionalFiles || []);
   }, [props.bookNode]);
 
@@ -88,6 +101,7 @@ const BookNodeEditor = React.forwardRef<
       isExample: isExample && typ !== "parsons",
       isAssessment: isAssessment && typ !== "parsons",
       isSessionFilesAllowed,
+      isVirtualClock,
       additionalFiles,
       tests: testEditor.current
         ? testEditor.current.getValue()
@@ -187,6 +201,22 @@ const BookNodeEditor = React.forwardRef<
                   label="Allow session files"
                 />
               </Tooltip>
+              <Tooltip title="Virtual clock: when testing, time.sleep() returns immediately and advances a simulated clock that time.time(), time.monotonic() and datetime.now() read, so programs that wait or measure time are graded instantly and the same way every time.">
+                <FormControlLabel
+                  control={
+                    <Checkbox
+                      style={{ padding: 0 }}
+                      checked={isVirtualClock}
+                      value={isVirtualClock}
+                      onChange={(e) => {
+                        setIsVirtualClock(e.target.checked);
+                        props.onChange?.();
+                      }}
+                    />
+                  }
+                  label="Virtual clock"
+                />
+              </Tooltip>
             </Stack>
             <Stack
               direction={"row"}
@@ -280,6 +310,20 @@ const BookNodeEditor = React.forwardRef<
                   <h4 style={{ margin: 0 }}>Test cases</h4>
                 </Box>
                 <Box sx={{ height: "calc(100% - 40px)", overflowY: "auto" }}>
+                  {props.codeRunner && props.getSolution ? (
+                    <CoverageReport
+                      codeRunner={props.codeRunner}
+                      bookNode={props.bookNode}
+                      additionalFiles={additionalFiles}
+                      additionalFilesLoaded={props.additionalFilesLoaded || {}}
+                      getSolution={props.getSolution}
+                      getTests={() =>
+                        testEditor.current?.getValue() ||
+                        props.bookNode.tests ||
+                        []
+                      }
+                    />
+                  ) : null}
                   <TestEditor
                     challengeId={props.bookNode.id || ("" as string)}
                     ref={testEditor}
@@ -131,6 +131,7 @@ const PyEditor = React.forwardRef<PyEditorHandle, PyEditorProps>(
     const handleEditorDidMount: OnMount = (editor, monaco) => {
       editorRef.current = editor;
       monacoRef.current = monaco;
+      challengeContext?.actions["code-changed"](editor.getValue());
 
       canRunCondition.current = editor.createContextKey("canRun", false);
       canStepCondition.current = editor.createContextKey("canStep", false);
@@ -260,10 +261,11 @@ const PyEditor = React.forwardRef<PyEditorHandle, PyEditorProps>(
       });
     };
 
-    const handleEditorChange = () => {
+    const handleEditorChange = (value?: string) => {
       if ((breakpointList.current?.length || 0) > 0) {
         updateEditorDecorations();
       }
+      challengeContext?.actions["code-changed"](value || "");
     };
 
     const updateEditorDecorations = () => {
@@ -180,6 +180,7 @@ const SessionFileView = ({ file }: SessionFileViewProps) => {
         }}
         onChange={(e) => {
           file.data = e.target.value;
+          file.version = undefined; // new contents, to be sent to Python again
         }}
         defaultValue={
           file.data instanceof ArrayBuffer || file.data instanceof Uint8Array
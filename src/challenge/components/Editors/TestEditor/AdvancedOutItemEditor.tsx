@@ -28,7 +28,7 @@ type AdvancedOutItemEditorProps = {
   onDel?: () => void;
 };
 
-const typs = ["+", "-", "c+", "c-", "f+", "f-", "s+", "s-", "t"];
+const typs = ["+", "-", "c+", "c-", "f+", "f-", "s+", "s-", "t", "d", "g"];
 const TYP_TO_READABLE: Map<string, string> = new Map([
   ["+", "output matches (+)"],
   ["-", "output doesn't match (-)"],
@@ -39,6 +39,8 @@ const TYP_TO_READABLE: Map<string, string> = new Map([
   ["s+", "statement result contains (s+)"],
   ["s-", "statement result doesn't contain (s-)"],
   ["t", "Turtle test (t)"],
+  ["d", "Canvas drawing test (d)"],
+  ["g", "Generated inputs test (g)"],
 ]);
 
 const AdvancedOutItemEditor = React.forwardRef<
@@ -56,6 +58,7 @@ const AdvancedOutItemEditor = React.forwardRef<
   );
   const [fileName, setFileName] = useState<string>(props.req.filename || "");
   const [statement, setStatement] = useState<string>(props.req.statement || "");
+  const [generator, setGenerator] = useState<string>(props.req.generator || "");
 
   useEffect(() => {
     setPattern(props.req.pattern);
@@ -69,6 +72,7 @@ const AdvancedOutItemEditor = React.forwardRef<
     setTyp(props.req.typ || "+");
     setFileName(props.req.filename || "");
     setStatement(props.req.statement || "");
+    setGenerator(props.req.generator || "");
   }, [
     props.req.pattern,
     props.req.regex,
@@ -77,6 +81,7 @@ const AdvancedOutItemEditor = React.forwardRef<
     props.req.typ,
     props.req.filename,
     props.req.statement,
+    props.req.generator,
   ]);
 
   const getValue = () => {
@@ -90,8 +95,15 @@ const AdvancedOutItemEditor = React.forwardRef<
       ignore: aignore ? (aignore as AdvancedOutRequirementIgnore) : undefined,
       count: count === -1 ? undefined : count,
       typ: typ[0] === "+" ? undefined : typ,
-      filename: typ[0] === "f" || typ[0] === "t" ? fileName : undefined,
+      filename:
+        typ[0] === "f" || typ[0] === "t" || typ[0] === "d" || typ[0] === "g"
+          ? fileName
+          : undefined,
       statement: typ[0] === "s" ? statement : undefined,
+      generator: typ[0] === "g" ? generator : undefined,
+      // not editable here (yet), but kept when the test is edited
+      tolerance: typ[0] === "d" ? props.req.tolerance : undefined,
+      ordered: typ[0] === "d" ? props.req.ordered : undefined,
     };
   };
 
@@ -125,7 +137,10 @@ const AdvancedOutItemEditor = React.forwardRef<
             inputProps={{ style: { fontFamily: "monospace" } }}
           />
         )}
-        {typ[0] === "f" || typ[0] === "t" ? (
+        {typ[0] === "f" ||
+        typ[0] === "t" ||
+        typ[0] === "d" ||
+        typ[0] === "g" ? (
           <TextField
             value={fileName || ""}
             placeholder="File name"
@@ -139,6 +154,25 @@ const AdvancedOutItemEditor = React.forwardRef<
             inputProps={{ style: { fontFamily: "monospace", padding: 0 } }}
             sx={{ width: "98%", paddingLeft: "20px" }}
           />
+        ) : null}
+        {typ[0] === "g" ? (
+          <Tooltip title="One line per input: int 1 100, float 0 1 2 (2 decimals), word red green blue. Or Python code defining generate(random) that returns the list of inputs">
+            <TextField
+              value={generator}
+              placeholder="Input generator"
+              multiline
+              minRows={2}
+              onChange={(e) => {
+                setGenerator(e.target.value);
+                props.onChange?.();
+              }}
+              size="small"
+              variant="filled"
+              hiddenLabel={true}
+              inputProps={{ style: { fontFamily: "monospace", padding: 0 } }}
+              sx={{ width: "98%", paddingLeft: "20px" }}
+            />
+          </Tooltip>
         ) : typ[0] === "s" ? (
           <TextField
             value={statement || ""}
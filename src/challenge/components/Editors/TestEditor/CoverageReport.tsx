@@ -0,0 +1,176 @@
+import { useState } from "react";
+import {
+  Box,
+  Button,
+  Chip,
+  CircularProgress,
+  Stack,
+  Tooltip,
+  Typography,
+} from "@mui/material";
+import RuleIcon from "@mui/icons-material/Rule";
+
+import { TestCases, TestResults } from "../../../../models/Tests";
+import BookNodeModel from "../../../../models/BookNodeModel";
+import {
+  AdditionalFile,
+  AdditionalFilesContents,
+} from "../../../../models/AdditionalFiles";
+import { SolutionCoverage } from "../../../../coderunner/WorkerDtos";
+import {
+  CodeRunnerRef,
+  CodeRunnerState,
+} from "../../../../coderunner/useCodeRunner";
+
+type CoverageReportProps = {
+  codeRunner: CodeRunnerRef;
+  bookNode: BookNodeModel;
+  additionalFiles: AdditionalFile[];
+  additionalFilesLoaded: AdditionalFilesContents;
+  getSolution: () => string | undefined;
+  getTests: () => TestCases;
+};
+
+type Report = {
+  coverage: SolutionCoverage;
+  results: TestResults;
+};
+
+const percentage = (part: number, whole: number) =>
+  whole ? `${Math.round((part / whole) * 100)}%` : "-";
+
+// Runs the solution against the test cases being edited and shows what of it
+// they leave untested, and which test cases add nothing to the others
+const CoverageReport = (props: CoverageReportProps) => {
+  const [report, setReport] = useState<Report | null>(null);
+  const [error, setError] = useState<string | null>(null);
+  const [isRunning, setIsRunning] = useState(false);
+
+  const solution = props.getSolution();
+  const impediment = !solution
+    ? "Add a solution first"
+    : props.codeRunner.state !== CodeRunnerState.READY
+      ? "Python is busy"
+      : undefined;
+
+  const runCoverage = () => {
+    const code = props.getSolution();
+    if (!code) {
+      return;
+    }
+    setIsRunning(true);
+    setError(null);
+    props.codeRunner
+      .coverage(
+        code,
+        props.getTests(),
+        props.additionalFiles,
+        props.additionalFilesLoaded,
+        props.bookNode,
+      )
+      .then(({ coverage, results }) => {
+        if (coverage) {
+          setReport({ coverage, results });
+        } else {
+          setReport(null);
+          setError("Coverage could not be worked out for this solution");
+        }
+      })
+      .catch((e) => setError(`${e}`))
+      .finally(() => setIsRunning(false));
+  };
+
+  const coverage = report?.coverage;
+  const covered = coverage
+    ? coverage.lines.length - coverage.uncovered.length
+    : 0;
+  // reached, but only ever one way; unreached ones show as uncovered lines
+  const partialBranches =
+    coverage?.branches.filter((b) => b.body !== b.skip) ?? [];
+  const branchDirections = coverage
+    ? coverage.branches.reduce(
+        (sum, b) => sum + (b.body ? 1 : 0) + (b.skip ? 1 : 0),
+        0,
+      )
+    : 0;
+
+  return (
+    <Box sx={{ marginBottom: "10px" }}>
+      <Tooltip
+        title={
+          impediment ||
+          "Run the solution against every test case and report which lines and branches they cover"
+        }
+      >
+        <span>
+          <Button
+            size="small"
+            startIcon={
+              isRunning ? <CircularProgress size={16} /> : <RuleIcon />
+            }
+            disabled={isRunning || !!impediment}
+            onClick={runCoverage}
+          >
+            Solution coverage
+          </Button>
+        </span>
+      </Tooltip>
+      {error ? (
+        <Typography variant="body2" color="error">
+          {error}
+        </Typography>
+      ) : null}
+      {coverage ? (
+        <Stack spacing={0.5} sx={{ paddingLeft: "8px" }}>
+          <Typography variant="body2">
+            Lines: {covered}/{coverage.lines.length} (
+            {percentage(covered, coverage.lines.length)}), branches:{" "}
+            {branchDirections}/{coverage.branches.length * 2} (
+            {percentage(branchDirections, coverage.branches.length * 2)})
+          </Typography>
+          {coverage.uncovered.length > 0 ? (
+            <Typography variant="body2">
+              Lines no test runs: {coverage.uncovered.join(", ")}
+            </Typography>
+          ) : null}
+          {partialBranches.length > 0 ? (
+            <Typography variant="body2">
+              Branches taken one way only:{" "}
+              {partialBranches
+                .map(
+                  (b) =>
+                    `line ${b.line} (never ${b.body ? "skipped" : "entered"})`,
+                )
+                .join(", ")}
+            </Typography>
+          ) : null}
+          {coverage.tests.map((test, i) => {
+            const result = report?.results[i];
+            return (
+              <Stack key={i} direction="row" spacing={1} alignItems="center">
+                <Typography variant="body2">
+                  Test {i + 1}: {test.lines.length} lines, {test.unique} covered
+                  by no other test
+                </Typography>
+                {result && !result.outcome ? (
+                  <Chip
+                    size="small"
+                    color="error"
+                    label={`solution fails: ${result.err ?? "incorrect"}`}
+                  />
+                ) : null}
+                {test.redundant ? (
+                  <Tooltip title="Everything this test covers is covered by other tests; it is a candidate for removal">
+                    <Chip size="small" color="warning" label="adds no coverage" />
+                  </Tooltip>
+                ) : null}
+              </Stack>
+            );
+          })}
+        </Stack>
+      ) : null}
+    </Box>
+  );
+};
+
+export default CoverageReport;
@@ -1,6 +1,9 @@
-const imageCache = new Map<string, HTMLImageElement>();
+import { AnyContext2D, loadImage } from "../../../../utils/canvasTools";
 
-const processCanvasCommand = (context: CanvasRenderingContext2D, cmd: any) => {
+const imageCache = new Map<string, HTMLImageElement | ImageBitmap>();
+
+// runs on the page, or in the canvas worker on an OffscreenCanvas
+const processCanvasCommand = (context: AnyContext2D, cmd: any) => {
   try {
     if (cmd.clearCanvas) {
       context.clearRect(0, 0, context.canvas.width, context.canvas.height);
@@ -171,13 +174,13 @@ const processCanvasCommand = (context: CanvasRenderingContext2D, cmd: any) => {
           // serve from local cache
           context.drawImage(cachedImg, cmd.dx, cmd.dy, cmd.dwidth, cmd.dheight);
         } else {
-          // create new image
-          const img = new Image();
-          img.onload = function () {
-            context.drawImage(img, cmd.dx, cmd.dy, cmd.dwidth, cmd.dheight);
-            imageCache.set(cmd.imageURI, img);
-          };
-          img.src = cmd.imageURI;
+          // load new image
+          loadImage(cmd.imageURI)
+            .then((img) => {
+              context.drawImage(img, cmd.dx, cmd.dy, cmd.dwidth, cmd.dheight);
+              imageCache.set(cmd.imageURI, img);
+            })
+            .catch(() => console.log("error loading image", cmd.imageURI));
         }
         break;
       case "reset":
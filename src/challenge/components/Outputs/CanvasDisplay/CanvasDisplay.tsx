@@ -1,5 +1,6 @@
 import React, {
   useContext,
+  useLayoutEffect,
   useRef,
   useImperativeHandle,
   useState,
@@ -13,14 +14,105 @@ import {
 } from "./TurtleController";
 
 import ChallengeContext from "../../../ChallengeContext";
+import { canTransferCanvas, loadImage } from "../../../../utils/canvasTools";
+import {
+  CanvasWorkerData,
+  CanvasWorkerResponse,
+} from "../../../../coderunner/WorkerDtos";
 
 type CanvasDisplayHandle = {
   turtleReset: (virtual?: boolean) => void;
   runTurtleCommand: (id: number, msg: string) => Promise<string | void>;
   runTurtleClearup: () => void;
   runCommand: (commands: any[]) => void;
+  // port for the Python worker to send canvas commands to directly, if
+  // drawing happens in a worker
+  connect: () => MessagePort | null;
+};
+
+// Drawing happens in a canvas worker where the browser can hand a canvas to
+// one, and on the page otherwise. A canvas can be handed over only once, so
+// its worker is kept while the element stays in the document (effects run
+// twice in development)
+type CanvasRenderer = {
+  worker: Worker;
+  turtleRequests: Map<
+    number,
+    { res: (data: string | void) => void; rej: (e: Error) => void }
+  >;
+  nextRequestId: number;
+};
+
+const renderers = new WeakMap<HTMLCanvasElement, CanvasRenderer>();
+
+const startRenderer = (canvasEl: HTMLCanvasElement) => {
+  let renderer = renderers.get(canvasEl);
+  if (renderer) {
+    return renderer;
+  }
+  const worker = new Worker(
+    new URL("../../../../workers/canvasworker.ts?worker", import.meta.url),
+    {
+      type: "classic",
+    }
+  );
+  const offscreen = canvasEl.transferControlToOffscreen();
+  const init: CanvasWorkerData = { cmd: "init", canvas: offscreen };
+  worker.postMessage(init, [offscreen]);
+  const newRenderer: CanvasRenderer = {
+    worker,
+    turtleRequests: new Map(),
+    nextRequestId: 0,
+  };
+  worker.onmessage = (e: MessageEvent<CanvasWorkerResponse>) => {
+    if (e.data.cmd === "load-image") {
+      loadImageForWorker(worker, e.data.requestId, e.data.url);
+      return;
+    }
+    const request = newRenderer.turtleRequests.get(e.data.requestId);
+    newRenderer.turtleRequests.delete(e.data.requestId);
+    if (e.data.error) {
+      request?.rej(new Error(e.data.error));
+    } else {
+      request?.res(e.data.data);
+    }
+  };
+  renderers.set(canvasEl, newRenderer);
+  return newRenderer;
+};
+
+// loaded like on the page: relative to the document, and cross-origin images
+// without CORS headers allowed (they taint the canvas)
+const loadImageForWorker = (worker: Worker, requestId: number, url: string) =>
+  loadImage(url)
+    .then((img) => createImageBitmap(img))
+    .then((bitmap) => {
+      const msg: CanvasWorkerData = { cmd: "image", requestId, bitmap };
+      worker.postMessage(msg, [bitmap]);
+    })
+    .catch((err) => {
+      const msg: CanvasWorkerData = {
+        cmd: "image",
+        requestId,
+        error: err?.message || `Error loading image ${url}`,
+      };
+      worker.postMessage(msg);
+    });
+
+const stopRenderer = (canvasEl: HTMLCanvasElement) => {
+  const renderer = renderers.get(canvasEl);
+  if (renderer && !canvasEl.isConnected) {
+    renderer.worker.terminate();
+    renderer.turtleRequests.forEach(({ rej }) =>
+      rej(new Error("Canvas closed"))
+    );
+    renderers.delete(canvasEl);
+  }
 };
 
+const post = (renderer: CanvasRenderer, data: CanvasWorkerData) =>
+  renderer.worker.postMessage(data);
+
 type CanvasDisplayProps = {
   initialWidth: number;
   initialHeight: number;
@@ -37,8 +129,11 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
     });
 
     const [zoom, setZoom] = useState(1);
+    // the element's size can't be set once it is handed over, so it is kept
+    const [offscreen, setOffscreen] = useState(canTransferCanvas);
 
     const canvasEl = useRef<HTMLCanvasElement>(null);
+    const renderer = useRef<CanvasRenderer | null>(null);
     const divEl = useRef<HTMLDivElement | null>(null);
     const challengeContext = useContext(ChallengeContext);
     const turtleUsed = useRef<boolean>(false);
@@ -53,13 +148,45 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
       turtleRetained.current = false;
     };
 
+    // before the handle is set, so nothing draws on the element before it is
+    // handed over
+    useLayoutEffect(() => {
+      const el = canvasEl.current;
+      if (!offscreen || !el) {
+        return;
+      }
+      try {
+        renderer.current = startRenderer(el);
+      } catch (e) {
+        console.log("Drawing on the page, canvas worker failed", e);
+        setOffscreen(false);
+        return;
+      }
+      return () => {
+        renderer.current = null;
+        // once React is done with the element
+        setTimeout(() => stopRenderer(el));
+      };
+    }, [offscreen]);
+
     // used to reset turtle (also to specified virtual mode)
     const turtleReset = (virtual = false) => {
-      setVirtualMode(canvasEl.current as HTMLCanvasElement, virtual);
+      if (renderer.current) {
+        post(renderer.current, { cmd: "turtle-reset", virtual });
+      } else {
+        setVirtualMode(canvasEl.current as HTMLCanvasElement, virtual);
+      }
       turtleUsed.current = false;
       turtleRetained.current = false;
     };
 
+    const runTurtleInWorker = (r: CanvasRenderer, id: number, action: any) =>
+      new Promise<string | void>((res, rej) => {
+        const requestId = r.nextRequestId++;
+        r.turtleRequests.set(requestId, { res, rej });
+        post(r, { cmd: "turtle", requestId, id, action });
+      });
+
     const runTurtleCommand = (id: number, msg: string) => {
       turtleUsed.current = true;
       const turtleObj = JSON.parse(msg);
@@ -73,6 +200,15 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
           width: turtleObj.width,
           height: turtleObj.height,
         });
+        if (renderer.current) {
+          post(renderer.current, {
+            cmd: "turtle-setup",
+            id,
+            width: turtleObj.width,
+            height: turtleObj.height,
+          });
+          return Promise.resolve();
+        }
         resizeScreen(turtleObj.width, turtleObj.height);
         processTurtleCommand(
           id,
@@ -81,6 +217,9 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
         );
         return Promise.resolve();
       }
+      if (renderer.current) {
+        return runTurtleInWorker(renderer.current, id, turtleObj);
+      }
       return processTurtleCommand(
         id,
         turtleObj,
@@ -89,6 +228,10 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
     };
 
     const runCommand = (commands: any[]) => {
+      if (renderer.current) {
+        post(renderer.current, { cmd: "draw", commands });
+        return;
+      }
       const canvas: HTMLCanvasElement = document.getElementById(
         "canvasDisplay"
       ) as HTMLCanvasElement;
@@ -100,6 +243,31 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
       }
     };
 
+    // a new channel for each run, its other end goes to the canvas worker
+    const connect = () => {
+      if (!renderer.current) {
+        return null;
+      }
+      const channel = new MessageChannel();
+      const data: CanvasWorkerData = { cmd: "port", port: channel.port1 };
+      renderer.current.worker.postMessage(data, [channel.port1]);
+      return channel.port2;
+    };
+
+    // report mouse events in canvas pixel coordinates (undoing zoom)
+    const onMouse =
+      (type: "down" | "up" | "move") => (event: React.MouseEvent) => {
+        const canvas = canvasEl.current;
+        if (!canvas) return;
+        const rect = canvas.getBoundingClientRect();
+        if (!rect.width || !rect.height) return;
+        // the element's size stays as it was when it was handed over
+        const { width, height } = dimensions;
+        const x = ((event.clientX - rect.left) * width) / rect.width;
+        const y = ((event.clientY - rect.top) * height) / rect.height;
+        challengeContext?.actions["canvas-mouse"](type, x, y, event.button);
+      };
+
     const onWheel = (event: WheelEvent) => {
       if (event && event.ctrlKey) {
         if (event.deltaY > 0) {
@@ -112,6 +280,7 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
     };
 
     useImperativeHandle(ref, () => ({
+      connect,
       runCommand,
       runTurtleCommand,
       runTurtleClearup: turtleClearup,
@@ -136,11 +305,14 @@ const CanvasDisplay = React.forwardRef<CanvasDisplayHandle, CanvasDisplayProps>(
       >
         <canvas
           id="canvasDisplay"
-          width={dimensions.width}
-          height={dimensions.height}
+          width={offscreen ? props.initialWidth : dimensions.width}
+          height={offscreen ? props.initialHeight : dimensions.height}
           ref={canvasEl}
           onKeyDown={challengeContext?.actions["canvas-keydown"]}
           onKeyUp={challengeContext?.actions["canvas-keyup"]}
+          onMouseDown={onMouse("down")}
+          onMouseUp={onMouse("up")}
+          onMouseMove={onMouse("move")}
           tabIndex={1}
           style={{
             outline: "none",
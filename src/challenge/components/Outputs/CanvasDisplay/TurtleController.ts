@@ -1,3 +1,13 @@
+import {
+  AnyCanvas,
+  AnyContext2D,
+  canvasToDataURL,
+  createCanvas,
+  getContext2D,
+  loadImage,
+  nextFrame,
+} from "../../../../utils/canvasTools";
+
 const TURTLE_SPEED_DEFAULT = 0.5;
 const TURTLE_LOGO_START_HEADING = 90;
 const TURTLE_IMG_SRC =
@@ -8,26 +18,24 @@ const TURTLE_UNIT_MOVE_STEP = 6;
 const TURTLE_TIME_PAUSE = 30;
 const TURTLE_ANGLE_ADJUSTMENT = 6;
 
+// draws on the page, or in the canvas worker on an OffscreenCanvas
 class SimpleTurtle {
   originalTurleImageData = new Uint8ClampedArray([]);
   originalTurleImageSize = [0, 0];
 
-  turtleImage: HTMLImageElement | undefined = undefined;
-  canvas: HTMLCanvasElement;
+  turtleImage: AnyCanvas | undefined = undefined;
+  canvas: AnyCanvas;
   state: TurtleState;
-  ctx: CanvasRenderingContext2D | null;
-  canvasBackground: HTMLCanvasElement;
-  ctxBackground: CanvasRenderingContext2D | null;
+  ctx: AnyContext2D | null;
+  canvasBackground: AnyCanvas;
+  ctxBackground: AnyContext2D | null;
   alive: boolean = true;
   fillPath: Path2D | null;
 
-  constructor(canvas: HTMLCanvasElement, state: TurtleState) {
-    let baseImage = new Image();
-    baseImage.onload = () => {
-      let canvas = document.createElement("canvas");
-      let context = canvas.getContext("2d")!;
-      canvas.width = baseImage.width;
-      canvas.height = baseImage.height;
+  constructor(canvas: AnyCanvas, state: TurtleState) {
+    loadImage(TURTLE_IMG_SRC).then((baseImage) => {
+      let canvas = createCanvas(baseImage.width, baseImage.height);
+      let context = getContext2D(canvas)!;
       context.drawImage(baseImage, 0, 0);
       const data = context.getImageData(
         0,
@@ -42,14 +50,11 @@ class SimpleTurtle {
       this.originalTurleImageSize = [baseImage.width, baseImage.height];
 
       this.updateTurtleImage();
-    };
-    baseImage.src = TURTLE_IMG_SRC;
+    });
     this.canvas = canvas;
-    this.ctx = canvas.getContext("2d");
-    this.canvasBackground = document.createElement("canvas");
-    this.canvasBackground.width = canvas.width;
-    this.canvasBackground.height = canvas.height;
-    this.ctxBackground = this.canvasBackground.getContext("2d");
+    this.ctx = getContext2D(canvas);
+    this.canvasBackground = createCanvas(canvas.width, canvas.height);
+    this.ctxBackground = getContext2D(this.canvasBackground);
     this.fillPath = null;
     this.state = state;
     this.state.x = this.canvas.width / 2;
@@ -65,7 +70,7 @@ class SimpleTurtle {
       if (this.state.speed === -1 || this.state.virtual) {
         this.driveto(x, y, this.state.heading).catch(e).then(r);
       } else {
-        window.requestAnimationFrame(() =>
+        nextFrame(() =>
           this.driveto(x, y, this.state.heading).catch(e).then(r)
         );
       }
@@ -87,7 +92,7 @@ class SimpleTurtle {
       if (this.state.speed === -1 || this.state.virtual) {
         this.driveto(new_x, new_y, this.state.heading).catch(e).then(r);
       } else {
-        window.requestAnimationFrame(() =>
+        nextFrame(() =>
           this.driveto(new_x, new_y, this.state.heading).catch(e).then(r)
         );
       }
@@ -97,13 +102,11 @@ class SimpleTurtle {
   private updateTurtleImage() {
     if (!this.originalTurleImageData.length) return;
 
-    if (!this.turtleImage) {
-      this.turtleImage = new Image();
-    }
-    let canvas = document.createElement("canvas");
-    let context = canvas.getContext("2d")!;
-    canvas.width = this.originalTurleImageSize[0];
-    canvas.height = this.originalTurleImageSize[1];
+    let canvas = createCanvas(
+      this.originalTurleImageSize[0],
+      this.originalTurleImageSize[1]
+    );
+    let context = getContext2D(canvas)!;
     context.fillStyle = this.state.pencolor;
     context.fillRect(0, 0, 1, 1);
     context.fillStyle = this.state.fillcolor;
@@ -133,7 +136,8 @@ class SimpleTurtle {
     }
     context.putImageData(imgData, 0, 0);
 
-    this.turtleImage.src = canvas.toDataURL();
+    // drawn from directly, no need to encode it as an image
+    this.turtleImage = canvas;
   }
 
   private drawLineTo(x: number, y: number) {
@@ -202,7 +206,7 @@ class SimpleTurtle {
         return this.driveAlong(arrLocs);
       } else {
         return new Promise<void>((r, e) => {
-          window.requestAnimationFrame(() => {
+          nextFrame(() => {
             setTimeout(
               () => this.driveAlong(arrLocs).catch(e).then(r),
               TURTLE_TIME_PAUSE * this.state.speed
@@ -272,7 +276,7 @@ class SimpleTurtle {
         return this.driveto(x, y, heading);
       } else {
         return new Promise<void>((r, e) => {
-          window.requestAnimationFrame(() => {
+          nextFrame(() => {
             setTimeout(
               () => this.driveto(x, y, heading).catch(e).then(r),
               TURTLE_TIME_PAUSE * this.state.speed
@@ -296,7 +300,7 @@ class SimpleTurtle {
         this.state.heading = new_heading;
         this.driveto(this.state.x, this.state.y, new_heading).catch(e).then(r);
       } else {
-        window.requestAnimationFrame(() =>
+        nextFrame(() =>
           this.driveto(this.state.x, this.state.y, new_heading).catch(e).then(r)
         );
       }
@@ -316,7 +320,7 @@ class SimpleTurtle {
         this.state.heading = angle;
         this.driveto(this.state.x, this.state.y, angle).catch(e).then(r);
       } else {
-        window.requestAnimationFrame(() =>
+        nextFrame(() =>
           this.driveto(this.state.x, this.state.y, angle).catch(e).then(r)
         );
       }
@@ -442,12 +446,12 @@ type TurtleState = {
 var turtles = new Map<number, SimpleTurtle>();
 var turtleMode: "standard" | "logo" = "standard";
 var virtualMode: boolean = false;
-var virtualCanvas: HTMLCanvasElement = document.createElement("canvas");
+var virtualCanvas: AnyCanvas = createCanvas(300, 150);
 
 const processTurtleCommand = (
   id: number,
   cmd: any,
-  canvas: HTMLCanvasElement
+  canvas: AnyCanvas
 ) => {
   if (cmd.action === "stop") {
     turtles.forEach((t) => t.stop());
@@ -455,9 +459,7 @@ const processTurtleCommand = (
   }
 
   if (cmd.action === "dump") {
-    return virtualMode
-      ? Promise.resolve(virtualCanvas?.toDataURL())
-      : Promise.resolve(canvas.toDataURL());
+    return canvasToDataURL(virtualMode ? virtualCanvas : canvas);
   }
 
   if (cmd.action === "mode") {
@@ -569,7 +571,7 @@ const processTurtleCommand = (
   }
 };
 
-const initialiseTurtle: (canvas: HTMLCanvasElement) => SimpleTurtle = (
+const initialiseTurtle: (canvas: AnyCanvas) => SimpleTurtle = (
   canvas
 ) => {
   let turtle = new SimpleTurtle(canvas, {
@@ -587,21 +589,19 @@ const initialiseTurtle: (canvas: HTMLCanvasElement) => SimpleTurtle = (
   return turtle;
 };
 
-const clearTurtlesAndCanvas = (canvas: HTMLCanvasElement) => {
+const clearTurtlesAndCanvas = (canvas: AnyCanvas) => {
   turtles.clear();
-  canvas.getContext("2d")?.clearRect(0, 0, 1000, 1000);
+  getContext2D(canvas)?.clearRect(0, 0, 1000, 1000);
   if (virtualMode) {
-    virtualCanvas.getContext("2d")?.clearRect(0, 0, 1000, 1000);
+    getContext2D(virtualCanvas)?.clearRect(0, 0, 1000, 1000);
   }
 };
 
-const setVirtualMode = (canvas: HTMLCanvasElement, virtual: boolean) => {
+const setVirtualMode = (canvas: AnyCanvas, virtual: boolean) => {
   clearTurtlesAndCanvas(canvas);
   virtualMode = virtual;
   if (virtualMode) {
-    virtualCanvas = document.createElement("canvas");
-    virtualCanvas.width = 500;
-    virtualCanvas.height = 400;
+    virtualCanvas = createCanvas(500, 400);
     clearTurtlesAndCanvas(virtualCanvas);
   }
 };
@@ -610,7 +610,7 @@ const resizeScreen = (width: number, height: number) => {
   if (virtualMode) {
     virtualCanvas.width = width;
     virtualCanvas.height = height;
-    virtualCanvas.getContext("2d")?.clearRect(0, 0, width, height);
+    getContext2D(virtualCanvas)?.clearRect(0, 0, width, height);
   }
 };
 
@@ -3,9 +3,13 @@ import Console from "../../../components/Console";
 import ChallengeContext from "../../ChallengeContext";
 import { Box, Button, Stack } from "@mui/material";
 import ErrorIcon from "@mui/icons-material/Error";
+import { ConsoleBlock } from "../../../utils/ConsoleBuffer";
 
 const ChallengeConsole = (props: {
   content: string;
+  blocks: ConsoleBlock[];
+  truncatedLines: number;
+  onDownloadLog: () => void;
   inputEnabled: boolean;
   ready: boolean;
 }) => {
@@ -71,7 +75,9 @@ const ChallengeConsole = (props: {
       )}
       <Console
         highlightColour={props.inputEnabled ? "orange" : undefined}
-        content={props.content}
+        blocks={props.blocks}
+        truncatedLines={props.truncatedLines}
+        onDownloadLog={props.onDownloadLog}
         isInputEnabled={props.inputEnabled}
         onInput={(input) => {
           challengeContext?.actions["input-entered"](input);
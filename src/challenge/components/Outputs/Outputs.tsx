@@ -167,6 +167,9 @@ const ChallengeOutputs = React.forwardRef<
       content: (
         <ChallengeConsole
           content={props.codeRunner.consoleText}
+          blocks={props.codeRunner.consoleBlocks}
+          truncatedLines={props.codeRunner.consoleTruncatedLines}
+          onDownloadLog={props.codeRunner.downloadConsoleLog}
           inputEnabled={
             props.codeRunner.state === CodeRunnerState.AWAITING_INPUT
           }
@@ -216,6 +219,12 @@ const ChallengeOutputs = React.forwardRef<
             }}
             bookNode={props.bookNode}
             hasEdited={props.hasEdited}
+            codeRunner={props.codeRunner}
+            additionalFilesLoaded={props.additionalFilesLoaded}
+            getSolution={() =>
+              solutionFileEditorRef.current?.getSolutionValue() ??
+              props.solutionFile
+            }
           />
         </React.Suspense>
       ),
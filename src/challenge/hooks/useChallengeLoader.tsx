@@ -11,6 +11,7 @@ import {
 } from "../../models/AdditionalFiles";
 import { absolutisePath } from "../../utils/pathTools";
 import EditableBookStore from "../../book/utils/EditableBookStore";
+import progressStore from "../../book/utils/ProgressStore";
 import { Solution } from "../../models/BookNodeModel";
 
 type HookProps = {
@@ -33,7 +34,11 @@ const useChallengeLoader = (props: HookProps) => {
   const [isLoadingGuide, setIsLoadingGuide] = useState<boolean>(true);
   const [starterCode, setStarterCode] = useState<string | undefined>(undefined);
   const [savedCode, setSavedCode] = useState<string | undefined>(undefined);
-  const [isLoadingCode, setIsLoadingCode] = useState<boolean>(true);
+  // uid whose saved code has been looked up; until it matches, the editor
+  // must not take input that the saved code would then overwrite
+  const [savedCodeUid, setSavedCodeUid] = useState<string | null>(null);
+  const [isLoadingStarterCode, setIsLoadingStarterCode] =
+    useState<boolean>(true);
   const [additionalFilesLoaded, setAdditionalFilesLoaded] =
     useState<AdditionalFilesContents>({});
   const [solutionFile, setSolutionFile] = useState<string | undefined>(
@@ -60,8 +65,9 @@ const useChallengeLoader = (props: HookProps) => {
   const forceReload = useCallback(() => {
     forceReloadReplacesCode.current = true;
     additionalFilesLoadedRef.current = {}; // flush additional files cache
+    props.fetcher.clearCache?.();
     setReloadCtr((ctr) => ctr + 1);
-  }, []);
+  }, [props.fetcher]);
   const forceReloadReplacesCode = useRef<boolean>(false);
 
   // GUIDE
@@ -91,8 +97,8 @@ const useChallengeLoader = (props: HookProps) => {
   }, [props.guidePath, props.fetcher, reloadCtr]);
 
   // CODE
-  const loadSavedCode = (uid: string, typ?: ChallengeTypes) => {
-    let savedCode = localStorage.getItem("code-" + encodeURIComponent(uid));
+  const loadSavedCode = async (uid: string, typ?: ChallengeTypes) => {
+    let savedCode = await progressStore.loadCode(uid);
     if (typ !== "parsons" && savedCode) {
       return savedCode;
     }
@@ -112,17 +118,34 @@ const useChallengeLoader = (props: HookProps) => {
   };
 
   useEffect(() => {
-    setSavedCode(
-      props.isEditing ? undefined : loadSavedCode(props.uid, props.typ)
-    );
+    setSavedCode(undefined);
+    setSavedCodeUid(null);
+    if (props.isEditing) {
+      return;
+    }
+    let current = true;
+    loadSavedCode(props.uid, props.typ)
+      .catch((e) => {
+        console.log("Error loading saved code", e);
+        return undefined;
+      })
+      .then((code) => {
+        if (current) {
+          setSavedCode(code);
+          setSavedCodeUid(props.uid);
+        }
+      });
+    return () => {
+      current = false;
+    };
   }, [props.uid, props.typ, props.isEditing]);
 
   useEffect(() => {
-    setIsLoadingCode(true);
+    setIsLoadingStarterCode(true);
     fetchCode(props.codePath, authContextRef.current, props.fetcher).then(
       ({ code, codePath }) => {
         if (codePath === codePathRef.current) {
-          setIsLoadingCode(false);
+          setIsLoadingStarterCode(false);
           setStarterCode(code);
           if (forceReloadReplacesCode.current) {
             setSavedCode(code);
@@ -133,6 +156,9 @@ const useChallengeLoader = (props: HookProps) => {
     );
   }, [props.codePath, props.fetcher, reloadCtr]);
 
+  const isLoadingCode =
+    isLoadingStarterCode || (!props.isEditing && savedCodeUid !== props.uid);
+
   // additional files
   const fetchAdditionalFiles = async (
     additionalFiles: AdditionalFiles,
@@ -140,29 +166,43 @@ const useChallengeLoader = (props: HookProps) => {
     fetcher: IBookFetcher,
     store: EditableBookStore | null = null
   ) => {
-    const files = (additionalFiles || []).map((file) => file.filename);
-    for (let fileName of files) {
-      if (!(fileName in additionalFilesLoadedRef.current)) {
+    const files = (additionalFiles || [])
+      .map((file) => file.filename)
+      .filter((fileName) => !(fileName in additionalFilesLoadedRef.current));
+    if (files.length === 0) {
+      return;
+    }
+    // all at once, and shown together
+    const contents = await Promise.all(
+      files.map(async (fileName) => {
         let absFileName = absolutisePath(
           fileName,
           fetcher.getBookPathAbsolute()
         );
         let content = "ERROR LOADING FILE; file not available";
-        let response = await fetcher.fetch(absFileName, authContext);
-        if (!response.ok) {
-          // try to make the file
-          let newContents = "add new file contents here\n";
-          if (store) {
-            store.store.save(newContents, `edit://edit/${absFileName}`);
-            content = newContents;
+        try {
+          let response = await fetcher.fetch(absFileName, authContext);
+          if (!response.ok) {
+            // try to make the file
+            let newContents = "add new file contents here\n";
+            if (store) {
+              store.store.save(newContents, `edit://edit/${absFileName}`);
+              content = newContents;
+            }
+          } else {
+            content = await response.text();
           }
-        } else {
-          content = await response.text();
+        } catch (e) {
+          // one missing file shouldn't keep the others from loading
+          console.log("Error loading additional file", fileName, e);
         }
-        additionalFilesLoadedRef.current[fileName] = content;
-        setAdditionalFilesLoaded({ ...additionalFilesLoadedRef.current });
-      }
-    }
+        return content;
+      })
+    );
+    files.forEach((fileName, i) => {
+      additionalFilesLoadedRef.current[fileName] = contents[i];
+    });
+    setAdditionalFilesLoaded({ ...additionalFilesLoadedRef.current });
   };
 
   useEffect(() => {
@@ -10,14 +10,71 @@ import { keyToVMCode } from "../utils/keyTools";
 import CodeRunnerState from "./CodeRunnerState";
 import DebugSetup from "./DebugSetup";
 import { SessionFile } from "../models/SessionFile";
+import { InputEventType, createEventQueue, pushEvent } from "./EventQueue";
+import SessionFileSync, {
+  SessionFileSyncPayload,
+  transferableCopy,
+} from "./SessionFileSync";
+import serviceWorkerCacheStats from "../utils/serviceWorkerCacheStats";
+import TestResultCache, { isDeterministic } from "./TestResultCache";
+import { hashParts } from "../utils/hashTools";
+import LazyFileStore, {
+  LazyFileMount,
+  isLazyCandidate,
+} from "./LazyFileStore";
 import {
+  BridgeStats,
+  RunMemoryStats,
+  SolutionCoverage,
+  WorkerBridgeStatsDto,
   WorkerDebugDto,
   WorkerDrawTurtleExampleDto,
+  WorkerInitDto,
   WorkerRunDto,
+  WorkerSessionBookDto,
   WorkerTestDto,
 } from "./WorkerDtos";
 
 const STANDALONE_BUILD = import.meta.env.VITE_STANDALONE_BUILD === "true";
+const PREFETCH_DELAY = 1000; // ms after the last edit
+// how long a soft interrupt may take before a warm standby is swapped in
+const STANDBY_SWAP_DELAY = 250; // ms
+
+// A standby worker costs a second Pyodide instance (memory) and its start up
+// (CPU). Both can be tuned per browser, e.g. on low end school laptops
+const standbyBudget = () => {
+  const deviceMemory: number = (navigator as any).deviceMemory ?? 8; // GB
+  const minMemory = Number(localStorage.getItem("standby-worker-min-memory"));
+  const delay = Number(localStorage.getItem("standby-worker-delay"));
+  return {
+    enabled:
+      localStorage.getItem("standby-worker") !== "off" &&
+      deviceMemory >= (minMemory > 0 ? minMemory : 4),
+    // wait this long after the active worker is ready before warming
+    delay: delay > 0 ? delay : 5000,
+  };
+};
+
+// how much a single run may grow the worker's memory before it is stopped;
+// "off" for no limit
+const runMemoryLimit = () => {
+  const limit = localStorage.getItem("run-memory-limit-mb");
+  if (limit === "off") {
+    return 0;
+  }
+  return (Number(limit) > 0 ? Number(limit) : 512) * 1024 * 1024; // bytes
+};
+
+const formatMegabytes = (bytes?: number) =>
+  `${((bytes ?? 0) / 1048576).toFixed(0)} MB`;
+
+const MEMORY_TREND_LENGTH = 50; // runs
+// Wasm memory never shrinks, so a worker that grew this much since its first
+// run is replaced. Can be tuned per browser
+const recycleGrowth = () => {
+  const growth = Number(localStorage.getItem("worker-recycle-growth-mb"));
+  return (growth > 0 ? growth : 512) * 1024 * 1024; // bytes
+};
 
 interface ICodeRunner {
   // publis state
@@ -27,6 +84,8 @@ interface ICodeRunner {
   // events to subscribe to
   onStateChanged: Event<CodeRunnerState>;
   onDraw: Event<any[], Promise<void>>;
+  // port to the canvas worker, for the Python worker to draw on directly
+  onCanvasPort: Event<void, MessagePort | null>;
   onTurtleReset: Event<boolean>;
   onTurtle: AsyncEvent<{ id: number; msg: string }, string | undefined>;
   onTurtleClearup: Event<void>;
@@ -72,9 +131,21 @@ interface ICodeRunner {
   // send keyboard events to the running code
   keyDown: (data: React.KeyboardEvent) => void;
   keyUp: (data: React.KeyboardEvent) => void;
+  mouse: (
+    type: "down" | "up" | "move",
+    x: number,
+    y: number,
+    button: number
+  ) => void;
 
   // install pip dependencies
   installDependencies: (deps: string[]) => void;
+
+  // start loading packages the code imports, e.g. while the user is typing
+  prefetchImports: (code: string) => void;
+
+  // the book whose session files Python keeps (see SessionFolderStore.ts)
+  setSessionBook: (book: string) => void;
 }
 
 type WorkerResponse = {
@@ -90,15 +161,52 @@ type Data2 = {
   msg: string;
 };
 
+type InitDoneData = {
+  // how long the worker took to start Python, and whether from a memory snapshot
+  startup?: { mode: "snapshot" | "full"; time: number };
+  // Pyodide and init.py version, null if it couldn't be determined
+  runtime?: string | null;
+};
+
 type DebugFinishedData = {
   reason: string;
   updatedSessionFiles: SessionFile[];
+  memory?: RunMemoryStats;
+  peak?: number; // bytes, when stopped by the memory limit
 };
 
 type TestFinishedData = {
   results: TestResults;
   bookNode: BookNodeModel;
   code: string;
+  memory?: RunMemoryStats;
+  coverage?: SolutionCoverage; // for coverage runs
+  // session files the tests changed, which the worker dropped
+  invalidatedSessionFiles?: string[];
+};
+
+type PreparedFiles = {
+  initCode: string;
+  sync: SessionFileSyncPayload | null;
+  lazyFiles: LazyFileMount[];
+};
+
+// a worker with its own shared buffers
+type WorkerHandle = {
+  worker: Worker;
+  interruptBuffer: Uint8Array | null;
+  keyDownBuffer: Uint8Array | null;
+  eventBuffer: Int32Array | null;
+  initialised: boolean;
+  installing: boolean;
+  deps: Set<string>;
+  // what a standby restored, acknowledged once it becomes the active worker
+  restoredFiles: SessionRestoredData["files"] | null;
+};
+
+type SessionRestoredData = {
+  book: string;
+  files: Pick<SessionFile, "filename" | "version">[];
 };
 
 type PromiseResRej<T> = {
@@ -113,6 +221,7 @@ class PythonCodeRunner implements ICodeRunner {
 
   public onStateChanged = new Event<CodeRunnerState>();
   public onDraw = new Event<any[], Promise<void>>();
+  public onCanvasPort = new Event<void, MessagePort | null>();
   public onTurtleReset = new Event<boolean>();
   public onTurtle = new AsyncEvent<
     { id: number; msg: string },
@@ -128,16 +237,40 @@ class PythonCodeRunner implements ICodeRunner {
   private worker: Worker | null = null;
   private interruptBuffer: Uint8Array | null = null;
   private keyDownBuffer: Uint8Array | null = null;
+  private eventBuffer: Int32Array | null = null;
   private workerFullyInitialised = false;
+  private active: WorkerHandle | null = null;
+  // fully initialised spare worker, swapped in when the active one is killed
+  private standby: WorkerHandle | null = null;
+  private standbyTimeout: ReturnType<typeof setTimeout> | null = null;
+  private installedDeps = new Set<string>();
   private forceStopping = false;
+  // what the worker's session/ folder holds
+  private sessionFileSync = new SessionFileSync();
+  // large files, served to the worker on demand by the service worker
+  private lazyFileStore = new LazyFileStore();
+  // memory after each run of the active worker, oldest first
+  public memoryTrend: RunMemoryStats[] = [];
+  private recycleRequested = false;
+  // pending requests for the bridge statistics of the last run
+  private bridgeStatsRequests: ((stats: BridgeStats | null) => void)[] = [];
 
   // testing session
   private testPromiseResRej: PromiseResRej<TestFinishedData> | null = null; // active test promise
+  private testResultCache = new TestResultCache();
+  private testCacheKey: string | null = null; // of the running test
+  private runtimeVersion: string | null = null;
 
   // debug session
   private debugPromiseResRej: PromiseResRej<DebugFinishedData> | null = null; // active debug promise
   private currentFixedUserInput: string[] | undefined = undefined;
 
+  // import prefetching, debounced while typing
+  private prefetchTimeout: ReturnType<typeof setTimeout> | null = null;
+  private prefetchCode = "";
+  private sessionBook: string | null = null;
+  private lastPrefetchedCode = "";
+
   // turtle example session
   private turtleExamplePromiseResRej: PromiseResRej<string> | null = null; // active turtle example promise
 
@@ -188,8 +321,9 @@ class PythonCodeRunner implements ICodeRunner {
       this.testPromiseResRej.rej("Test cancelled");
     }
     return new Promise<TestFinishedData>((res, rej) => {
-      this.testPromiseResRej = { res, rej };
-      this.runTest(
+      const request = { res, rej };
+      this.testPromiseResRej = request;
+      this.cacheKeyForTest(
         code,
         tests,
         additionalFiles,
@@ -197,10 +331,119 @@ class PythonCodeRunner implements ICodeRunner {
         bookNode,
         sessionFiles,
         isSessionFilesAllowed
+      )
+        .catch((e) => {
+          console.log("Error hashing test", e);
+          return null;
+        })
+        .then(async (key) => {
+          const cached = key ? await this.testResultCache.get(key) : null;
+          if (this.testPromiseResRej !== request) {
+            return; // cancelled meanwhile
+          }
+          if (cached) {
+            res({ results: cached, bookNode, code });
+            return;
+          }
+          this.testCacheKey = key;
+          this.runTest(
+            code,
+            tests,
+            additionalFiles,
+            additionalFilesLoaded,
+            bookNode,
+            sessionFiles,
+            isSessionFilesAllowed
+          );
+        });
+    });
+  };
+
+  // runs the solution against the test cases, recording which of its lines
+  // and branches each one covers (for authors, never cached)
+  public coverage = (
+    solution: string,
+    tests: TestCases,
+    additionalFiles: AdditionalFile[] | undefined,
+    additionalFilesLoaded: AdditionalFilesContents,
+    bookNode: BookNodeModel
+  ) => {
+    if (this.testPromiseResRej) {
+      this.testPromiseResRej.rej("Test cancelled");
+    }
+    return new Promise<TestFinishedData>((res, rej) => {
+      this.testPromiseResRej = { res, rej };
+      this.testCacheKey = null;
+      this.runTest(
+        solution,
+        tests,
+        additionalFiles,
+        additionalFilesLoaded,
+        bookNode,
+        [],
+        false,
+        true
       );
     });
   };
 
+  // everything that decides the results of a test run; null if they may differ
+  // between runs (randomness, time, turtle drawing on the page)
+  private cacheKeyForTest = async (
+    code: string,
+    tests: TestCases,
+    additionalFiles: AdditionalFile[] | undefined,
+    additionalFilesLoaded: AdditionalFilesContents,
+    bookNode: BookNodeModel,
+    sessionFiles: SessionFile[],
+    isSessionFilesAllowed?: boolean
+  ) => {
+    if (!this.runtimeVersion || !crypto.subtle) {
+      return null;
+    }
+    const outs = tests.flatMap((test) =>
+      test.out instanceof Array ? test.out : []
+    );
+    if (outs.some((out) => out.typ === "t")) {
+      return null;
+    }
+    // additional files and the solution files tests refer to
+    const fileNames = [
+      ...(additionalFiles || []).map((file) => file.filename),
+      ...outs.flatMap((out) => (out.filename ? [out.filename] : [])),
+    ];
+    const files = fileNames.map((name) => [
+      name,
+      additionalFilesLoaded[name] ?? "",
+    ]);
+    const session = isSessionFilesAllowed ? sessionFiles : [];
+    const sources = [
+      code,
+      ...files.map(([, content]) => content),
+      ...session
+        .filter((file) => file.filename.endsWith(".py"))
+        .map((file) =>
+          typeof file.data === "string"
+            ? file.data
+            : new TextDecoder().decode(file.data)
+        ),
+    ];
+    if (!isDeterministic(sources)) {
+      return null;
+    }
+    return hashParts([
+      this.runtimeVersion,
+      code,
+      JSON.stringify(tests),
+      JSON.stringify(files),
+      JSON.stringify({
+        virtualClock: !!bookNode.isVirtualClock,
+        virtualClockStart: bookNode.virtualClockStart ?? null,
+      }),
+      ...session.flatMap((file) => [file.filename, file.data]),
+    ]);
+  };
+
   public drawTurtleExample = (
     additionalFilesLoaded: AdditionalFilesContents,
     bookNode: BookNodeModel
@@ -236,6 +479,59 @@ class PythonCodeRunner implements ICodeRunner {
     return `with open("${filename}", "w") as f:f.write(r"""${content} """)\n`;
   };
 
+  // small files are posted to the worker (or written by init code), large ones
+  // are mounted lazily. If the lazy store is unavailable, everything is copied
+  private prepareFiles = async (
+    additionalFiles: AdditionalFile[] | undefined,
+    additionalFilesLoaded: AdditionalFilesContents | undefined,
+    sessionFiles: SessionFile[],
+    isSessionFilesAllowed?: boolean
+  ): Promise<PreparedFiles> => {
+    const isLarge = (file: AdditionalFile) =>
+      !!additionalFilesLoaded &&
+      isLazyCandidate(additionalFilesLoaded[file.filename] ?? "");
+    const largeFiles = (additionalFiles || []).filter(isLarge);
+    let initCode =
+      this.additionalCodeForFiles(
+        additionalFiles?.filter((file) => !isLarge(file)),
+        additionalFilesLoaded
+      ) || "";
+    const sync = isSessionFilesAllowed
+      ? await this.sessionFileSync.prepare(sessionFiles)
+      : null;
+    const lazy = [
+      ...largeFiles.map((file) => ({
+        path: file.filename,
+        data: additionalFilesLoaded![file.filename],
+      })),
+      ...(sync?.lazy || []).map((file) => ({
+        path: `session/${file.filename}`,
+        data: file.data,
+        version: file.version,
+      })),
+    ];
+    let lazyFiles: LazyFileMount[] = [];
+    try {
+      lazyFiles = await this.lazyFileStore.prepare(lazy);
+    } catch (e) {
+      console.log("Lazy file store unavailable, copying files instead", e);
+      initCode +=
+        this.additionalCodeForFiles(largeFiles, additionalFilesLoaded) || "";
+      for (const file of sync?.lazy || []) {
+        const copy = transferableCopy(file);
+        sync!.changed.push(copy);
+        sync!.transfer.push((copy.data as Uint8Array).buffer);
+      }
+    }
+    if (sync) {
+      this.lazyFileStore.retain([
+        ...largeFiles.map((file) => file.filename),
+        ...sync.fileNames.map((name) => `session/${name}`),
+      ]);
+    }
+    return { initCode, sync, lazyFiles };
+  };
+
   private runDebug = (
     code: string,
     mode: "debug" | "run",
@@ -255,26 +551,36 @@ class PythonCodeRunner implements ICodeRunner {
       this.interruptBuffer[0] = 0;
     }
 
-    const additionalCode = this.additionalCodeForFiles(
-      additionalFiles,
-      additionalFilesLoaded
-    );
-
     navigator.serviceWorker.controller?.postMessage({ cmd: "ps-prerun" });
     this.currentFixedUserInput = fixedUserInput?.split("\n");
     this.debugContext = undefined;
     this.onTurtleReset.fire(false);
-    const cmd: WorkerDebugDto | WorkerRunDto = {
-      cmd: mode,
-      code: code,
-      initCode: additionalCode,
-      breakpoints:
-        dbgSetup?.breakpoints === undefined ? null : dbgSetup?.breakpoints,
-      watches: dbgSetup?.watches === undefined ? null : dbgSetup?.watches,
-      sessionFiles: sessionFiles,
-      isSessionFilesAllowed: isSessionFilesAllowed,
-    };
-    this.worker?.postMessage(cmd);
+    this.prepareFiles(
+      additionalFiles,
+      additionalFilesLoaded,
+      sessionFiles,
+      isSessionFilesAllowed
+    ).then(({ initCode, sync, lazyFiles }) => {
+      const canvasPort = this.onCanvasPort.fire() || undefined;
+      const cmd: WorkerDebugDto | WorkerRunDto = {
+        cmd: mode,
+        code: code,
+        initCode: initCode,
+        breakpoints:
+          dbgSetup?.breakpoints === undefined ? null : dbgSetup?.breakpoints,
+        watches: dbgSetup?.watches === undefined ? null : dbgSetup?.watches,
+        sessionFiles: sync?.changed ?? null,
+        sessionFileNames: sync?.fileNames,
+        isSessionFilesAllowed: isSessionFilesAllowed,
+        lazyFiles: lazyFiles,
+        memoryLimit: runMemoryLimit(),
+        canvasPort,
+      };
+      const transfer: Transferable[] = sync?.transfer ?? [];
+      this.worker?.postMessage(cmd, {
+        transfer: canvasPort ? [...transfer, canvasPort] : transfer,
+      });
+    });
     this.state =
       mode === "debug"
         ? CodeRunnerState.RUNNING_WITH_DEBUGGER
@@ -296,17 +602,85 @@ class PythonCodeRunner implements ICodeRunner {
       return;
     }
 
+    deps.forEach((dep) => {
+      this.installedDeps.add(dep);
+      this.active?.deps.add(dep);
+    });
     this.worker.postMessage({
       cmd: "install-deps",
       deps,
     });
     this.state = CodeRunnerState.RUNNING;
     this.onStateChanged.fire(this.state);
+    if (this.standby) {
+      this.syncStandbyDeps(this.standby);
+    }
+  };
+
+  public setSessionBook = (book: string) => {
+    if (book === this.sessionBook) {
+      return;
+    }
+    this.sessionBook = book;
+    // the workers swap their session folders for the book's
+    this.sessionFileSync.reset();
+    const msg: WorkerSessionBookDto = { cmd: "session-book", book };
+    this.worker?.postMessage(msg);
+    if (this.standby) {
+      this.standby.restoredFiles = null;
+      this.standby.worker.postMessage(msg);
+    }
+  };
+
+  public prefetchImports = (code: string) => {
+    this.prefetchCode = code;
+    if (this.prefetchTimeout) {
+      clearTimeout(this.prefetchTimeout);
+    }
+    this.prefetchTimeout = setTimeout(() => {
+      this.prefetchTimeout = null;
+      this.postPrefetch();
+    }, PREFETCH_DELAY);
+  };
+
+  // also called once the worker is up, for code typed while it was loading
+  private postPrefetch = () => {
+    const code = this.prefetchCode;
+    if (
+      !code ||
+      !this.worker ||
+      this.state === CodeRunnerState.LOADING ||
+      this.state === CodeRunnerState.RESTARTING_WORKER ||
+      code === this.lastPrefetchedCode
+    ) {
+      return;
+    }
+    this.lastPrefetchedCode = code;
+    this.worker.postMessage({ cmd: "prefetch-imports", code });
+    if (this.standby?.initialised) {
+      this.standby.worker.postMessage({ cmd: "prefetch-imports", code });
+    }
   };
 
+  // crossings between Python and the page during the last finished run
+  public bridgeStats = () =>
+    new Promise<BridgeStats | null>((res) => {
+      if (!this.worker) {
+        res(null);
+        return;
+      }
+      this.bridgeStatsRequests.push(res);
+      this.worker.postMessage({
+        cmd: "bridge-stats",
+      } as WorkerBridgeStatsDto);
+    });
+
   public kill = () => {
     if (this.forceStopping) return;
     this.forceStopping = true;
+    // with a warm standby there is little point waiting for a soft interrupt
+    const delay =
+      this.standby && this.isWarm(this.standby) ? STANDBY_SWAP_DELAY : 2000;
     setTimeout(() => {
       // hopefully, the worker will have stopped by 2s, but if not, we'll restart it properly
       if (this.forceStopping) {
@@ -316,19 +690,25 @@ class PythonCodeRunner implements ICodeRunner {
         this.state = CodeRunnerState.READY;
         this.onStateChanged.fire(this.state);
       }
-    }, 2000);
+    }, delay);
     this.restartWorker(true, "Interrupted");
   };
 
   public input = (input: string, dbgSetup?: DebugSetup) => {
+    // everything typed or pasted so far is sent in one go, split by lines.
+    // Python consumes the first line now and queues the rest locally
+    // (echoing each one as it is consumed), so later input() calls
+    // don't need a round trip
+    const lines = input.split("\n");
     navigator.serviceWorker.controller?.postMessage({
       cmd: "ps-input-resp",
-      data: input,
+      data: lines[0],
+      lines: lines,
       breakpoints:
         dbgSetup?.breakpoints === undefined ? null : dbgSetup?.breakpoints,
       watches: dbgSetup?.watches,
     });
-    this.onPrint.fire(input + "\n");
+    this.onPrint.fire(lines[0] + "\n");
     this.state = CodeRunnerState.RUNNING;
     this.onStateChanged.fire(this.state);
   };
@@ -373,11 +753,33 @@ class PythonCodeRunner implements ICodeRunner {
   };
 
   private actions = {
-    "init-done": () => {
+    "init-done": ({ startup, runtime }: InitDoneData) => {
+      this.runtimeVersion = runtime ?? null;
+      if (startup) {
+        console.log(
+          `Python ready in ${startup.time} ms (${startup.mode} start)`
+        );
+        serviceWorkerCacheStats().then(
+          (stats) => stats && console.log("Service worker caches", stats)
+        );
+      }
       this.workerFullyInitialised = true;
       this.forceStopping = false;
+      if (this.active) {
+        this.active.initialised = true;
+      }
+      // reinstall what the previous worker had
+      const missingDeps = Array.from(this.installedDeps).filter(
+        (dep) => !this.active?.deps.has(dep)
+      );
       this.state = CodeRunnerState.READY;
-      this.onStateChanged.fire(this.state);
+      if (missingDeps.length) {
+        this.installDependencies(missingDeps);
+      } else {
+        this.onStateChanged.fire(this.state);
+      }
+      this.postPrefetch();
+      this.scheduleStandby();
     },
     print: ({ msg }: Data2) => {
       if (this.state !== CodeRunnerState.READY) {
@@ -387,6 +789,10 @@ class PythonCodeRunner implements ICodeRunner {
     draw: ({ msg }: Data2) => {
       this.onDraw.fire(JSON.parse(msg) as any[]);
     },
+    // the run draws in the canvas worker; the canvas has to be shown
+    "draw-direct": () => {
+      this.onDraw.fire([]);
+    },
     audio: ({ msg }: Data2) => {
       this.onAudio.fire(msg);
     },
@@ -407,29 +813,60 @@ class PythonCodeRunner implements ICodeRunner {
           });
         });
     },
-    "test-finished": ({ results, bookNode, code }: TestFinishedData) => {
+    "test-finished": ({
+      results,
+      bookNode,
+      code,
+      memory,
+      coverage,
+      invalidatedSessionFiles,
+    }: TestFinishedData) => {
       this.forceStopping = false;
-      this.testPromiseResRej?.res({ results, bookNode, code });
+      this.recordMemory(memory);
+      this.sessionFileSync.invalidate(invalidatedSessionFiles || []);
+      if (this.testCacheKey) {
+        this.testResultCache.put(this.testCacheKey, results);
+        this.testCacheKey = null;
+      }
+      this.testPromiseResRej?.res({ results, bookNode, code, coverage });
       this.state = CodeRunnerState.READY;
       this.onStateChanged.fire(this.state);
+      this.recycleIfRequested();
     },
-    "debug-finished": ({ reason, updatedSessionFiles }: DebugFinishedData) => {
+    "debug-finished": ({
+      reason,
+      updatedSessionFiles,
+      memory,
+      peak,
+    }: DebugFinishedData) => {
       this.forceStopping = false;
+      this.recordMemory(memory);
+      this.sessionFileSync.acknowledge(updatedSessionFiles);
       const msg = {
         ok: "Program finished ok. Press run/debug to run again...",
         error:
           "Interrupted by error. Check the error message, then press run/debug to execute again...",
         interrupt: "Interrupted...",
+        memory: `Memory limit exceeded (peak ${formatMegabytes(
+          peak
+        )}). The program was stopped, press run/debug to execute again...`,
       }[reason];
       this.onPrint.fire(`\n${msg}\n`);
       this.state = CodeRunnerState.READY;
       this.onStateChanged.fire(this.state);
       this.debugPromiseResRej?.res({ reason, updatedSessionFiles });
+      this.recycleIfRequested();
+    },
+    "session-restored": ({ book, files }: SessionRestoredData) => {
+      if (book === this.sessionBook) {
+        this.sessionFileSync.acknowledge(files);
+      }
     },
     input: () => {
       if (this.currentFixedUserInput) {
-        const input = this.currentFixedUserInput.shift();
-        this.input(input || "", {});
+        // hand over all remaining fixed inputs at once
+        const inputs = this.currentFixedUserInput.splice(0);
+        this.input(inputs.join("\n"), {});
       } else {
         this.state = CodeRunnerState.AWAITING_INPUT;
         this.onStateChanged.fire(this.state);
@@ -468,9 +905,15 @@ class PythonCodeRunner implements ICodeRunner {
     },
     "install-deps-finished": () => {
       this.forceStopping = false;
+      if (this.active) {
+        this.active.installing = false;
+      }
       this.state = CodeRunnerState.READY;
       this.onStateChanged.fire(this.state);
     },
+    "bridge-stats": (data: { stats: BridgeStats | null }) => {
+      this.resolveBridgeStats(data.stats);
+    },
     cls: () => {
       this.onCls.fire();
     },
@@ -483,7 +926,8 @@ class PythonCodeRunner implements ICodeRunner {
     additionalFilesLoaded: AdditionalFilesContents,
     bookNode: BookNodeModel,
     sessionFiles: SessionFile[] = [],
-    isSessionFilesAllowed?: boolean
+    isSessionFilesAllowed?: boolean,
+    coverage = false
   ) => {
     if (
       !code ||
@@ -497,49 +941,69 @@ class PythonCodeRunner implements ICodeRunner {
     if (this.interruptBuffer) {
       this.interruptBuffer[0] = 0;
     }
-    const additionalCode = this.additionalCodeForFiles(
-      additionalFiles,
-      additionalFilesLoaded
-    );
     const testsClone = structuredClone(tests);
     let hasTurtleTest = false;
+    let hasSolutionTest = false;
 
     (testsClone || []).forEach((test) => {
       if (test.out instanceof Array) {
         test.out.forEach((out) => {
-          if (out.filename) {
+          const isTurtle = out.typ === "t";
+          const isSolution = out.typ === "d" || out.typ === "g";
+          // the solution file of these is sent as its contents; f+ and f-
+          // name a file the program writes, which is checked by name
+          if (out.filename && (isTurtle || isSolution)) {
             out.filename = additionalFilesLoaded[out.filename];
           }
-          if (out.typ === "t") {
+          if (isTurtle) {
             hasTurtleTest = true;
           }
+          if (isSolution) {
+            hasSolutionTest = true;
+          }
         });
       }
     });
 
-    if (hasTurtleTest) {
-      // switch to virtual mode
-      this.onAwaitCanvas.fire().then(() => {
-        this.onTurtleReset.fire(true);
-        this.worker?.postMessage({
+    const prepared = this.prepareFiles(
+      additionalFiles,
+      additionalFilesLoaded,
+      sessionFiles,
+      isSessionFilesAllowed
+    );
+    const postTest = (
+      { initCode, sync, lazyFiles }: PreparedFiles,
+      tests: TestCases
+    ) => {
+      this.worker?.postMessage(
+        {
           cmd: "test",
           code: code,
-          initCode: additionalCode,
-          tests: testsClone,
+          initCode: initCode,
+          tests: tests,
           bookNode: bookNode,
-          sessionFiles: sessionFiles,
+          sessionFiles: sync?.changed ?? null,
+          sessionFileNames: sync?.fileNames,
           isSessionFilesAllowed: isSessionFilesAllowed,
-        } as WorkerTestDto);
+          lazyFiles: lazyFiles,
+          memoryLimit: runMemoryLimit(),
+          coverage: coverage,
+        } as WorkerTestDto,
+        { transfer: sync?.transfer ?? [] }
+      );
+    };
+    if (hasTurtleTest) {
+      // switch to virtual mode
+      Promise.all([prepared, this.onAwaitCanvas.fire()]).then(([files]) => {
+        this.onTurtleReset.fire(true);
+        postTest(files, testsClone);
       });
+    } else if (hasSolutionTest) {
+      // compared with the solution in the worker, no canvas needed
+      prepared.then((files) => postTest(files, testsClone));
     } else {
       // use the original tests for non turtle tests to avoid changing filenames to contents
-      this.worker.postMessage({
-        cmd: "test",
-        code: code,
-        initCode: additionalCode,
-        tests: tests,
-        bookNode: bookNode,
-      } as WorkerTestDto);
+      prepared.then((files) => postTest(files, tests));
     }
     this.state = CodeRunnerState.RUNNING;
     this.onStateChanged.fire(this.state);
@@ -609,53 +1073,207 @@ class PythonCodeRunner implements ICodeRunner {
     }
     this.worker?.terminate();
     this.forceStopping = false;
+    this.sessionFileSync.reset();
+    this.lastPrefetchedCode = ""; // packages are gone with the old worker
+    msg = msg || "";
 
+    // prefer the standby, even if it is still warming up
+    const next = this.standby || this.spawnWorker();
+    this.standby = null;
+    this.activateWorker(next);
+    if (next.restoredFiles) {
+      this.sessionFileSync.acknowledge(next.restoredFiles);
+    }
+    navigator.serviceWorker.controller?.postMessage({ cmd: "ps-reset" });
+    if (next.initialised) {
+      console.log("restartWorker: swapped in standby worker");
+      this.workerFullyInitialised = true;
+      this.state = next.installing
+        ? CodeRunnerState.RUNNING // until install-deps-finished
+        : CodeRunnerState.READY;
+      this.onStateChanged.fire(this.state);
+      this.onPrint.fire(msg);
+      this.postPrefetch();
+      this.scheduleStandby();
+      return;
+    }
     console.log("restartWorker");
-    this.worker = new Worker(
+    this.state = CodeRunnerState.RESTARTING_WORKER;
+    this.onStateChanged.fire(this.state);
+    this.onPrint.fire(msg);
+  };
+
+  private spawnWorker = (): WorkerHandle => {
+    const worker = new Worker(
       new URL("../workers/pyworker.ts?worker", import.meta.url),
       {
         type: "classic",
       }
     );
-    this.worker.postMessage({ cmd: "init", standalone: STANDALONE_BUILD });
-    this.worker.addEventListener(
-      "message",
-      (msg: MessageEvent<WorkerResponse>) => {
-        try {
-          // @ts-expect-error dynamic dispatch from worker
-          this.actions[msg.data.cmd](msg.data);
-        } catch (e) {
-          console.error(
-            `Error in code runner worker response for msg cmd "${msg.data.cmd}"`,
-            e
-          );
-        }
+    const handle: WorkerHandle = {
+      worker,
+      interruptBuffer: null,
+      keyDownBuffer: null,
+      eventBuffer: null,
+      initialised: false,
+      installing: false,
+      deps: new Set(),
+      restoredFiles: null,
+    };
+    worker.postMessage({
+      cmd: "init",
+      standalone: STANDALONE_BUILD,
+      sessionBook: this.sessionBook,
+    } as WorkerInitDto);
+    worker.addEventListener("message", (msg: MessageEvent<WorkerResponse>) => {
+      if (worker !== this.worker) {
+        this.onStandbyMessage(handle, msg.data);
+        return;
       }
-    );
-    let newInterruptBuffer: Uint8Array | null = null;
-    let newKeyDownBuffer: Uint8Array | null = null;
+      try {
+        // @ts-expect-error dynamic dispatch from worker
+        this.actions[msg.data.cmd](msg.data);
+      } catch (e) {
+        console.error(
+          `Error in code runner worker response for msg cmd "${msg.data.cmd}"`,
+          e
+        );
+      }
+    });
     if (window.crossOriginIsolated && window.SharedArrayBuffer) {
       console.log("Cross origin isolated with shared array buffer");
-      newInterruptBuffer = new Uint8Array(new window.SharedArrayBuffer(1));
-      newInterruptBuffer[0] = 0;
-      newKeyDownBuffer = new Uint8Array(new window.SharedArrayBuffer(256));
-      this.worker.postMessage({
+      handle.interruptBuffer = new Uint8Array(new window.SharedArrayBuffer(1));
+      handle.interruptBuffer[0] = 0;
+      handle.keyDownBuffer = new Uint8Array(new window.SharedArrayBuffer(256));
+      handle.eventBuffer = createEventQueue();
+      worker.postMessage({
         cmd: "setSharedBuffers",
-        interruptBuffer: newInterruptBuffer,
-        keyDownBuffer: newKeyDownBuffer,
+        interruptBuffer: handle.interruptBuffer,
+        keyDownBuffer: handle.keyDownBuffer,
+        eventBuffer: handle.eventBuffer,
       });
     } else {
       console.log(
         "Not cross origin isolated, so interrupt will be slow and keydowns will be ignored"
       );
     }
-    msg = msg || "";
-    this.interruptBuffer = newInterruptBuffer;
-    this.keyDownBuffer = newKeyDownBuffer;
-    this.state = CodeRunnerState.RESTARTING_WORKER;
-    this.onStateChanged.fire(this.state);
-    navigator.serviceWorker.controller?.postMessage({ cmd: "ps-reset" });
-    this.onPrint.fire(msg);
+    return handle;
+  };
+
+  private resolveBridgeStats = (stats: BridgeStats | null) => {
+    const requests = this.bridgeStatsRequests;
+    this.bridgeStatsRequests = [];
+    requests.forEach((res) => res(stats));
+  };
+
+  private activateWorker = (handle: WorkerHandle) => {
+    this.active = handle;
+    // the replaced worker won't answer
+    this.resolveBridgeStats(null);
+    this.memoryTrend = [];
+    this.recycleRequested = false;
+    this.worker = handle.worker;
+    this.interruptBuffer = handle.interruptBuffer;
+    this.keyDownBuffer = handle.keyDownBuffer;
+    this.eventBuffer = handle.eventBuffer;
+  };
+
+  // standby workers
+
+  private isWarm = (handle: WorkerHandle) =>
+    handle.initialised && !handle.installing;
+
+  private scheduleStandby = () => {
+    const budget = standbyBudget();
+    if (this.standby || this.standbyTimeout || !budget.enabled) {
+      return;
+    }
+    this.standbyTimeout = setTimeout(() => {
+      this.standbyTimeout = null;
+      // don't compete with the user's program for the CPU
+      if (this.standby || this.state !== CodeRunnerState.READY) {
+        this.scheduleStandby();
+        return;
+      }
+      this.standby = this.spawnWorker();
+    }, budget.delay);
+  };
+
+  // the standby gets the same packages as the active worker
+  private syncStandbyDeps = (handle: WorkerHandle) => {
+    if (!handle.initialised || handle.installing) {
+      return; // checked again once init or the current install is done
+    }
+    const missing = Array.from(this.installedDeps).filter(
+      (dep) => !handle.deps.has(dep)
+    );
+    if (!missing.length) {
+      return;
+    }
+    missing.forEach((dep) => handle.deps.add(dep));
+    handle.installing = true;
+    handle.worker.postMessage({ cmd: "install-deps", deps: missing });
+  };
+
+  private onStandbyMessage = (handle: WorkerHandle, data: WorkerResponse) => {
+    if (data.cmd === "init-done") {
+      handle.initialised = true;
+      if (this.prefetchCode) {
+        handle.worker.postMessage({
+          cmd: "prefetch-imports",
+          code: this.prefetchCode,
+        });
+      }
+    } else if (data.cmd === "install-deps-finished") {
+      handle.installing = false;
+    } else if (data.cmd === "session-restored") {
+      const { book, files } = data as SessionRestoredData;
+      if (book === this.sessionBook) {
+        handle.restoredFiles = files;
+      }
+    }
+    this.syncStandbyDeps(handle);
+    this.recycleIfRequested();
+  };
+
+  // memory recycling
+
+  private recordMemory = (memory?: RunMemoryStats) => {
+    if (!memory) {
+      return;
+    }
+    this.memoryTrend.push(memory);
+    if (this.memoryTrend.length > MEMORY_TREND_LENGTH) {
+      this.memoryTrend.shift();
+    }
+    const first = this.memoryTrend[0];
+    console.log(
+      `Run memory: ${formatMegabytes(memory.heap)} heap, ` +
+        `${memory.blocks} blocks, ${memory.objects} objects, ` +
+        `${memory.modules} modules, ${memory.unreachable} freed`
+    );
+    if (memory.heap - first.heap > recycleGrowth()) {
+      this.recycleRequested = true;
+    }
+  };
+
+  // replace a worker that grew too much once it is idle, preferably by a warm
+  // standby so the next run doesn't wait for a restart
+  private recycleIfRequested = () => {
+    if (!this.recycleRequested || this.state !== CodeRunnerState.READY) {
+      return;
+    }
+    const standbyPending = this.standby
+      ? !this.isWarm(this.standby)
+      : standbyBudget().enabled;
+    if (standbyPending) {
+      this.scheduleStandby();
+      return; // checked again once the standby is warm
+    }
+    console.log("Recycling worker after memory growth");
+    this.recycleRequested = false;
+    this.interruptBuffer = null; // replace the worker rather than interrupt it
+    this.restartWorker(true);
   };
 
   public keyDown = (data: React.KeyboardEvent) => {
@@ -663,6 +1281,9 @@ class PythonCodeRunner implements ICodeRunner {
       const code = keyToVMCode(data.key);
       if (code && code > 0 && code < 256) {
         this.keyDownBuffer[code] = 1;
+        if (this.eventBuffer) {
+          pushEvent(this.eventBuffer, InputEventType.KEY_DOWN, code);
+        }
       }
     }
   };
@@ -672,9 +1293,34 @@ class PythonCodeRunner implements ICodeRunner {
       const code = keyToVMCode(data.key);
       if (code && code > 0 && code < 256) {
         this.keyDownBuffer[code] = 0;
+        if (this.eventBuffer) {
+          pushEvent(this.eventBuffer, InputEventType.KEY_UP, code);
+        }
       }
     }
   };
+
+  public mouse = (
+    type: "down" | "up" | "move",
+    x: number,
+    y: number,
+    button: number
+  ) => {
+    if (this.eventBuffer) {
+      const eventType = {
+        down: InputEventType.MOUSE_DOWN,
+        up: InputEventType.MOUSE_UP,
+        move: InputEventType.MOUSE_MOVE,
+      }[type];
+      pushEvent(
+        this.eventBuffer,
+        eventType,
+        Math.round(x),
+        Math.round(y),
+        button
+      );
+    }
+  };
 }
 
 export {
@@ -0,0 +1,91 @@
+// Lock-free single-producer/single-consumer ring buffer of input events,
+// living in a SharedArrayBuffer shared between the page (producer) and the
+// Python worker (consumer).
+//
+// Layout (Int32Array):
+//   [0] head: number of events ever written (only the page writes this)
+//   [1] tail: number of events ever read (only the worker writes this)
+//   [2] dropped: number of events dropped because the queue was full
+//   [3] reserved
+//   [4..] EVENT_QUEUE_CAPACITY slots of EVENT_SIZE ints: type, a, b, c
+//
+// head and tail are free-running counters; (head - tail) | 0 is the fill level
+// even after they wrap around.
+
+const EVENT_QUEUE_CAPACITY = 256; // must be a power of two
+const EVENT_SIZE = 4;
+const HEADER_SIZE = 4;
+
+const HEAD = 0;
+const TAIL = 1;
+const DROPPED = 2;
+
+enum InputEventType {
+  KEY_DOWN = 1,
+  KEY_UP = 2,
+  MOUSE_DOWN = 3,
+  MOUSE_UP = 4,
+  MOUSE_MOVE = 5,
+}
+
+const createEventQueue = () => {
+  const bytes =
+    (HEADER_SIZE + EVENT_QUEUE_CAPACITY * EVENT_SIZE) *
+    Int32Array.BYTES_PER_ELEMENT;
+  return new Int32Array(new SharedArrayBuffer(bytes));
+};
+
+// producer side (page). Drops the event if the worker hasn't caught up.
+const pushEvent = (
+  queue: Int32Array,
+  type: InputEventType,
+  a = 0,
+  b = 0,
+  c = 0
+) => {
+  const head = Atomics.load(queue, HEAD);
+  const tail = Atomics.load(queue, TAIL);
+  if (((head - tail) | 0) >= EVENT_QUEUE_CAPACITY) {
+    Atomics.add(queue, DROPPED, 1);
+    return false;
+  }
+  const offset = HEADER_SIZE + (head & (EVENT_QUEUE_CAPACITY - 1)) * EVENT_SIZE;
+  queue[offset] = type;
+  queue[offset + 1] = a;
+  queue[offset + 2] = b;
+  queue[offset + 3] = c;
+  // publish the slot only after it has been fully written
+  Atomics.store(queue, HEAD, (head + 1) | 0);
+  return true;
+};
+
+// consumer side (worker). Returns a flat copy of [type, a, b, c, ...] for
+// every event since the last call
+const drainEvents = (queue: Int32Array) => {
+  const tail = Atomics.load(queue, TAIL);
+  const head = Atomics.load(queue, HEAD);
+  const count = (head - tail) | 0;
+  const out = new Int32Array(count * EVENT_SIZE);
+  for (let i = 0; i < count; i++) {
+    const offset =
+      HEADER_SIZE + ((tail + i) & (EVENT_QUEUE_CAPACITY - 1)) * EVENT_SIZE;
+    out.set(queue.subarray(offset, offset + EVENT_SIZE), i * EVENT_SIZE);
+  }
+  Atomics.store(queue, TAIL, head);
+  return out;
+};
+
+// forget everything queued so far, e.g. before a new run. Called by the consumer.
+const resetEventQueue = (queue: Int32Array) => {
+  Atomics.store(queue, TAIL, Atomics.load(queue, HEAD));
+  Atomics.store(queue, DROPPED, 0);
+};
+
+export {
+  InputEventType,
+  EVENT_SIZE,
+  createEventQueue,
+  pushEvent,
+  drainEvents,
+  resetEventQueue,
+};
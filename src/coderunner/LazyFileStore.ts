@@ -0,0 +1,88 @@
+import { SessionFile } from "../models/SessionFile";
+
+// Large data files are not copied into the worker's MEMFS. Instead they are put
+// into a page-side Cache API store, served by the service worker (pysw.js) under
+// /@lazy@/ with byte range support, and mounted in the worker as Emscripten lazy
+// files. Python's open()/read()/seek() then fetch 1 MiB blocks on demand.
+
+const LAZY_CACHE = "ps-lazy-files";
+const LAZY_FILE_THRESHOLD = 1024 * 1024; // bytes; smaller files are copied eagerly
+
+type LazyFileMount = {
+  path: string; // relative to the worker's working directory
+  url: string;
+  size: number;
+};
+
+const dataSize = (data: SessionFile["data"]) =>
+  typeof data === "string" ? data.length : data.byteLength;
+
+const canServeLazily = () =>
+  typeof caches !== "undefined" && !!navigator.serviceWorker?.controller;
+
+const isLazyCandidate = (data: SessionFile["data"]) =>
+  dataSize(data) >= LAZY_FILE_THRESHOLD && canServeLazily();
+
+class LazyFileStore {
+  // path -> url of the version currently in the cache
+  private stored = new Map<string, { url: string; data: unknown }>();
+  private nextId = 0;
+
+  // make sure every file is in the cache and return how to mount it
+  async prepare(
+    files: { path: string; data: SessionFile["data"]; version?: string }[]
+  ): Promise<LazyFileMount[]> {
+    if (!files.length) return [];
+    const cache = await caches.open(LAZY_CACHE);
+    return Promise.all(
+      files.map(async ({ path, data, version }) => {
+        const previous = this.stored.get(path);
+        // strings have no identity, so compare them by value (cheap when
+        // identical); a version stands for the contents
+        if (
+          previous &&
+          (previous.data === data ||
+            (version && previous.url === this.urlFor(path, version)))
+        ) {
+          this.stored.set(path, { url: previous.url, data });
+          return { path, url: previous.url, size: dataSize(data) };
+        }
+        const url = this.urlFor(
+          path,
+          version || `v${Date.now().toString(36)}-${this.nextId++}`
+        );
+        const blob = new Blob([data as BlobPart]);
+        await cache.put(
+          url,
+          new Response(blob, { headers: { "Content-Length": `${blob.size}` } })
+        );
+        if (previous && previous.url !== url) {
+          cache.delete(previous.url);
+        }
+        this.stored.set(path, { url, data });
+        return { path, url, size: blob.size };
+      })
+    );
+  }
+
+  private urlFor(path: string, version: string) {
+    return `/@lazy@/${encodeURIComponent(version)}/${encodeURIComponent(path)}`;
+  }
+
+  // drop cached files that are no longer mounted anywhere
+  async retain(paths: string[]) {
+    const keep = new Set(paths);
+    const stale = Array.from(this.stored.entries()).filter(
+      ([path]) => !keep.has(path)
+    );
+    if (!stale.length || typeof caches === "undefined") return;
+    const cache = await caches.open(LAZY_CACHE);
+    for (const [path, { url }] of stale) {
+      this.stored.delete(path);
+      cache.delete(url);
+    }
+  }
+}
+
+export default LazyFileStore;
+export { LazyFileMount, LAZY_CACHE, isLazyCandidate };
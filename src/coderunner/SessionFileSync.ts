@@ -0,0 +1,103 @@
+import { SessionFile } from "../models/SessionFile";
+import { isLazyCandidate } from "./LazyFileStore";
+import { hashParts } from "../utils/hashTools";
+
+// Page-side bookkeeping of which session file versions the worker already
+// has in its file system, so only new or changed files are posted.
+//
+// A version tag is attached to each file the first time it is synchronised
+// and survives object spreads, so files that the worker reported back (tagged
+// by the worker) aren't sent back to it again. Page versions are a hash of the
+// contents, so they are the same after a reload; whatever changes a file's
+// data in place must clear its version.
+
+const ensureVersion = async (file: SessionFile) => {
+  if (!file.version) {
+    file.version = "c" + (await hashParts([file.data])).substring(0, 24);
+  }
+  return file.version;
+};
+
+// copy into a fresh buffer that can be transferred rather than cloned;
+// the page keeps its own copy for display
+const transferableCopy = (file: SessionFile): SessionFile => ({
+  ...file,
+  data:
+    typeof file.data === "string"
+      ? new TextEncoder().encode(file.data)
+      : new Uint8Array(file.data).slice(),
+});
+
+type SessionFileSyncPayload = {
+  // files the worker doesn't have yet; data is a private, transferable copy
+  changed: SessionFile[];
+  // large files the worker doesn't have yet; to be mounted lazily, data not copied
+  lazy: SessionFile[];
+  // every file the page knows about; anything else the page sent earlier is removed
+  fileNames: string[];
+  transfer: Transferable[];
+};
+
+class SessionFileSync {
+  private workerVersions = new Map<string, string>();
+
+  // the worker was replaced and lost its file system
+  reset() {
+    this.workerVersions.clear();
+  }
+
+  async prepare(files: SessionFile[]): Promise<SessionFileSyncPayload> {
+    const changed: SessionFile[] = [];
+    const lazy: SessionFile[] = [];
+    const transfer: Transferable[] = [];
+    const versions = await Promise.all(files.map(ensureVersion));
+    for (let i = 0; i < files.length; i++) {
+      const file = files[i];
+      const version = versions[i];
+      if (this.workerVersions.get(file.filename) === version) {
+        continue;
+      }
+      this.workerVersions.set(file.filename, version);
+      if (isLazyCandidate(file.data)) {
+        lazy.push(file);
+        continue;
+      }
+      const copy = transferableCopy(file);
+      transfer.push((copy.data as Uint8Array).buffer);
+      changed.push(copy);
+    }
+    const fileNames = files.map((f) => f.filename);
+    const known = new Set(fileNames);
+    for (const filename of Array.from(this.workerVersions.keys())) {
+      if (!known.has(filename)) {
+        this.workerVersions.delete(filename);
+      }
+    }
+    return { changed, lazy, fileNames, transfer };
+  }
+
+  // files the worker no longer has as the page sent them (e.g. a test changed
+  // them); sent again next time
+  invalidate(filenames: string[]) {
+    for (const filename of filenames) {
+      if (filename.startsWith("session/")) {
+        this.workerVersions.delete(filename.substring("session/".length));
+      }
+    }
+  }
+
+  // files reported back (or restored) by the worker are already in its file system
+  acknowledge(files: Pick<SessionFile, "filename" | "version">[]) {
+    for (const file of files) {
+      if (file.version && file.filename.startsWith("session/")) {
+        this.workerVersions.set(
+          file.filename.substring("session/".length),
+          file.version
+        );
+      }
+    }
+  }
+}
+
+export default SessionFileSync;
+export { SessionFileSyncPayload, transferableCopy };
@@ -0,0 +1,104 @@
+import { openDb, requestToPromise, transactionDone } from "../utils/idb";
+import { TestResults } from "../models/Tests";
+
+// Results of test runs, keyed by a hash of everything that decides them: the
+// code, the tests, the files and the Python runtime. Re-testing unchanged code,
+// or refreshing badges after a reload, then doesn't run Python at all.
+// The least recently used results are evicted beyond MAX_ENTRIES.
+
+const DB_NAME = "python-sponge-test-results";
+const STORE = "results";
+const MAX_ENTRIES = 500;
+const MAX_ENTRY_SIZE = 256 * 1024; // characters of JSON; larger results aren't kept
+
+type CachedTestResults = {
+  key: string;
+  results: TestResults;
+  lastUsed: number;
+};
+
+// programs that may give different results on every run. Over-matching only
+// means not caching
+const NONDETERMINISTIC =
+  /^\s*(?:from|import)\s[^#\n]*\b(?:random|secrets|uuid|time|datetime)\b|\burandom\b|\b__import__\b/m;
+
+const isDeterministic = (sources: string[]) =>
+  !sources.some((source) => NONDETERMINISTIC.test(source));
+
+// errors that depend on the circumstances of the run rather than the code
+const TRANSIENT_ERRORS = new Set([
+  "Interrupted",
+  "Failed to compile",
+  "Memory limit exceeded",
+  "Pattern too expensive",
+]);
+
+const isCacheable = (results: TestResults) =>
+  results.every((result) => !result.err || !TRANSIENT_ERRORS.has(result.err));
+
+class TestResultCache {
+  private db: Promise<IDBDatabase> | null = null;
+
+  private getDb() {
+    if (!this.db) {
+      this.db = openDb(DB_NAME, 1, (db) => {
+        const store = db.createObjectStore(STORE, { keyPath: "key" });
+        store.createIndex("lastUsed", "lastUsed");
+      });
+    }
+    return this.db;
+  }
+
+  async get(key: string): Promise<TestResults | null> {
+    try {
+      const db = await this.getDb();
+      const tx = db.transaction(STORE, "readwrite");
+      const store = tx.objectStore(STORE);
+      const entry = await requestToPromise<CachedTestResults | undefined>(
+        store.get(key)
+      );
+      if (!entry) {
+        return null;
+      }
+      store.put({ ...entry, lastUsed: Date.now() });
+      await transactionDone(tx);
+      return entry.results;
+    } catch (e) {
+      console.log("Error reading cached test results", e);
+      return null;
+    }
+  }
+
+  async put(key: string, results: TestResults) {
+    if (
+      !isCacheable(results) ||
+      JSON.stringify(results).length > MAX_ENTRY_SIZE
+    ) {
+      return;
+    }
+    try {
+      const db = await this.getDb();
+      const tx = db.transaction(STORE, "readwrite");
+      const store = tx.objectStore(STORE);
+      store.put({ key, results, lastUsed: Date.now() });
+      const count = await requestToPromise(store.count());
+      let excess = count - MAX_ENTRIES;
+      if (excess > 0) {
+        const cursorRequest = store.index("lastUsed").openCursor();
+        cursorRequest.onsuccess = () => {
+          const cursor = cursorRequest.result;
+          if (cursor && excess-- > 0) {
+            cursor.delete();
+            cursor.continue();
+          }
+        };
+      }
+      await transactionDone(tx);
+    } catch (e) {
+      console.log("Error caching test results", e);
+    }
+  }
+}
+
+export default TestResultCache;
+export { isDeterministic };
@@ -1,22 +1,34 @@
 import BookNodeModel from "../models/BookNodeModel";
 import { SessionFile } from "../models/SessionFile";
 import { TestCase } from "../models/Tests";
+import { LazyFileMount } from "./LazyFileStore";
 
 export type WorkerCommand =
   | "init"
   | "setSharedBuffers"
   | "install-deps"
+  | "prefetch-imports"
+  | "bridge-stats"
   | "debug";
 
 export type WorkerInitDto = {
   cmd: "init";
   standalone: boolean;
+  // book whose session folder to restore, if known yet
+  sessionBook: string | null;
+};
+
+// the page opened another book; session files are kept per book
+export type WorkerSessionBookDto = {
+  cmd: "session-book";
+  book: string;
 };
 
 export type WorkerSetSharedBuffersDto = {
   cmd: "setSharedBuffers";
   interruptBuffer: Uint8Array;
   keyDownBuffer: Uint8Array;
+  eventBuffer: Int32Array | null;
 };
 
 export type WorkerInstallDepsDto = {
@@ -24,22 +36,49 @@ export type WorkerInstallDepsDto = {
   deps: string[];
 };
 
+export type WorkerPrefetchImportsDto = {
+  cmd: "prefetch-imports";
+  code: string;
+};
+
+export type WorkerBridgeStatsDto = {
+  cmd: "bridge-stats";
+};
+
 export type WorkerDebugDto = {
   cmd: "debug";
   initCode?: string;
   code: string;
   breakpoints: number[] | null;
   watches: string[] | null;
+  // only files that changed since the last sync
   sessionFiles: SessionFile[] | null;
+  // all session files on the page
+  sessionFileNames?: string[];
   isSessionFilesAllowed?: boolean;
+  // large files to mount lazily, read from the service worker on demand
+  lazyFiles?: LazyFileMount[];
+  // bytes the run may grow the Wasm heap by before it is stopped
+  memoryLimit?: number;
+  // to the canvas worker, for drawing without going through the page
+  canvasPort?: MessagePort;
 };
 
 export type WorkerRunDto = {
   cmd: "run";
   initCode?: string;
   code: string;
+  // only files that changed since the last sync
   sessionFiles: SessionFile[] | null;
+  // all session files on the page
+  sessionFileNames?: string[];
   isSessionFilesAllowed?: boolean;
+  // large files to mount lazily, read from the service worker on demand
+  lazyFiles?: LazyFileMount[];
+  // bytes the run may grow the Wasm heap by before it is stopped
+  memoryLimit?: number;
+  // to the canvas worker, for drawing without going through the page
+  canvasPort?: MessagePort;
 };
 
 export type WorkerTestDto = {
@@ -48,8 +87,17 @@ export type WorkerTestDto = {
   code: string;
   tests: TestCase[];
   bookNode: BookNodeModel;
+  // only files that changed since the last sync
   sessionFiles: SessionFile[] | null;
+  // all session files on the page
+  sessionFileNames?: string[];
   isSessionFilesAllowed?: boolean;
+  // large files to mount lazily, read from the service worker on demand
+  lazyFiles?: LazyFileMount[];
+  // bytes the run may grow the Wasm heap by before it is stopped
+  memoryLimit?: number;
+  // code is the solution; report which of its lines each test case runs
+  coverage?: boolean;
 };
 
 export type WorkerDrawTurtleExampleDto = {
@@ -61,9 +109,74 @@ export type WorkerDrawTurtleExampleDto = {
 
 export type WorkerData =
   | WorkerInitDto
+  | WorkerSessionBookDto
   | WorkerSetSharedBuffersDto
   | WorkerInstallDepsDto
+  | WorkerPrefetchImportsDto
+  | WorkerBridgeStatsDto
   | WorkerDebugDto
   | WorkerRunDto
   | WorkerTestDto
   | WorkerDrawTurtleExampleDto;
+
+// reported with debug-finished and test-finished, after the run was reset
+export type RunMemoryStats = {
+  heap: number; // bytes of Wasm memory; it only ever grows
+  blocks: number; // Python's allocated memory blocks
+  objects: number; // objects tracked by the garbage collector
+  modules: number;
+  unreachable: number; // objects the collection after the run freed
+};
+
+// crossings between Python and the page during the last run, by kind:
+// post:<cmd>, sync:<route>, keys, events and console
+export type BridgeStats = {
+  buckets: number[]; // ms; upper bounds of the histogram bins, the last bin is open
+  kinds: Record<
+    string,
+    { count: number; bytes: number; time: number; histogram: number[] }
+  >;
+};
+
+// what the test cases cover of the solution, see coverage_report in init.py
+export type SolutionCoverage = {
+  lines: number[]; // lines that start a statement
+  uncovered: number[];
+  // if, while and for; whether any test went into the body, and past it
+  branches: { line: number; body: boolean; skip: boolean }[];
+  // per test case; unique counts lines and branch directions no other test
+  // covers. Without all redundant tests the suite still covers as much
+  tests: { lines: number[]; unique: number; redundant: boolean }[];
+};
+
+// messages to the canvas worker (canvasworker.ts), which draws on the
+// OffscreenCanvas the display canvas hands over
+export type CanvasWorkerData =
+  | { cmd: "init"; canvas: OffscreenCanvas }
+  // Python's canvas commands arrive on this port as JSON
+  | { cmd: "port"; port: MessagePort }
+  | { cmd: "draw"; commands: any[] }
+  | { cmd: "turtle"; requestId: number; id: number; action: any }
+  | { cmd: "turtle-setup"; id: number; width: number; height: number }
+  | { cmd: "turtle-reset"; virtual: boolean }
+  // an image the worker asked the page for
+  | { cmd: "image"; requestId: number; bitmap?: ImageBitmap; error?: string };
+
+// answer to a turtle command, with what it returns or why it failed
+export type CanvasWorkerTurtleResponse = {
+  cmd: "turtle-resp";
+  requestId: number;
+  data?: string;
+  error?: string;
+};
+
+// the canvas worker asks the page to load an image for drawImage
+export type CanvasWorkerImageRequest = {
+  cmd: "load-image";
+  requestId: number;
+  url: string;
+};
+
+export type CanvasWorkerResponse =
+  | CanvasWorkerTurtleResponse
+  | CanvasWorkerImageRequest;
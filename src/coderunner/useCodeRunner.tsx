@@ -17,10 +17,14 @@ import {
   TestFinishedData,
   DebugFinishedData,
 } from "./CodeRunner";
+import { BridgeStats } from "./WorkerDtos";
 import DebugSetup from "./DebugSetup";
 import throttle from "lodash/throttle";
 import DebugContext from "./DebugContext";
 import { SessionFile } from "../models/SessionFile";
+import ConsoleBuffer, { ConsoleBlock } from "../utils/ConsoleBuffer";
+import ConsoleSpillStore from "../utils/ConsoleSpillStore";
+import { saveAs } from "file-saver";
 
 type CodeRunnerProps = {
   enabled: boolean;
@@ -30,12 +34,16 @@ type CodeRunnerProps = {
   turtleReset?: (virtual: boolean) => void;
   onTurtle?: (id: number, msg: string) => Promise<string | undefined>;
   onDraw?: (cmds: any[]) => Promise<void>;
+  canvasPort?: () => MessagePort | null;
   onAudio?: (msg: string) => void;
 };
 
 type CodeRunnerRef = {
   state: CodeRunnerState;
   consoleText: string;
+  consoleBlocks: ConsoleBlock[];
+  consoleTruncatedLines: number;
+  downloadConsoleLog: () => void;
   debugContext: DebugContext | undefined;
 
   test: (
@@ -45,6 +53,13 @@ type CodeRunnerRef = {
     additionalFilesLoaded: AdditionalFilesContents,
     bookNode: BookNodeModel
   ) => Promise<TestFinishedData>;
+  coverage: (
+    solution: string,
+    tests: TestCases,
+    additionalFiles: AdditionalFile[] | undefined,
+    additionalFilesLoaded: AdditionalFilesContents,
+    bookNode: BookNodeModel
+  ) => Promise<TestFinishedData>;
   debug: (
     code: string,
     mode: "debug" | "run",
@@ -63,12 +78,21 @@ type CodeRunnerRef = {
   kill: () => void;
   keyDown: (data: React.KeyboardEvent) => void;
   keyUp: (data: React.KeyboardEvent) => void;
+  mouse: (
+    type: "down" | "up" | "move",
+    x: number,
+    y: number,
+    button: number
+  ) => void;
   step: () => void;
   continue: () => void;
   input: (input: string) => void;
   addConsoleText: (text: string) => void;
   clear: () => void;
   installDependencies: (deps: string[]) => void;
+  prefetchImports: (code: string) => void;
+  setSessionBook: (book: string) => void;
+  bridgeStats: () => Promise<BridgeStats | null>;
 };
 
 var pythonCodeRunner: PythonCodeRunner | null = null;
@@ -92,6 +116,7 @@ const useCodeRunner = ({
   turtleReset: onTurtleResetProp,
   onCls: onClsProp,
   onDraw: onDrawProp,
+  canvasPort: canvasPortProp,
   enabled,
 }: CodeRunnerProps) => {
   if (!pythonCodeRunner && enabled) {
@@ -100,11 +125,29 @@ const useCodeRunner = ({
   const [state, setState] = useState(
     pythonCodeRunner?.state || CodeRunnerState.UNINITIALISED
   );
-  const [consoleText, setConsoleText] = useState("");
-  const consoleTextUnthrottled = useRef("");
+  // console scrollback is bounded; dropped lines are kept in IndexedDB
+  const spillStore = useRef(new ConsoleSpillStore());
+  const consoleBuffer = useRef(
+    new ConsoleBuffer(undefined, (lines) => spillStore.current.append(lines))
+  );
+  const [consoleBlocks, setConsoleBlocks] = useState<ConsoleBlock[]>([]);
+  const [consoleTruncatedLines, setConsoleTruncatedLines] = useState(0);
   const throttledPrint = useRef(
-    throttle(() => setConsoleText(consoleTextUnthrottled.current), 100)
+    throttle(() => {
+      setConsoleBlocks(consoleBuffer.current.getBlocks());
+      setConsoleTruncatedLines(consoleBuffer.current.truncatedLines);
+    }, 100)
+  );
+  const consoleText = useMemo(
+    () => consoleBlocks.map((b) => b.lines.join("\n")).join("\n"),
+    [consoleBlocks]
   );
+  // start from an empty spill log (this also prunes closed pages' logs)
+  useEffect(() => {
+    const store = spillStore.current;
+    store.clear();
+    return () => store.dispose();
+  }, []);
 
   // callback references tued to the relevant props
   // this prop redirection helps to maintain a single callback
@@ -114,6 +157,7 @@ const useCodeRunner = ({
   const onTurtleReset = useRef(onTurtleResetProp);
   const onTurtle = useRef(onTurtleProp);
   const onDraw = useRef(onDrawProp);
+  const canvasPort = useRef(canvasPortProp);
   const onAudio = useRef(onAudioProp);
   const onCls = useRef(onClsProp);
   useEffect(() => {
@@ -131,6 +175,9 @@ const useCodeRunner = ({
   useEffect(() => {
     onDraw.current = onDrawProp;
   }, [onDrawProp]);
+  useEffect(() => {
+    canvasPort.current = canvasPortProp;
+  }, [canvasPortProp]);
   useEffect(() => {
     onAudio.current = onAudioProp;
   }, [onAudioProp]);
@@ -149,7 +196,7 @@ const useCodeRunner = ({
     });
     const onPrintId = pythonCodeRunner.onPrint.register((msg) => {
       onPrint.current?.(msg);
-      consoleTextUnthrottled.current += msg;
+      consoleBuffer.current.append(msg);
       throttledPrint.current();
     });
     const onAwaitCanvasId = pythonCodeRunner.onAwaitCanvas.register(() =>
@@ -164,11 +211,15 @@ const useCodeRunner = ({
     const onDrawId = pythonCodeRunner.onDraw.register((cmds) =>
       onDraw.current ? onDraw.current(cmds) : Promise.resolve()
     );
+    const onCanvasPortId = pythonCodeRunner.onCanvasPort.register(
+      () => canvasPort.current?.() ?? null
+    );
     const onAudioId = pythonCodeRunner.onAudio.register((msg) =>
       onAudio.current?.(msg)
     );
     const onClsId = pythonCodeRunner.onCls.register(() => {
-      consoleTextUnthrottled.current = "";
+      consoleBuffer.current.clear();
+      spillStore.current.clear();
       throttledPrint.current();
       onCls.current?.();
     });
@@ -181,6 +232,7 @@ const useCodeRunner = ({
         pythonCodeRunner.onTurtleReset.unregister(onTurtleResetId);
         pythonCodeRunner.onTurtle.unregister(onTurtleId);
         pythonCodeRunner.onDraw.unregister(onDrawId);
+        pythonCodeRunner.onCanvasPort.unregister(onCanvasPortId);
         pythonCodeRunner.onAudio.unregister(onAudioId);
         pythonCodeRunner.onCls.unregister(onClsId);
       }
@@ -188,15 +240,22 @@ const useCodeRunner = ({
   }, [enabled]);
 
   const clear = useCallback(() => {
-    consoleTextUnthrottled.current = "";
+    consoleBuffer.current.clear();
+    spillStore.current.clear();
     throttledPrint.current();
   }, []);
 
   const addConsoleText = useCallback((text: string) => {
-    consoleTextUnthrottled.current += text;
+    consoleBuffer.current.append(text);
     throttledPrint.current();
   }, []);
 
+  const downloadConsoleLog = useCallback(() => {
+    spillStore.current
+      .toBlob(consoleBuffer.current.getText())
+      .then((blob) => saveAs(blob, "console.txt"));
+  }, []);
+
   return {
     test:
       pythonCodeRunner?.test ||
@@ -207,6 +266,15 @@ const useCodeRunner = ({
         __additionalFilesLoaded: AdditionalFilesContents,
         bookNode: BookNodeModel
       ) => Promise.resolve({ results: [], code: "", bookNode: bookNode })),
+    coverage:
+      pythonCodeRunner?.coverage ||
+      ((
+        __solution: string,
+        __tests: TestCases,
+        __additionalFiles: AdditionalFile[] | undefined,
+        __additionalFilesLoaded: AdditionalFilesContents,
+        bookNode: BookNodeModel
+      ) => Promise.resolve({ results: [], code: "", bookNode: bookNode })),
     state: state,
     kill: pythonCodeRunner?.kill || (() => {}),
     debug:
@@ -223,18 +291,26 @@ const useCodeRunner = ({
       ) => Promise.resolve({ reason: "", updatedSessionFiles: [] })),
     keyDown: pythonCodeRunner?.keyDown || (() => {}),
     keyUp: pythonCodeRunner?.keyUp || (() => {}),
+    mouse: pythonCodeRunner?.mouse || (() => {}),
     step: pythonCodeRunner?.step || (() => {}),
     refreshDebugContext:
       pythonCodeRunner?.refreshDebugContext || ((_: DebugSetup) => {}),
     continue: pythonCodeRunner?.continue || (() => {}),
     input: pythonCodeRunner?.input || (() => {}),
     consoleText: consoleText,
+    consoleBlocks: consoleBlocks,
+    consoleTruncatedLines: consoleTruncatedLines,
+    downloadConsoleLog: downloadConsoleLog,
     debugContext: pythonCodeRunner?.debugContext || undefined,
     drawTurtleExample:
       pythonCodeRunner?.drawTurtleExample || (() => Promise.resolve("")),
     addConsoleText: addConsoleText,
     clear: clear,
     installDependencies: pythonCodeRunner?.installDependencies || (() => {}),
+    prefetchImports: pythonCodeRunner?.prefetchImports || (() => {}),
+    setSessionBook: pythonCodeRunner?.setSessionBook || (() => {}),
+    bridgeStats:
+      pythonCodeRunner?.bridgeStats || (() => Promise.resolve(null)),
   };
 };
 
@@ -0,0 +1,117 @@
+import { useEffect, useState } from "react";
+import {
+  Paper,
+  Table,
+  TableBody,
+  TableHead,
+  TableRow,
+  Typography,
+} from "@mui/material";
+import VeryDenseTableCell from "./VeryDenseTableCell";
+import { CodeRunnerRef, CodeRunnerState } from "../coderunner/useCodeRunner";
+import { BridgeStats } from "../coderunner/WorkerDtos";
+
+// Developer overlay with the crossings between Python and the page during the
+// last run. Enabled with localStorage.setItem("bridge-stats-overlay", "on")
+
+const isEnabled = () => {
+  try {
+    return localStorage.getItem("bridge-stats-overlay") === "on";
+  } catch {
+    return false;
+  }
+};
+
+// upper bound of the histogram bin the given share of crossings falls in
+const percentile = (histogram: number[], buckets: number[], share: number) => {
+  const total = histogram.reduce((a, b) => a + b, 0);
+  let seen = 0;
+  for (let i = 0; i < histogram.length; i++) {
+    seen += histogram[i];
+    if (seen >= total * share) {
+      return i < buckets.length
+        ? `≤${buckets[i]}`
+        : `>${buckets[buckets.length - 1]}`;
+    }
+  }
+  return "-";
+};
+
+type BridgeStatsOverlayProps = {
+  codeRunner: CodeRunnerRef;
+};
+
+const BridgeStatsOverlay = ({ codeRunner }: BridgeStatsOverlayProps) => {
+  const [enabled] = useState(isEnabled);
+  const [stats, setStats] = useState<BridgeStats | null>(null);
+  const { state, bridgeStats } = codeRunner;
+
+  useEffect(() => {
+    if (enabled && state === CodeRunnerState.READY) {
+      bridgeStats().then(setStats);
+    }
+  }, [enabled, state, bridgeStats]);
+
+  if (!enabled || !stats) {
+    return null;
+  }
+  const kinds = Object.entries(stats.kinds).sort(
+    ([, a], [, b]) => b.time - a.time
+  );
+  const count = kinds.reduce((sum, [, kind]) => sum + kind.count, 0);
+  const time = kinds.reduce((sum, [, kind]) => sum + kind.time, 0);
+  return (
+    <Paper
+      elevation={4}
+      sx={{
+        position: "fixed",
+        left: 8,
+        bottom: 8,
+        zIndex: 2000,
+        maxHeight: "40vh",
+        overflow: "auto",
+        opacity: 0.9,
+        pointerEvents: "none",
+        "& td, & th": { px: 0.5, fontSize: "0.75rem", whiteSpace: "nowrap" },
+      }}
+    >
+      <Typography variant="caption" sx={{ px: 0.5 }}>
+        Last run: {count} crossings, {time.toFixed(1)} ms
+      </Typography>
+      <Table size="small">
+        <TableHead>
+          <TableRow>
+            <VeryDenseTableCell>Kind</VeryDenseTableCell>
+            <VeryDenseTableCell align="right">Count</VeryDenseTableCell>
+            <VeryDenseTableCell align="right">KB</VeryDenseTableCell>
+            <VeryDenseTableCell align="right">ms</VeryDenseTableCell>
+            <VeryDenseTableCell align="right">avg ms</VeryDenseTableCell>
+            <VeryDenseTableCell align="right">p95 ms</VeryDenseTableCell>
+          </TableRow>
+        </TableHead>
+        <TableBody>
+          {kinds.map(([name, kind]) => (
+            <TableRow key={name}>
+              <VeryDenseTableCell>{name}</VeryDenseTableCell>
+              <VeryDenseTableCell align="right">{kind.count}</VeryDenseTableCell>
+              <VeryDenseTableCell align="right">
+                {(kind.bytes / 1024).toFixed(1)}
+              </VeryDenseTableCell>
+              <VeryDenseTableCell align="right">
+                {kind.time.toFixed(1)}
+              </VeryDenseTableCell>
+              <VeryDenseTableCell align="right">
+                {(kind.time / kind.count).toFixed(3)}
+              </VeryDenseTableCell>
+              <VeryDenseTableCell align="right">
+                {percentile(kind.histogram, stats.buckets, 0.95)}
+              </VeryDenseTableCell>
+            </TableRow>
+          ))}
+        </TableBody>
+      </Table>
+    </Paper>
+  );
+};
+
+export default BridgeStatsOverlay;
@@ -1,28 +1,35 @@
-import {
+import React, {
   useEffect,
   useRef,
   KeyboardEvent,
   MouseEvent,
+  ClipboardEvent,
   useContext,
   useState,
 } from "react";
-import { Box, Fade } from "@mui/material";
+import { Box, Fade, Link } from "@mui/material";
 import "./Console.css";
 import VsThemeContext from "../themes/VsThemeContext";
 import Anser from "anser";
 import parse from "html-react-parser";
+import { ConsoleBlock } from "../utils/ConsoleBuffer";
 
 type ConsoleProps = {
   highlightColour?: string;
   isInputEnabled: boolean;
-  content: string;
+  blocks: ConsoleBlock[];
+  truncatedLines?: number;
+  onDownloadLog?: () => void;
   onInput: (input: string) => void;
   onInterrupt: () => void;
 };
 
-// max character count in the console
+// max character count in a console block
 const MAX_LENGTH = 1000000;
 
+// how far outside of the visible area blocks are still rendered
+const OVERSCAN_PX = 1000;
+
 const transformText = (text: string) => {
   text = text.replace("\n", "\r\n");
   text = text.slice(-MAX_LENGTH);
@@ -35,10 +42,28 @@ const transformText = (text: string) => {
 const Console = (props: ConsoleProps) => {
   const containerEl = useRef<HTMLDivElement | null>(null);
   const inputFieldEl = useRef<HTMLSpanElement | null>(null);
+  const pendingInput = useRef(""); // partial line to restore on next input
   const vsThemeContext = useContext(VsThemeContext);
 
   const [fontSize, setFontSize] = useState<number>(15);
 
+  // only blocks near the visible area are rendered; the rest are replaced
+  // by spacers of their last measured (or estimated) height
+  const blockHeights = useRef(new Map<number, number>());
+  const [scrollTop, setScrollTop] = useState(0);
+  const [viewportHeight, setViewportHeight] = useState(0);
+
+  useEffect(() => {
+    blockHeights.current.clear();
+  }, [fontSize]);
+
+  const onScroll = () => {
+    if (containerEl.current) {
+      setScrollTop(containerEl.current.scrollTop);
+      setViewportHeight(containerEl.current.clientHeight);
+    }
+  };
+
   const onKeyPressed = (event: KeyboardEvent) => {
     if (inputFieldEl.current && event.key === "Enter") {
       const input = inputFieldEl.current.textContent;
@@ -47,6 +72,23 @@ const Console = (props: ConsoleProps) => {
     }
   };
 
+  // pasting several lines submits all complete lines at once; the program
+  // receives them as a queue. Any trailing partial line stays in the input
+  const onPaste = (event: ClipboardEvent) => {
+    const pasted = event.clipboardData
+      .getData("text/plain")
+      .replace(/\r\n?/g, "\n");
+    if (!inputFieldEl.current || !pasted.includes("\n")) {
+      return;
+    }
+    event.preventDefault();
+    const text = (inputFieldEl.current.textContent || "") + pasted;
+    const lastNewLine = text.lastIndexOf("\n");
+    inputFieldEl.current.textContent = "";
+    pendingInput.current = text.substring(lastNewLine + 1);
+    props.onInput(text.substring(0, lastNewLine));
+  };
+
   const onKeyDown = (event: KeyboardEvent) => {
     if ((event.ctrlKey || event.metaKey) && event.key.toLowerCase() === "c") {
       // for Ctrl+C or Cmd+C
@@ -94,6 +136,83 @@ const Console = (props: ConsoleProps) => {
     props.highlightColour
   );
 
+  const inputSpan = props.isInputEnabled && (
+    <span
+      className={!props.isInputEnabled ? "input-span" : "input-span"}
+      ref={(r) => {
+        inputFieldEl.current = r;
+        if (inputFieldEl.current) {
+          inputFieldEl.current.textContent = pendingInput.current;
+          pendingInput.current = "";
+          setTimeout(() => {
+            inputFieldEl.current?.focus();
+          }, 100);
+        }
+      }}
+      role="textbox"
+      title="console textbox"
+      onKeyPress={onKeyPressed}
+      onKeyDown={onKeyDown}
+      onPaste={onPaste}
+      contentEditable
+    />
+  );
+
+  const renderBlocks = () => {
+    const heights = blockHeights.current;
+    let measuredLines = 0;
+    let measuredHeight = 0;
+    for (const block of props.blocks) {
+      const height = heights.get(block.id);
+      if (height !== undefined) {
+        measuredLines += block.lines.length;
+        measuredHeight += height;
+      }
+    }
+    const lineHeight = measuredLines
+      ? measuredHeight / measuredLines
+      : fontSize * 1.2;
+
+    const rendered: React.ReactNode[] = [];
+    let top = 0;
+    let spacer = 0;
+    props.blocks.forEach((block, i) => {
+      const isLast = i === props.blocks.length - 1;
+      const height = heights.get(block.id) ?? block.lines.length * lineHeight;
+      const isVisible =
+        isLast ||
+        (top + height >= scrollTop - OVERSCAN_PX &&
+          top <= scrollTop + viewportHeight + OVERSCAN_PX);
+      top += height;
+      if (!isVisible) {
+        spacer += height;
+        return;
+      }
+      if (spacer) {
+        rendered.push(
+          <div key={`spacer-${block.id}`} style={{ height: spacer }} />
+        );
+        spacer = 0;
+      }
+      rendered.push(
+        <div
+          key={block.id}
+          className="printed-block"
+          ref={(el) => {
+            if (el) heights.set(block.id, el.offsetHeight);
+          }}
+        >
+          {transformText(block.lines.join("\n"))}
+          {isLast && inputSpan}
+        </div>
+      );
+    });
+    if (!props.blocks.length && inputSpan) {
+      rendered.push(<div key="input">{inputSpan}</div>);
+    }
+    return rendered;
+  };
+
   useEffect(() => {
     setTimeout(() => {
       setHighlightColour(props.highlightColour);
@@ -106,28 +225,20 @@ const Console = (props: ConsoleProps) => {
         className={"console theme-" + vsThemeContext.theme}
         ref={setRef}
         onClick={onClick}
+        onScroll={onScroll}
         style={{ fontSize: fontSize + "px" }}
       >
-        <span className="printed-span">{transformText(props.content)}</span>
-        {props.isInputEnabled && (
-          <span
-            className={!props.isInputEnabled ? "input-span" : "input-span"}
-            ref={(r) => {
-              inputFieldEl.current = r;
-              if (inputFieldEl.current) {
-                inputFieldEl.current.textContent = "";
-                setTimeout(() => {
-                  inputFieldEl.current?.focus();
-                }, 100);
-              }
-            }}
-            role="textbox"
-            title="console textbox"
-            onKeyPress={onKeyPressed}
-            onKeyDown={onKeyDown}
-            contentEditable
-          />
+        {!!props.truncatedLines && (
+          <div className="truncated-marker">
+            … {props.truncatedLines} lines truncated.{" "}
+            {props.onDownloadLog && (
+              <Link component="button" onClick={props.onDownloadLog}>
+                Download full log
+              </Link>
+            )}
+          </div>
         )}
+        {renderBlocks()}
       </div>
 
       <div className="highlight-overlay" style={{ color: highlightColour }}>
@@ -236,7 +236,12 @@ const ResultsTooltip = (
                           <CancelIcon color="error"></CancelIcon>
                         )}
                       </TableCell>
-                      <TableCell>{tr.err}</TableCell>
+                      <TableCell>
+                        {tr.err}
+                        {tr.peak
+                          ? ` (peak ${(tr.peak / 1048576).toFixed(0)} MB)`
+                          : ""}
+                      </TableCell>
                       <TableCell>
                         <InputDisplay {...tr} />
                       </TableCell>
@@ -21,6 +21,10 @@ type BookNodeModel = {
   typ?: "py" | "parsons" | "canvas";
   sol?: Solution;
   isSessionFilesAllowed?: boolean;
+  // tests run on a virtual clock: sleep returns at once, time advances instead
+  isVirtualClock?: boolean;
+  // ISO date (time) the virtual clock starts at, if not the default epoch
+  virtualClockStart?: string;
 
   // cached
   // what is the main URL of this book (md, py and bookLinks are relative to this)
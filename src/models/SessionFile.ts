@@ -3,6 +3,8 @@ type SessionFile = {
   isText: boolean;
   data: ArrayBuffer | string | Uint8Array;
   mimeType?: string;
+  // identifies this content when syncing with the Python worker
+  version?: string;
 };
 
 export { SessionFile };
@@ -7,7 +7,9 @@ type AdvancedOutRequirementType =
   | "f-"
   | "s+"
   | "s-"
-  | "t";
+  | "t"
+  | "d"
+  | "g";
 
 type AdvancedOutRequirementIgnore =
   | ""
@@ -29,6 +31,8 @@ type AdvancedOutRequirement = {
    * f+: file contains, f- file does not contain
    * s+: when statement runs, the output contains, s- when statement runs, the output does not contain
    * t: turtle
+   * d: drawing on sys.stdctx matches the solution's drawing
+   * g: output matches the solution's output for generated inputs
    * default is +, contains
    */
   typ?: AdvancedOutRequirementType;
@@ -48,11 +52,12 @@ type AdvancedOutRequirement = {
 
   /**
    * if count is specified, the pattern must appear count times. default is *-1, don't care*
+   * if typ is g, how many inputs to generate. default is 100
    */
   count?: number;
 
   /**
-   * file to test. Only used if typ is f+ or f-
+   * file to test. Only used if typ is f+ or f-. Solution file if typ is t, d or g
    */
   filename?: string;
 
@@ -65,6 +70,23 @@ type AdvancedOutRequirement = {
    * regex: if true, pattern is a regular expression. default is true (!)
    */
   regex?: boolean;
+
+  /**
+   * inputs to generate, one line per input: "int 1 100", "float 0 1 2" (2 decimals),
+   * "word red green blue"; or Python code defining generate(random), returning the
+   * list of inputs for one run. Only used if typ is g
+   */
+  generator?: string;
+
+  /**
+   * how far numbers in drawing commands may differ. Only used if typ is d. default is 0.01
+   */
+  tolerance?: number;
+
+  /**
+   * if false, the drawing operations of a frame may come in any order. Only used if typ is d. default is true
+   */
+  ordered?: boolean;
 };
 
 type TestCase = {
@@ -82,6 +104,8 @@ type TestResult = {
   criteriaOutcomes?: Array<boolean>;
   actual?: string;
   ins?: string | Array<string | number>;
+  /** bytes the run grew the worker's memory by, when stopped by the memory limit */
+  peak?: number;
 };
 
 type TestResults = Array<TestResult>;
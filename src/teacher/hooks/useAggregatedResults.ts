@@ -7,6 +7,82 @@ import {
 } from "../Models";
 import { ChallengeInfo } from "../components/ResultsTableRow";
 
+// results looked up by student, built once per change of the results prop
+type ResultsIndex = {
+  byUser: Map<string, ResultsModel>; // the first result of each user
+  classOrder: Map<string, number>; // position of each student in the class
+  today: string; // ISO date; results dated after it were attempted today
+};
+
+const isoToday = () => new Date().toISOString().split("T")[0];
+
+const indexResults = (
+  aClass: ClassModel,
+  results: ResultsModel[]
+): ResultsIndex => {
+  const byUser = new Map<string, ResultsModel>();
+  for (const r of results) {
+    if (!byUser.has(r.user)) {
+      byUser.set(r.user, r);
+    }
+  }
+  const classOrder = new Map<string, number>();
+  aClass.students.forEach((student, i) => {
+    if (!classOrder.has(student)) {
+      classOrder.set(student, i);
+    }
+  });
+  return { byUser, classOrder, today: isoToday() };
+};
+
+const aggregateStudent = (
+  student: string,
+  res: ResultsModel | undefined,
+  challengeInfo: ChallengeInfo,
+  today: string
+): AggregatedResultsModel => {
+  let passCount: number | undefined = undefined;
+  const challengeIdsAttemptedToday = new Set<string>();
+  if (res) {
+    passCount = 0;
+    for (let id of challengeInfo.ids) {
+      let r = (res as any)[id] as any;
+      if (r instanceof Boolean) {
+        // TODO: deprecate old boolean results
+        challengeIdsAttemptedToday.add(id);
+        if (r as boolean) {
+          passCount++;
+        }
+      } else {
+        const rAsComplex = r as ChallengeResultComplexModel;
+        if (rAsComplex?.correct) {
+          passCount++;
+        }
+        if (
+          (rAsComplex?.["correct-date"] &&
+            rAsComplex?.["correct-date"] > today) ||
+          (rAsComplex?.["wrong-date"] && rAsComplex?.["wrong-date"] > today)
+        ) {
+          challengeIdsAttemptedToday.add(id);
+        }
+      }
+    }
+  }
+  return {
+    student: student,
+    results: res,
+    passCount: passCount,
+    challengeIdsAttemptedToday: challengeIdsAttemptedToday,
+  };
+};
+
+// most passes first, otherwise in class order (as a stable sort would)
+const byPassCount =
+  (aggregated: Map<string, AggregatedResultsModel>, index: ResultsIndex) =>
+  (a: string, b: string) =>
+    (aggregated.get(b)?.passCount || 0) - (aggregated.get(a)?.passCount || 0) ||
+    (index.classOrder.get(a) ?? 0) - (index.classOrder.get(b) ?? 0);
+
 const processResults = (
   aClass?: ClassModel,
   results?: ResultsModel[],
@@ -16,64 +92,52 @@ const processResults = (
     return {
       aggregatedResults: new Map<string, AggregatedResultsModel>(),
       studentIdsByPassCount: [] as string[],
+      index: null,
     };
   }
-  const today = new Date().toISOString().split("T")[0];
-
+  const index = indexResults(aClass, results);
   const newAggregatedResults = new Map(
-    aClass.students.map((student) => {
-      let res = results?.length
-        ? results?.filter((r) => r.user === student).at(0)
-        : null;
-      let passCount: number | undefined = undefined;
-      const challengeIdsAttemptedToday = new Set<string>();
-      if (res && challengeInfo) {
-        passCount = 0;
-        for (let id of challengeInfo.ids) {
-          let r = (res as any)[id] as any;
-          if (r instanceof Boolean) {
-            // TODO: deprecate old boolean results
-            challengeIdsAttemptedToday.add(id);
-            if (r as boolean) {
-              passCount++;
-            }
-          } else {
-            const rAsComplex = r as ChallengeResultComplexModel;
-            if (rAsComplex?.correct) {
-              passCount++;
-            }
-            if (
-              (rAsComplex?.["correct-date"] &&
-                rAsComplex?.["correct-date"] > today) ||
-              (rAsComplex?.["wrong-date"] && rAsComplex?.["wrong-date"] > today)
-            ) {
-              challengeIdsAttemptedToday.add(id);
-            }
-          }
-        }
-      }
-
-      return [
+    aClass.students.map((student) => [
+      student,
+      aggregateStudent(
         student,
-        {
-          student: student,
-          results: res as ResultsModel | undefined,
-          passCount: passCount,
-          challengeIdsAttemptedToday: challengeIdsAttemptedToday,
-        },
-      ];
-    })
+        index.byUser.get(student),
+        challengeInfo,
+        index.today
+      ),
+    ])
   );
   // computed ordered array of student ids by passCount
   const studentIdsByPassCount = Array.from(newAggregatedResults.keys()).sort(
-    (a, b) => {
-      return (
-        (newAggregatedResults.get(b)?.passCount || 0) -
-        (newAggregatedResults.get(a)?.passCount || 0)
-      );
-    }
+    byPassCount(newAggregatedResults, index)
   );
-  return { aggregatedResults: newAggregatedResults, studentIdsByPassCount };
+  return {
+    aggregatedResults: newAggregatedResults,
+    studentIdsByPassCount,
+    index,
+  };
+};
+
+// moves a student whose pass count changed to their place in the order;
+// returns a new array, the others keep their relative order
+const reorderStudent = (
+  order: string[],
+  student: string,
+  compare: (a: string, b: string) => number
+) => {
+  const rest = order.filter((s) => s !== student);
+  let lo = 0;
+  let hi = rest.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (compare(rest[mid], student) < 0) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  rest.splice(lo, 0, student);
+  return rest;
 };
 
 const areStudentResultIdsTheSame = (a: string[], b: string[]) => {
@@ -106,6 +170,8 @@ const useAggregatedResults = (
 
   const studentIdsByPassCountRef = useRef<string[]>([]);
 
+  const resultsIndexRef = useRef<ResultsIndex | null>(null);
+
   // var to state by in place update, so the data is up-to-date without propagating the change
   const updateAggregatedResultsInPlace = (
     newResults: Map<string, AggregatedResultsModel>,
@@ -131,14 +197,64 @@ const useAggregatedResults = (
     []
   );
 
+  // a single result of a known student changed: only their row and their
+  // place in the order are recomputed. false if a full update is needed
+  const updateStudentIncrementally = (
+    targetStudent: string,
+    targetId?: string
+  ) => {
+    const index = resultsIndexRef.current;
+    const current = aggregatedResultsRef.current;
+    if (
+      !index ||
+      !challengeInfo ||
+      !current.has(targetStudent) ||
+      index.today !== isoToday()
+    ) {
+      return false;
+    }
+    let res = index.byUser.get(targetStudent);
+    if (!res) {
+      res = results?.find((r) => r.user === targetStudent);
+      if (res) {
+        index.byUser.set(targetStudent, res);
+      }
+    }
+    const entry = aggregateStudent(
+      targetStudent,
+      res,
+      challengeInfo,
+      index.today
+    );
+    const previousPassCount = current.get(targetStudent)?.passCount || 0;
+    current.set(targetStudent, entry);
+    const order = studentIdsByPassCountRef.current;
+    const newOrder =
+      (entry.passCount || 0) === previousPassCount
+        ? order
+        : reorderStudent(order, targetStudent, byPassCount(current, index));
+    if (areStudentResultIdsTheSame(order, newOrder)) {
+      aggregatedResults.set(targetStudent, entry);
+      onInvalidateRowOnly?.(targetStudent, targetId);
+    } else {
+      updateAggregatedResultsByReplacement(current, newOrder);
+    }
+    return true;
+  };
+
   const updateAggregatedResultsInternal = (
     targetStudent?: string,
     targetId?: string
   ) => {
+    if (targetStudent && updateStudentIncrementally(targetStudent, targetId)) {
+      return;
+    }
     const {
       aggregatedResults: newAggregatedResults,
       studentIdsByPassCount: newStudentIdsByPassCount,
+      index,
     } = processResults(klass, results, challengeInfo);
+    resultsIndexRef.current = index;
     if (newAggregatedResults.size === 0) {
       updateAggregatedResultsByReplacement(
         newAggregatedResults,
@@ -202,7 +318,9 @@ const useAggregatedResults = (
     const {
       aggregatedResults: newAggregatedResults,
       studentIdsByPassCount: newStudentIdsByPassCount,
+      index,
     } = processResults(klass, results, challengeInfo);
+    resultsIndexRef.current = index;
     updateAggregatedResultsByReplacement(
       newAggregatedResults,
       newStudentIdsByPassCount
@@ -0,0 +1,98 @@
+// Bounded console scrollback, stored as a ring of fixed-size line chunks.
+// When the line cap is exceeded, whole chunks are dropped from the front
+// and handed to onSpill (e.g. to keep them for a full log download).
+
+const CONSOLE_CHUNK_LINES = 200;
+const DEFAULT_CONSOLE_MAX_LINES = 10000;
+const MAX_LINE_LENGTH = 100000; // force a line break on runaway single lines
+
+type ConsoleBlock = {
+  // absolute chunk number since the last clear; stable while the chunk is alive
+  id: number;
+  lines: string[];
+};
+
+// the line cap can be overridden per browser, e.g. for teachers' machines
+const configuredMaxLines = () => {
+  const stored = Number(localStorage.getItem("console-max-lines"));
+  return stored > 0 ? stored : DEFAULT_CONSOLE_MAX_LINES;
+};
+
+class ConsoleBuffer {
+  public truncatedLines = 0;
+
+  private chunks: string[][] = [];
+  private firstChunkId = 0;
+  private lineCount = 0;
+  private partial = ""; // current line, not yet terminated by \n
+
+  constructor(
+    private maxLines = configuredMaxLines(),
+    private onSpill?: (lines: string[]) => void
+  ) {}
+
+  append(text: string) {
+    const parts = (this.partial + text).split("\n");
+    this.partial = parts.pop() || "";
+    while (this.partial.length > MAX_LINE_LENGTH) {
+      parts.push(this.partial.substring(0, MAX_LINE_LENGTH));
+      this.partial = this.partial.substring(MAX_LINE_LENGTH);
+    }
+    for (const line of parts) {
+      let last = this.chunks[this.chunks.length - 1];
+      if (!last || last.length >= CONSOLE_CHUNK_LINES) {
+        last = [];
+        this.chunks.push(last);
+      }
+      last.push(line);
+    }
+    this.lineCount += parts.length;
+
+    // drop oldest chunks, but always keep the newest one
+    while (this.lineCount > this.maxLines && this.chunks.length > 1) {
+      const dropped = this.chunks.shift()!;
+      this.firstChunkId++;
+      this.lineCount -= dropped.length;
+      this.truncatedLines += dropped.length;
+      this.onSpill?.(dropped);
+    }
+  }
+
+  clear() {
+    this.chunks = [];
+    this.firstChunkId = 0;
+    this.lineCount = 0;
+    this.partial = "";
+    this.truncatedLines = 0;
+  }
+
+  // blocks to render; the current (possibly empty) line is part of the final block
+  getBlocks(): ConsoleBlock[] {
+    const blocks = this.chunks.map((lines, i) => ({
+      id: this.firstChunkId + i,
+      lines,
+    }));
+    if (this.partial || blocks.length) {
+      const last = blocks[blocks.length - 1];
+      if (last && last.lines.length < CONSOLE_CHUNK_LINES) {
+        blocks[blocks.length - 1] = {
+          id: last.id,
+          lines: [...last.lines, this.partial],
+        };
+      } else {
+        blocks.push({
+          id: this.firstChunkId + this.chunks.length,
+          lines: [this.partial],
+        });
+      }
+    }
+    return blocks;
+  }
+
+  getText() {
+    return this.chunks.map((c) => c.join("\n") + "\n").join("") + this.partial;
+  }
+}
+
+export default ConsoleBuffer;
+export { ConsoleBlock, CONSOLE_CHUNK_LINES };
@@ -0,0 +1,206 @@
+import { openDb, requestToPromise, transactionDone } from "./idb";
+
+// Keeps console lines that were dropped from the on-screen scrollback in
+// IndexedDB, so the full log of a run can still be downloaded.
+// Writes are batched into at most one transaction every 16 ms.
+// Every instance writes under its own session id, so tabs and page loads
+// never see (or clear) each other's lines. A session stays alive while its
+// page holds a Web Lock; records of sessions without one are dropped when the
+// store is first opened.
+
+const DB_NAME = "python-sponge-console";
+const STORE = "spill";
+const LOCK_PREFIX = "python-sponge-console:";
+// without Web Locks, sessions that have not written for this long are stale
+const STALE_AGE = 24 * 60 * 60 * 1000;
+
+interface SpillChunk {
+  session: string;
+  time: number;
+  lines: string[];
+}
+
+const liveSessions = async (): Promise<Set<string> | null> => {
+  if (typeof navigator === "undefined" || !navigator.locks) {
+    return null;
+  }
+  const { held = [] } = await navigator.locks.query();
+  const live = new Set<string>();
+  for (const lock of held) {
+    if (lock.name?.startsWith(LOCK_PREFIX)) {
+      live.add(lock.name.substring(LOCK_PREFIX.length));
+    }
+  }
+  return live;
+};
+
+// deletes every chunk in the range (or the whole store) that matches
+const deleteChunks = (
+  source: IDBObjectStore | IDBIndex,
+  range: IDBKeyRange | null,
+  matches: (chunk: SpillChunk) => boolean = () => true
+) => {
+  const cursorRequest = source.openCursor(range);
+  cursorRequest.onsuccess = () => {
+    const cursor = cursorRequest.result;
+    if (cursor) {
+      if (matches(cursor.value)) {
+        cursor.delete();
+      }
+      cursor.continue();
+    }
+  };
+};
+
+class ConsoleSpillStore {
+  private session = `${Date.now().toString(36)}-${Math.random()
+    .toString(36)
+    .substring(2)}`;
+  private db: Promise<IDBDatabase> | null = null;
+  private releaseLock: (() => void) | null = null;
+  private pending: string[][] = [];
+  private flushScheduled = false;
+  private writes: Promise<void> = Promise.resolve();
+
+  private getDb() {
+    if (!this.db) {
+      this.db = this.holdLock()
+        .then(() =>
+          openDb(DB_NAME, 2, (db, oldVersion) => {
+            if (oldVersion < 2 && db.objectStoreNames.contains(STORE)) {
+              // version 1 records were not tagged with a session
+              db.deleteObjectStore(STORE);
+            }
+            const store = db.createObjectStore(STORE, { autoIncrement: true });
+            store.createIndex("session", "session");
+          })
+        )
+        .then(async (db) => {
+          await this.dropStaleSessions(db);
+          return db;
+        });
+    }
+    return this.db;
+  }
+
+  // resolves once the session lock is held; the lock is kept until dispose()
+  private holdLock() {
+    if (typeof navigator === "undefined" || !navigator.locks) {
+      return Promise.resolve();
+    }
+    return new Promise<void>((resolve) => {
+      navigator.locks
+        .request(
+          LOCK_PREFIX + this.session,
+          () =>
+            new Promise<void>((release) => {
+              this.releaseLock = release;
+              resolve();
+            })
+        )
+        .catch((e) => {
+          console.log("Error locking console log", e);
+          resolve();
+        });
+    });
+  }
+
+  private async dropStaleSessions(db: IDBDatabase) {
+    try {
+      const live = await liveSessions();
+      const staleBefore = Date.now() - STALE_AGE;
+      const tx = db.transaction(STORE, "readwrite");
+      deleteChunks(
+        tx.objectStore(STORE),
+        null,
+        (chunk) =>
+          chunk.session !== this.session &&
+          (live ? !live.has(chunk.session) : chunk.time < staleBefore)
+      );
+      await transactionDone(tx);
+    } catch (e) {
+      console.log("Error pruning console log", e);
+    }
+  }
+
+  append(lines: string[]) {
+    this.pending.push(lines);
+    if (this.flushScheduled) return;
+    this.flushScheduled = true;
+    setTimeout(() => this.flush(), 16);
+  }
+
+  private flush() {
+    this.flushScheduled = false;
+    const batch = this.pending;
+    this.pending = [];
+    if (!batch.length) return;
+    this.writes = this.writes
+      .then(() => this.getDb())
+      .then((db) => {
+        const tx = db.transaction(STORE, "readwrite");
+        const store = tx.objectStore(STORE);
+        const time = Date.now();
+        for (const lines of batch) {
+          const chunk: SpillChunk = { session: this.session, time, lines };
+          store.add(chunk);
+        }
+        return transactionDone(tx);
+      })
+      .catch((e) => console.log("Error storing console log", e));
+  }
+
+  // removes this session's lines only
+  clear() {
+    this.pending = [];
+    this.writes = this.writes
+      .then(() => this.getDb())
+      .then((db) => {
+        const tx = db.transaction(STORE, "readwrite");
+        deleteChunks(
+          tx.objectStore(STORE).index("session"),
+          IDBKeyRange.only(this.session)
+        );
+        return transactionDone(tx);
+      })
+      .catch((e) => console.log("Error clearing console log", e));
+  }
+
+  // drops this session's lines and lets other pages prune it
+  dispose() {
+    if (!this.db) return;
+    this.clear();
+    this.writes = this.writes.then(() => {
+      this.releaseLock?.();
+      this.releaseLock = null;
+      // a later use (e.g. a remount) takes the lock again
+      this.db = null;
+    });
+  }
+
+  // spilled lines followed by the current scrollback, as a text blob
+  async toBlob(currentText: string) {
+    this.flush();
+    await this.writes;
+    const parts: string[] = [];
+    try {
+      const db = await this.getDb();
+      const chunks = await requestToPromise<SpillChunk[]>(
+        db
+          .transaction(STORE, "readonly")
+          .objectStore(STORE)
+          .index("session")
+          .getAll(IDBKeyRange.only(this.session))
+      );
+      for (const { lines } of chunks) {
+        parts.push(lines.join("\n") + "\n");
+      }
+    } catch (e) {
+      console.log("Error reading console log", e);
+    }
+    parts.push(currentText);
+    return new Blob(parts, { type: "text/plain" });
+  }
+}
+
+export default ConsoleSpillStore;
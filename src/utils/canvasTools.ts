@@ -0,0 +1,94 @@
+// Canvas helpers that work both on the page and in a worker, where canvases
+// are OffscreenCanvas and there is no DOM
+
+type AnyCanvas = HTMLCanvasElement | OffscreenCanvas;
+type AnyContext2D =
+  | CanvasRenderingContext2D
+  | OffscreenCanvasRenderingContext2D;
+
+const isOffscreen = (canvas: AnyCanvas): canvas is OffscreenCanvas =>
+  typeof OffscreenCanvas !== "undefined" && canvas instanceof OffscreenCanvas;
+
+// a canvas of the kind available here
+const createCanvas = (width: number, height: number): AnyCanvas => {
+  if (typeof document === "undefined") {
+    return new OffscreenCanvas(width, height);
+  }
+  const canvas = document.createElement("canvas");
+  canvas.width = width;
+  canvas.height = height;
+  return canvas;
+};
+
+const getContext2D = (canvas: AnyCanvas): AnyContext2D | null =>
+  isOffscreen(canvas) ? canvas.getContext("2d") : canvas.getContext("2d");
+
+// PNG data: URL of the canvas; an OffscreenCanvas only encodes asynchronously
+const canvasToDataURL = (canvas: AnyCanvas) => {
+  if (!isOffscreen(canvas)) {
+    return Promise.resolve(canvas.toDataURL());
+  }
+  return canvas.convertToBlob().then(
+    (blob) =>
+      new Promise<string>((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onload = () => resolve(reader.result as string);
+        reader.onerror = () => reject(reader.error);
+        reader.readAsDataURL(blob);
+      })
+  );
+};
+
+// In a worker, images are loaded by the page (see canvasworker.ts): it resolves
+// relative URLs against the document, and cross-origin images without CORS
+// headers only taint the canvas there instead of failing
+let pageImageLoader: ((url: string) => Promise<ImageBitmap>) | null = null;
+
+const setPageImageLoader = (loader: (url: string) => Promise<ImageBitmap>) => {
+  pageImageLoader = loader;
+};
+
+// decoded image at the URL (data: URLs included)
+const loadImage = (url: string): Promise<HTMLImageElement | ImageBitmap> => {
+  if (typeof Image === "undefined") {
+    if (pageImageLoader && !url.startsWith("data:")) {
+      return pageImageLoader(url);
+    }
+    return fetch(url)
+      .then((response) => response.blob())
+      .then((blob) => createImageBitmap(blob));
+  }
+  return new Promise((resolve, reject) => {
+    const img = new Image();
+    img.onload = () => resolve(img);
+    img.onerror = reject;
+    img.src = url;
+  });
+};
+
+const nextFrame = (callback: () => void) => {
+  if (typeof requestAnimationFrame !== "undefined") {
+    requestAnimationFrame(callback);
+  } else {
+    setTimeout(callback, 16);
+  }
+};
+
+// whether canvases can be handed to a worker to draw on
+const canTransferCanvas = () =>
+  typeof HTMLCanvasElement !== "undefined" &&
+  typeof OffscreenCanvas !== "undefined" &&
+  "transferControlToOffscreen" in HTMLCanvasElement.prototype;
+
+export {
+  AnyCanvas,
+  AnyContext2D,
+  isOffscreen,
+  createCanvas,
+  getContext2D,
+  canvasToDataURL,
+  loadImage,
+  setPageImageLoader,
+  nextFrame,
+  canTransferCanvas,
+};
@@ -0,0 +1,24 @@
+// SHA-256 hashes as hex strings, for cache keys and content versions
+
+const toHex = (buffer: ArrayBuffer) =>
+  Array.from(new Uint8Array(buffer), (b) =>
+    b.toString(16).padStart(2, "0")
+  ).join("");
+
+// each part is hashed on its own, so no two different lists of parts collide
+const hashParts = async (parts: (string | ArrayBuffer | Uint8Array)[]) => {
+  const encoder = new TextEncoder();
+  const digests = await Promise.all(
+    parts.map((part) =>
+      crypto.subtle.digest(
+        "SHA-256",
+        typeof part === "string" ? encoder.encode(part) : part
+      )
+    )
+  );
+  const all = new Uint8Array(digests.length * 32);
+  digests.forEach((digest, i) => all.set(new Uint8Array(digest), i * 32));
+  return toHex(await crypto.subtle.digest("SHA-256", all));
+};
+
+export { hashParts };
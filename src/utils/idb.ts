@@ -0,0 +1,32 @@
+// Minimal promise wrappers around IndexedDB, shared by the persistent stores
+
+const openDb = (
+  name: string,
+  version: number,
+  upgrade: (db: IDBDatabase, oldVersion: number) => void
+) =>
+  new Promise<IDBDatabase>((resolve, reject) => {
+    if (typeof indexedDB === "undefined") {
+      reject(new Error("IndexedDB not available"));
+      return;
+    }
+    const request = indexedDB.open(name, version);
+    request.onupgradeneeded = (e) => upgrade(request.result, e.oldVersion);
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+
+const requestToPromise = <T>(request: IDBRequest<T>) =>
+  new Promise<T>((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+
+const transactionDone = (tx: IDBTransaction) =>
+  new Promise<void>((resolve, reject) => {
+    tx.oncomplete = () => resolve();
+    tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  });
+
+export { openDb, requestToPromise, transactionDone };
@@ -0,0 +1,30 @@
+// Runs the tasks given to the returned function with at most `limit` of them
+// running at once; the rest wait in order
+function runTasksWithLimit(limit: number) {
+  let active = 0;
+  const q: Array<() => void> = [];
+
+  const runNext = () => {
+    active--;
+    q.shift()?.();
+  };
+
+  return <T>(task: () => Promise<T>) =>
+    new Promise<T>((resolve, reject) => {
+      const run = () => {
+        active++;
+        task()
+          .then((v) => {
+            resolve(v);
+            runNext();
+          })
+          .catch((e) => {
+            reject(e);
+            runNext();
+          });
+      };
+      active < limit ? run() : q.push(run);
+    });
+}
+
+export { runTasksWithLimit };
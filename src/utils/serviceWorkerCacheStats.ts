@@ -0,0 +1,21 @@
+// Hits and misses of the service worker's caches (pysw.js) since it last
+// started: pyodide, static (init.py) and content (book files), by outcome
+// (hit, miss, unchanged, updated). null when no service worker controls the
+// page or it doesn't answer
+type CacheStats = Record<string, Record<string, number>>;
+
+const serviceWorkerCacheStats = () =>
+  new Promise<CacheStats | null>((res) => {
+    const controller = navigator.serviceWorker?.controller;
+    if (!controller) {
+      res(null);
+      return;
+    }
+    const channel = new MessageChannel();
+    channel.port1.onmessage = (e) => res(e.data.stats ?? null);
+    controller.postMessage({ cmd: "ps-cache-stats" }, [channel.port2]);
+    setTimeout(() => res(null), 1000);
+  });
+
+export default serviceWorkerCacheStats;
+export { CacheStats };
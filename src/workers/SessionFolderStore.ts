@@ -0,0 +1,124 @@
+import { openDb, requestToPromise, transactionDone } from "../utils/idb";
+
+// Persistent copy of the worker's session/ folder in IndexedDB, so a restarted
+// worker (or a reloaded page) gets its files back without the page sending them.
+// Each book has its own files. Changes are only queued by path; the current file
+// system content is read and written in one transaction once changes have
+// settled.
+
+const DB_NAME = "python-sponge-session";
+const STORE = "files";
+const BOOK_INDEX = "book";
+const PERSIST_DELAY = 1000; // ms without changes before writing
+const PERSIST_MAX_DELAY = 5000; // ms; write at least this often while busy
+
+type StoredSessionFile = {
+  book: string;
+  path: string;
+  data: Uint8Array;
+  mtime: number;
+  version: string;
+};
+
+class SessionFolderStore {
+  private db: Promise<IDBDatabase> | null = null;
+  // path -> true to store, false to delete
+  private pending = new Map<string, boolean>();
+  private timer: ReturnType<typeof setTimeout> | null = null;
+  private firstPendingTime = 0;
+  private writes: Promise<void> = Promise.resolve();
+
+  // reads the current content of a file, or null if it shouldn't be stored
+  constructor(
+    readonly book: string,
+    private read: (path: string) => Omit<StoredSessionFile, "book"> | null
+  ) {}
+
+  private getDb() {
+    if (!this.db) {
+      this.db = openDb(DB_NAME, 2, (db, oldVersion) => {
+        if (oldVersion < 2 && db.objectStoreNames.contains(STORE)) {
+          db.deleteObjectStore(STORE); // files of all books together
+        }
+        const store = db.createObjectStore(STORE, {
+          keyPath: ["book", "path"],
+        });
+        store.createIndex(BOOK_INDEX, "book");
+      });
+    }
+    return this.db;
+  }
+
+  async restore(): Promise<StoredSessionFile[]> {
+    const db = await this.getDb();
+    return requestToPromise<StoredSessionFile[]>(
+      db
+        .transaction(STORE, "readonly")
+        .objectStore(STORE)
+        .index(BOOK_INDEX)
+        .getAll(this.book)
+    );
+  }
+
+  changed(path: string) {
+    this.queue(path, true);
+  }
+
+  removed(path: string) {
+    this.queue(path, false);
+  }
+
+  private queue(path: string, store: boolean) {
+    const now = Date.now();
+    if (!this.pending.size) {
+      this.firstPendingTime = now;
+    }
+    this.pending.set(path, store);
+    if (this.timer) {
+      clearTimeout(this.timer);
+    }
+    const delay = Math.min(
+      PERSIST_DELAY,
+      this.firstPendingTime + PERSIST_MAX_DELAY - now
+    );
+    this.timer = setTimeout(() => this.flush(), Math.max(0, delay));
+  }
+
+  flush() {
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = null;
+    }
+    const batch = this.pending;
+    this.pending = new Map();
+    if (!batch.size) return this.writes;
+    const files: StoredSessionFile[] = [];
+    const deleted: string[] = [];
+    batch.forEach((store, path) => {
+      const file = store ? this.read(path) : null;
+      if (file) {
+        files.push({ ...file, book: this.book });
+      } else {
+        deleted.push(path);
+      }
+    });
+    this.writes = this.writes
+      .then(() => this.getDb())
+      .then((db) => {
+        const tx = db.transaction(STORE, "readwrite");
+        const store = tx.objectStore(STORE);
+        for (const file of files) {
+          store.put(file);
+        }
+        for (const path of deleted) {
+          store.delete([this.book, path]);
+        }
+        return transactionDone(tx);
+      })
+      .catch((e) => console.log("Error persisting session files", e));
+    return this.writes;
+  }
+}
+
+export default SessionFolderStore;
+export { StoredSessionFile };
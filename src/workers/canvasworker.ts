@@ -0,0 +1,110 @@
+/// <reference lib="webworker" />
+
+import {
+  CanvasWorkerData,
+  CanvasWorkerResponse,
+} from "../coderunner/WorkerDtos";
+import { setPageImageLoader } from "../utils/canvasTools";
+import { processCanvasCommand } from "../challenge/components/Outputs/CanvasDisplay/CanvasController";
+import {
+  processTurtleCommand,
+  resizeScreen,
+  setVirtualMode,
+} from "../challenge/components/Outputs/CanvasDisplay/TurtleController";
+
+// Draws the canvas and turtle output on the OffscreenCanvas the display canvas
+// handed over, off the page's main thread. Canvas commands of a run come
+// straight from the Python worker over a MessagePort; turtle commands still
+// come through the page, which answers the blocked Python worker through the
+// service worker. The worker presents a frame after each message it handles.
+// Images for drawImage are loaded by the page and handed over as ImageBitmaps.
+
+type CanvasWorkerContext = {
+  canvas: OffscreenCanvas | null;
+  context: OffscreenCanvasRenderingContext2D | null;
+  // from the Python worker, for the current run
+  port: MessagePort | null;
+};
+
+const canvasWorkerContext: CanvasWorkerContext = {
+  canvas: null,
+  context: null,
+  port: null,
+};
+
+const draw = (commands: any[]) => {
+  const context = canvasWorkerContext.context;
+  if (!context) {
+    return;
+  }
+  for (const command of commands) {
+    processCanvasCommand(context, command);
+  }
+};
+
+const respond = (response: CanvasWorkerResponse) => self.postMessage(response);
+
+const imageRequests = new Map<
+  number,
+  { res: (bitmap: ImageBitmap) => void; rej: (e: Error) => void }
+>();
+let nextImageRequestId = 0;
+
+setPageImageLoader(
+  (url) =>
+    new Promise((res, rej) => {
+      const requestId = nextImageRequestId++;
+      imageRequests.set(requestId, { res, rej });
+      respond({ cmd: "load-image", requestId, url });
+    })
+);
+
+self.onmessage = (e: MessageEvent<CanvasWorkerData>) => {
+  const { canvas } = canvasWorkerContext;
+  if (e.data.cmd === "init") {
+    canvasWorkerContext.canvas = e.data.canvas;
+    canvasWorkerContext.context = e.data.canvas.getContext("2d");
+  } else if (e.data.cmd === "port") {
+    // a new run; the port of the previous one has no more to say
+    canvasWorkerContext.port?.close();
+    const port = e.data.port;
+    port.onmessage = (msg: MessageEvent<string>) => draw(JSON.parse(msg.data));
+    canvasWorkerContext.port = port;
+  } else if (e.data.cmd === "draw") {
+    draw(e.data.commands);
+  } else if (e.data.cmd === "image") {
+    const request = imageRequests.get(e.data.requestId);
+    imageRequests.delete(e.data.requestId);
+    if (e.data.bitmap) {
+      request?.res(e.data.bitmap);
+    } else {
+      request?.rej(new Error(e.data.error || "Unknown error"));
+    }
+  } else if (!canvas) {
+    console.log("canvas worker not initialised", e.data);
+  } else if (e.data.cmd === "turtle") {
+    const { requestId, id, action } = e.data;
+    processTurtleCommand(id, action, canvas)
+      .then((data) =>
+        respond({
+          cmd: "turtle-resp",
+          requestId,
+          data: data || undefined,
+        })
+      )
+      .catch((err: any) =>
+        respond({
+          cmd: "turtle-resp",
+          requestId,
+          error: err?.message || "Unknown error",
+        })
+      );
+  } else if (e.data.cmd === "turtle-setup") {
+    canvas.width = e.data.width;
+    canvas.height = e.data.height;
+    resizeScreen(e.data.width, e.data.height);
+    processTurtleCommand(e.data.id, { action: "reset" }, canvas);
+  } else if (e.data.cmd === "turtle-reset") {
+    setVirtualMode(canvas, e.data.virtual);
+  }
+};
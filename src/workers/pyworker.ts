@@ -1,17 +1,44 @@
 /// <reference lib="webworker" />
 
 import { TestCase } from "../models/Tests";
-import { WorkerData, WorkerTestDto } from "../coderunner/WorkerDtos";
+import {
+  RunMemoryStats,
+  WorkerData,
+  WorkerTestDto,
+} from "../coderunner/WorkerDtos";
+import { LazyFileMount } from "../coderunner/LazyFileStore";
 import { PyodideInterface } from "../types/pyodide/main";
 import { SessionFile } from "../models/SessionFile";
+import { drainEvents, resetEventQueue } from "../coderunner/EventQueue";
+import SessionFolderStore from "./SessionFolderStore";
 
 type WorkerContext = {
   pyodide: PyodideInterface | null;
   interruptBufferToSet: Uint8Array | null;
   interruptBuffer: Uint8Array | null;
   keyDownBuffer: Uint8Array | null;
+  eventBuffer: Int32Array | null;
   micropipInitialised: boolean;
-  sessionFileLockTime: number | null;
+  sessionFileIndex: Map<string, SessionFileIndexEntry>;
+  sessionFileVersion: number;
+  // absolute path -> url of files that are still lazy (not yet written to)
+  lazyFiles: Map<string, string>;
+  homeDir: string;
+  // persistent copy of session/, once the page has said which book is open
+  sessionFolderStore: SessionFolderStore | null;
+  sessionBook: string | null;
+  // work that runs have to wait for (session restore, package loading)
+  backgroundTasks: Set<Promise<unknown>>;
+  // to the canvas worker during a run, if the page has one
+  canvasPort: MessagePort | null;
+  canvasPortUsed: boolean;
+};
+
+// what we know about each file under session/, kept across runs
+type SessionFileIndexEntry = {
+  mtime: number;
+  size: number;
+  version: string;
 };
 
 const workerContext: WorkerContext = {
@@ -19,10 +46,22 @@ const workerContext: WorkerContext = {
   interruptBufferToSet: null,
   interruptBuffer: null,
   keyDownBuffer: null,
+  eventBuffer: null,
   micropipInitialised: false,
-  sessionFileLockTime: null,
+  sessionFileIndex: new Map(),
+  sessionFileVersion: 0,
+  lazyFiles: new Map(),
+  homeDir: "",
+  sessionFolderStore: null,
+  sessionBook: null,
+  backgroundTasks: new Set(),
+  canvasPort: null,
+  canvasPortUsed: false,
 };
 
+// runs whose imports have already been checked
+const importsChecked = new WeakSet<MessageEvent>();
+
 // communication with the main site
 // there are two commands implemented at the moment:
 //   run(code) which runs a piece of code
@@ -30,42 +69,74 @@ const workerContext: WorkerContext = {
 // the assumption is that run will not be called while there is an active Python code running
 // also, there is an assumption that there cannot be two synchronouse inputs
 self.onmessage = (e: MessageEvent<WorkerData>) => {
+  if (e.data.cmd === "debug" || e.data.cmd === "run" || e.data.cmd === "test") {
+    if (!importsChecked.has(e)) {
+      importsChecked.add(e);
+      loadImports(e.data.code, true);
+    }
+    if (workerContext.backgroundTasks.size) {
+      Promise.allSettled(Array.from(workerContext.backgroundTasks)).then(() =>
+        self.onmessage!(e)
+      );
+      return;
+    }
+  }
   if (e.data.cmd === "init") {
+    workerContext.sessionBook = e.data.sessionBook;
     initialise(e.data.standalone);
     return;
+  } else if (e.data.cmd === "session-book") {
+    workerContext.sessionBook = e.data.book;
+    // before initialisation is done, it opens the folder itself
+    if (workerContext.pyodide && workerContext.homeDir) {
+      trackBackgroundTask(openSessionFolder(e.data.book));
+    }
   } else if (e.data.cmd === "setSharedBuffers") {
     if (workerContext.pyodide) {
-      workerContext.pyodide.setInterruptBuffer(e.data.interruptBuffer);
+      setSignalBuffer(e.data.interruptBuffer);
       workerContext.interruptBufferToSet = null;
     } else {
       workerContext.interruptBufferToSet = e.data.interruptBuffer;
     }
     workerContext.interruptBuffer = e.data.interruptBuffer;
     workerContext.keyDownBuffer = e.data.keyDownBuffer;
+    workerContext.eventBuffer = e.data.eventBuffer;
   } else if (e.data.cmd === "install-deps") {
-    const data = e.data;
-    (async () => {
-      for (const dep of data.deps) {
-        await installPackage(dep);
-      }
+    installPackages(e.data.deps).then(() => {
       self.postMessage({
         cmd: "install-deps-finished",
       });
-    })();
+    });
+  } else if (e.data.cmd === "prefetch-imports") {
+    loadImports(e.data.code, false);
+  } else if (e.data.cmd === "bridge-stats") {
+    self.postMessage({
+      cmd: "bridge-stats",
+      stats: workerContext.pyodide ? pyFunction("bridge_report")() : null,
+    });
   } else if (e.data.cmd === "debug") {
     if (!workerContext.pyodide) {
       workerPrint("Pyodide not yet initialised");
       return;
     }
     let reason = "ok";
+    if (workerContext.eventBuffer) {
+      resetEventQueue(workerContext.eventBuffer);
+    }
+    workerContext.canvasPort = e.data.canvasPort ?? null;
+    workerContext.canvasPortUsed = false;
+    // sync session files first, so the worker never misses files the page
+    // considers delivered
+    if (e.data.isSessionFilesAllowed) {
+      initialiseSessionFiles(e.data.sessionFiles, e.data.sessionFileNames);
+    }
+    mountLazyFiles(e.data.lazyFiles);
+    armMemoryLimit(e.data.memoryLimit);
     try {
       if (e.data.initCode) {
-        workerContext.pyodide.globals.get("pyexec")(e.data.initCode, [], []);
-      }
-      if (e.data.isSessionFilesAllowed) {
-        initialiseSessionFiles(e.data.sessionFiles);
+        pyFunction("pyexec")(e.data.initCode, [], []);
       }
-      workerContext.pyodide.globals.get("pydebug")(
+      pyFunction("pydebug")(
         e.data.code,
         e.data.breakpoints,
         e.data.watches
@@ -73,6 +144,8 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
     } catch (err: any) {
       if (err.message.includes("KeyboardInterrupt")) {
         reason = "interrupt";
+      } else if (err.message.includes("MemoryLimitExceeded")) {
+        reason = "memory";
       } else {
         err = err.toString();
         err = err.replace(
@@ -86,24 +159,35 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
     const updatedSessionFiles = e.data.isSessionFilesAllowed
       ? getUpdatedSessionFiles()
       : [];
-    self.postMessage({ cmd: "debug-finished", reason, updatedSessionFiles });
+    postDebugFinished(reason, updatedSessionFiles, resetRun());
   } else if (e.data.cmd === "run") {
     if (!workerContext.pyodide) {
       workerPrint("Pyodide not yet initialised");
       return;
     }
     let reason = "ok";
+    if (workerContext.eventBuffer) {
+      resetEventQueue(workerContext.eventBuffer);
+    }
+    workerContext.canvasPort = e.data.canvasPort ?? null;
+    workerContext.canvasPortUsed = false;
+    // sync session files first, so the worker never misses files the page
+    // considers delivered
+    if (e.data.isSessionFilesAllowed) {
+      initialiseSessionFiles(e.data.sessionFiles, e.data.sessionFileNames);
+    }
+    mountLazyFiles(e.data.lazyFiles);
+    armMemoryLimit(e.data.memoryLimit);
     try {
       if (e.data.initCode) {
-        workerContext.pyodide.globals.get("pyexec")(e.data.initCode, [], []);
-      }
-      if (e.data.isSessionFilesAllowed) {
-        initialiseSessionFiles(e.data.sessionFiles);
+        pyFunction("pyexec")(e.data.initCode, [], []);
       }
-      workerContext.pyodide.globals.get("pyrun")(e.data.code);
+      pyFunction("pyrun")(e.data.code);
     } catch (err: any) {
       if (err.message.includes("KeyboardInterrupt")) {
         reason = "interrupt";
+      } else if (err.message.includes("MemoryLimitExceeded")) {
+        reason = "memory";
       } else {
         workerPrint(err);
         reason = "error";
@@ -112,15 +196,16 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
     const updatedSessionFiles = e.data.isSessionFilesAllowed
       ? getUpdatedSessionFiles()
       : [];
-    self.postMessage({ cmd: "debug-finished", reason, updatedSessionFiles });
+    postDebugFinished(reason, updatedSessionFiles, resetRun());
   } else if (e.data.cmd === "test") {
     if (!workerContext.pyodide) {
       workerPrint("Pyodide not yet initialised");
       return;
     }
     if (e.data.isSessionFilesAllowed) {
-      initialiseSessionFiles(e.data.sessionFiles);
+      initialiseSessionFiles(e.data.sessionFiles, e.data.sessionFileNames);
     }
+    mountLazyFiles(e.data.lazyFiles);
     const data = e.data as WorkerTestDto;
     let results = data.tests.map((_: TestCase) => {
       return {
@@ -132,17 +217,36 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
     });
     try {
       if (data.initCode) {
-        workerContext.pyodide.globals.get("pyexec")(data.initCode, [], []);
+        pyFunction("pyexec")(data.initCode, [], []);
       }
       const tests = data.tests;
-      results = tests.map((test: TestCase) =>
-        workerContext.pyodide?.globals.get("pyexec")(
-          data.code,
-          test.in,
-          test.out,
-          test.reveal ?? true
-        )
-      );
+      const execute = pyFunction(data.coverage ? "pyexec_covered" : "pyexec");
+      results = tests.map((test: TestCase) => {
+        // each test case gets the full limit
+        armMemoryLimit(data.memoryLimit);
+        try {
+          return execute(
+            data.code,
+            test.in,
+            test.out,
+            test.reveal ?? true,
+            data.bookNode.isVirtualClock ?? false,
+            data.bookNode.virtualClockStart ?? null
+          );
+        } catch (err: any) {
+          // the limit was hit outside the program, e.g. checking its output
+          if (!err.message?.includes("MemoryLimitExceeded")) {
+            throw err;
+          }
+          return {
+            outcome: false,
+            err: "Memory limit exceeded",
+            peak: memoryGuard.peak,
+            ins: test.in,
+          };
+        }
+      });
+      memoryGuard.limit = 0; // the coverage report isn't limited
     } catch (err: any) {
       if (err.message.includes("KeyboardInterrupt")) {
         results = data.tests.map((_: TestCase) => {
@@ -157,15 +261,29 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
         console.log("Error while running tests", err);
       }
     }
+    let coverage = undefined;
+    if (data.coverage) {
+      try {
+        coverage = pyFunction("coverage_report")(data.code);
+      } catch (err: any) {
+        console.log("Error reporting coverage", err);
+      }
+    }
     self.postMessage({
       cmd: "test-finished",
       results,
       code: data.code,
       bookNode: data.bookNode,
+      invalidatedSessionFiles: discardTestSessionChanges(),
+      memory: resetRun(),
+      coverage,
     });
   } else if (e.data.cmd === "draw-turtle-example") {
+    if (!workerContext.pyodide) {
+      return;
+    }
     try {
-      workerContext.pyodide?.globals.get("pyexec")(
+      pyFunction("pyexec")(
         e.data.code,
         e.data.inputs,
         []
@@ -173,6 +291,7 @@ self.onmessage = (e: MessageEvent<WorkerData>) => {
     } catch (err: any) {
       console.log("Error while running turtle test draw", err);
     }
+    resetRun();
     workerPostMessage({
       cmd: "draw-turtle-example-finished",
       bookNode: e.data.bookNode,
@@ -189,54 +308,279 @@ const initialiseSessionFolder = () => {
   }
 };
 
-const initialiseSessionFiles = (sessionFiles: SessionFile[] | null) => {
+const statSessionFile = (path: string) => {
+  const stat = workerContext.pyodide!.FS.stat(path);
+  return { mtime: Number(stat.mtime), size: stat.size as number };
+};
+
+// write only the files that changed on the page, and remove the ones the page
+// no longer has. Files already in MEMFS are left untouched
+const initialiseSessionFiles = (
+  sessionFiles: SessionFile[] | null,
+  sessionFileNames?: string[]
+) => {
   if (!workerContext.pyodide || !sessionFiles) {
     return;
   }
+  const FS = workerContext.pyodide.FS;
+  const index = workerContext.sessionFileIndex;
   for (const file of sessionFiles) {
-    workerContext.pyodide.FS.writeFile(`session/${file.filename}`, file.data);
+    const path = `session/${file.filename}`;
+    const dir = path.substring(0, path.lastIndexOf("/"));
+    if (dir !== "session") {
+      FS.mkdirTree(dir);
+    }
+    unmountLazyFile(path);
+    // the data is a transferred copy, so MEMFS can take ownership of it
+    FS.writeFile(path, file.data, { canOwn: true });
+    index.set(path, {
+      ...statSessionFile(path),
+      version: file.version || "",
+    });
+    workerContext.sessionFolderStore?.changed(path);
+  }
+  if (sessionFileNames) {
+    const keep = new Set(sessionFileNames.map((name) => `session/${name}`));
+    index.forEach((_entry, path) => {
+      if (!keep.has(path)) {
+        try {
+          FS.unlink(path);
+        } catch (e) {
+          console.log("Error removing session file", path, e);
+        }
+        index.delete(path);
+        workerContext.lazyFiles.delete(absolutePath(path));
+        workerContext.sessionFolderStore?.removed(path);
+      }
+    });
   }
-  workerContext.sessionFileLockTime = Date.now();
 };
 
-const getUpdatedSessionFiles = () => {
-  const sessionFilesUpdated: SessionFile[] = [];
+// Lazy files: large files are not copied into MEMFS, but mounted as Emscripten
+// lazy files reading 1 MiB blocks via synchronous range requests, which the
+// service worker serves from the page's cache. They are read-only; opening one
+// for writing from Python materialises it first (copy-on-write, see init.py)
+
+const absolutePath = (path: string) =>
+  path.startsWith("/") ? path : `${workerContext.homeDir}/${path}`;
 
-  const py = `def snapshot(root): 
-  snap = {} 
-  for dirpath, _, filenames in os.walk(root): 
-    for name in filenames: 
-      p = os.path.join(dirpath, name) 
-      st = os.stat(p) 
-      snap[p] = int(st.st_mtime_ns) / 1000000
-  return snap
-session_snapshot = to_js(snapshot("session"))
-session_snapshot`;
-  const snapshot = workerContext.pyodide?.runPython(py);
-  const fileNames = Object.keys(snapshot);
-
-  for (const fileName of fileNames) {
-    const lastModifiedTime = snapshot[fileName];
+const unmountLazyFile = (path: string) => {
+  const absPath = absolutePath(path);
+  if (workerContext.lazyFiles.delete(absPath)) {
+    try {
+      workerContext.pyodide!.FS.unlink(absPath);
+    } catch (e) {
+      console.log("Error removing lazy file", path, e);
+    }
+  }
+};
+
+const mountLazyFiles = (mounts?: LazyFileMount[]) => {
+  if (!workerContext.pyodide || !mounts) {
+    return;
+  }
+  const FS = workerContext.pyodide.FS as any;
+  for (const { path, url } of mounts) {
+    const absPath = absolutePath(path);
     if (
-      workerContext.sessionFileLockTime &&
-      lastModifiedTime > workerContext.sessionFileLockTime
+      workerContext.lazyFiles.get(absPath) === url &&
+      FS.analyzePath(absPath).exists
     ) {
+      continue; // still mounted and untouched
+    }
+    const slash = absPath.lastIndexOf("/");
+    const dir = absPath.substring(0, slash);
+    FS.mkdirTree(dir);
+    if (FS.analyzePath(absPath).exists) {
+      FS.unlink(absPath);
+    }
+    if (typeof FS.createLazyFile === "function") {
+      FS.createLazyFile(dir, absPath.substring(slash + 1), url, true, false);
+      workerContext.lazyFiles.set(absPath, url);
+    } else {
+      // no lazy file support in this build: fetch the whole file
+      const xhr = new XMLHttpRequest();
+      xhr.open("GET", url, false);
+      xhr.responseType = "arraybuffer";
+      xhr.send();
+      FS.writeFile(absPath, new Uint8Array(xhr.response), { canOwn: true });
+    }
+    if (path.startsWith("session/")) {
+      workerContext.sessionFileIndex.set(path, {
+        ...statSessionFile(path),
+        version: decodeURIComponent(url.split("/")[2]),
+      });
+      // served by the page's cache, no need to keep a copy
+      workerContext.sessionFolderStore?.removed(path);
+    }
+  }
+};
+
+const listSessionFiles = (dir: string, out: string[] = []) => {
+  const FS = workerContext.pyodide!.FS;
+  for (const name of FS.readdir(dir)) {
+    if (name === "." || name === "..") continue;
+    const path = `${dir}/${name}`;
+    const stat = FS.stat(path);
+    if (FS.isDir(stat.mode)) {
+      listSessionFiles(path, out);
+    } else if (FS.isFile(stat.mode)) {
+      out.push(path);
+    }
+  }
+  return out;
+};
+
+// compare the file system against the mtime/size index; only files that are new
+// or whose metadata changed are read back
+const getUpdatedSessionFiles = () => {
+  const sessionFilesUpdated: SessionFile[] = [];
+  if (!workerContext.pyodide) {
+    return sessionFilesUpdated;
+  }
+  const index = workerContext.sessionFileIndex;
+  for (const fileName of listSessionFiles("session")) {
+    const { mtime, size } = statSessionFile(fileName);
+    const known = index.get(fileName);
+    if (known && known.mtime === mtime && known.size === size) {
+      continue;
+    }
+    // @ts-ignore
+    const file = workerContext.pyodide.FS.readFile(fileName);
+    const version = `w${Date.now().toString(36)}-${workerContext
+      .sessionFileVersion++}`;
+    index.set(fileName, { mtime, size, version });
+    workerContext.sessionFolderStore?.changed(fileName);
+    sessionFilesUpdated.push({
+      filename: fileName,
+      data: file as string | Uint8Array,
+      isText:
+        fileName.endsWith(".txt") ||
+        fileName?.endsWith(".csv") ||
+        fileName?.endsWith(".json"), // probably not an exhaustive list
+      version,
+    });
+  }
+  return sessionFilesUpdated;
+};
+
+// tests leave session/ as the page sent it: files they created are removed, and
+// files they changed or removed are dropped as well, so the page sends its own
+// version again. Returns the paths the page has to send again
+const discardTestSessionChanges = () => {
+  const invalidated: string[] = [];
+  if (!workerContext.pyodide) {
+    return invalidated;
+  }
+  const FS = workerContext.pyodide.FS;
+  const index = workerContext.sessionFileIndex;
+  const forget = (path: string) => {
+    invalidated.push(path);
+    index.delete(path);
+    workerContext.sessionFolderStore?.removed(path);
+  };
+  let listed: string[] = [];
+  try {
+    listed = listSessionFiles("session");
+  } catch (e) {
+    initialiseSessionFolder(); // the tests removed the folder itself
+  }
+  const present = new Set(listed);
+  present.forEach((path) => {
+    const known = index.get(path);
+    if (known) {
+      const { mtime, size } = statSessionFile(path);
+      if (known.mtime === mtime && known.size === size) {
+        return;
+      }
+      forget(path);
+    }
+    try {
+      FS.unlink(path);
+    } catch (e) {
+      console.log("Error removing session file", path, e);
+    }
+    workerContext.lazyFiles.delete(absolutePath(path));
+  });
+  index.forEach((_entry, path) => {
+    if (!present.has(path)) {
+      forget(path);
+      workerContext.lazyFiles.delete(absolutePath(path));
+    }
+  });
+  return invalidated;
+};
+
+// content to persist for a session file; lazy files are never stored
+const readSessionFileForStore = (path: string) => {
+  const entry = workerContext.sessionFileIndex.get(path);
+  if (
+    !workerContext.pyodide ||
+    !entry ||
+    workerContext.lazyFiles.has(absolutePath(path))
+  ) {
+    return null;
+  }
+  try {
+    const FS = workerContext.pyodide.FS;
+    return {
+      path,
       // @ts-ignore
-      const file = workerContext.pyodide?.FS.readFile(fileName);
-      if (file) {
-        sessionFilesUpdated.push({
-          filename: fileName,
-          data: file as string | Uint8Array,
-          isText:
-            fileName.endsWith(".txt") ||
-            fileName?.endsWith(".csv") ||
-            fileName?.endsWith(".json"), // probably not an exhaustive list
-        });
+      data: FS.readFile(path) as Uint8Array,
+      mtime: Number(FS.stat(path).mtime),
+      version: entry.version,
+    };
+  } catch (e) {
+    return null; // removed by the program since
+  }
+};
+
+// switch the session folder to the files of the book: those of another book are
+// removed (after queueing their last changes), and the book's are brought back
+// from a previous worker. The page is told which versions are already here so
+// it doesn't send them again
+const openSessionFolder = async (book: string) => {
+  const previous = workerContext.sessionFolderStore;
+  if (previous?.book === book) {
+    return;
+  }
+  const FS = workerContext.pyodide!.FS;
+  if (previous) {
+    previous.flush(); // reads the files straight away
+    workerContext.sessionFileIndex.forEach((_entry, path) => {
+      try {
+        FS.unlink(path);
+      } catch (e) {
+        console.log("Error removing session file", path, e);
       }
+      workerContext.lazyFiles.delete(absolutePath(path));
+    });
+    workerContext.sessionFileIndex.clear();
+  }
+  const store = new SessionFolderStore(book, readSessionFileForStore);
+  workerContext.sessionFolderStore = store;
+  try {
+    const files = await store.restore();
+    if (workerContext.sessionFolderStore !== store) {
+      return; // another book was opened meanwhile
     }
+    for (const file of files) {
+      FS.mkdirTree(file.path.substring(0, file.path.lastIndexOf("/")));
+      FS.writeFile(file.path, file.data, { canOwn: true });
+      FS.utime(file.path, file.mtime, file.mtime);
+      workerContext.sessionFileIndex.set(file.path, {
+        ...statSessionFile(file.path),
+        version: file.version,
+      });
+    }
+    self.postMessage({
+      cmd: "session-restored",
+      book,
+      files: files.map((f) => ({ filename: f.path, version: f.version })),
+    });
+  } catch (e) {
+    console.log("Error restoring session files", e);
   }
-  workerContext.sessionFileLockTime = null;
-  return sessionFilesUpdated;
 };
 
 const initialiseMicroPip = async () => {
@@ -246,59 +590,352 @@ const initialiseMicroPip = async () => {
   workerContext.micropipInitialised = true;
 };
 
-const installPackage = async (packageName: string) => {
-  if (!workerContext.micropipInitialised) {
-    await initialiseMicroPip();
+const trackBackgroundTask = (task: Promise<unknown>) => {
+  workerContext.backgroundTasks.add(task);
+  task
+    .catch((e) => console.log("Error in background task", e))
+    .finally(() => workerContext.backgroundTasks.delete(task));
+};
+
+// Pyodide packages load concurrently; anything not in the Pyodide distribution
+// is installed from PyPI with micropip, which is only loaded for that
+const installPackages = async (packageNames: string[]) => {
+  const pyodide = workerContext.pyodide;
+  if (!pyodide) {
+    return;
   }
-  workerPrint(`Installing package: ${packageName}\n`);
+  const inLockfile = (name: string) =>
+    name.toLowerCase() in (pyodide.lockfile?.packages || {});
+  const loadFromPyodide = async (packageName: string) => {
+    workerPrint(`Installing package: ${packageName}\n`);
+    try {
+      await pyodide.loadPackage(packageName);
+      workerPrint(
+        `PythonSponge successfully installed package '${packageName}'\n`
+      );
+    } catch (err) {
+      console.log(err);
+      workerPrint(`Error installing package: ${packageName}\n${err}`);
+    }
+  };
+  const installFromPyPI = async (names: string[]) => {
+    if (!workerContext.micropipInitialised) {
+      await initialiseMicroPip();
+    }
+    workerPrint(`Installing package: ${names.join(", ")}\n`);
+    try {
+      await pyodide.pyimport("micropip").install(names);
+      for (const packageName of names) {
+        workerPrint(
+          `PythonSponge successfully installed package '${packageName}'\n`
+        );
+      }
+    } catch (err) {
+      console.log(err);
+      workerPrint(`Error installing package: ${names.join(", ")}\n${err}`);
+    }
+  };
+  const fromPypi = packageNames.filter((name) => !inLockfile(name));
+  await Promise.all([
+    ...packageNames.filter(inLockfile).map(loadFromPyodide),
+    fromPypi.length ? installFromPyPI(fromPypi) : null,
+  ]);
+};
+
+// start loading the Pyodide packages for imports in the code that can't be
+// resolved yet. Imports are found by parsing the code with ast, nothing runs
+const loadImports = (code: string, verbose: boolean) => {
+  const pyodide = workerContext.pyodide;
+  if (!pyodide || !code) {
+    return;
+  }
+  let missing: string[] = [];
   try {
-    await workerContext.pyodide?.loadPackage(packageName);
-    workerPrint(
-      `PythonSponge successfully installed package '${packageName}'\n`
-    );
-  } catch (err) {
-    console.log(err);
-    workerPrint(`Error installing package: ${packageName}\n${err}`);
+    const result = pyFunction("missing_imports")(code);
+    missing = result.toJs();
+    result.destroy();
+  } catch (e) {
+    console.log("Error scanning imports", e);
+    return;
+  }
+  if (!missing.length) {
+    return;
   }
+  trackBackgroundTask(
+    pyodide.loadPackagesFromImports(code, {
+      messageCallback: verbose ? (msg) => workerPrint(`${msg}\n`) : () => {},
+      errorCallback: (msg) => console.log(msg),
+    })
+  );
+};
+
+// Memory snapshots of the initialised interpreter (init.py run, turtle imported).
+// A snapshot only fits the exact Pyodide build and init.py it was made from, so
+// instead of shipping one, the first full start in a browser makes it and
+// caches it under a key derived from init.py
+const PYODIDE_VERSION = "v0.28.0";
+const SNAPSHOT_CACHE = `ps-pyodide-snapshot-${PYODIDE_VERSION}`;
+
+// identifies Pyodide and init.py; also reported to the page, which keys cached
+// test results by it
+const runtimeVersion = async (initPyCode: string) => {
+  const digest = await crypto.subtle.digest(
+    "SHA-256",
+    new TextEncoder().encode(initPyCode)
+  );
+  const hash = Array.from(new Uint8Array(digest).slice(0, 8), (b) =>
+    b.toString(16).padStart(2, "0")
+  ).join("");
+  return `${PYODIDE_VERSION}-${hash}`;
+};
+
+const loadSnapshot = async (key: string) => {
+  const cache = await caches.open(SNAPSHOT_CACHE);
+  const response = await cache.match(key);
+  return response ? new Uint8Array(await response.arrayBuffer()) : null;
 };
 
+const storeSnapshot = async (key: string, snapshot: Uint8Array | null) => {
+  const cache = await caches.open(SNAPSHOT_CACHE);
+  // snapshots of older init.py versions are useless
+  for (const request of await cache.keys()) {
+    await cache.delete(request);
+  }
+  if (snapshot) {
+    await cache.put(key, new Response(snapshot));
+  }
+};
+
+// the only JS object Python keeps at snapshot time is the global scope (import js)
+const snapshotSerializer = (obj: any) => {
+  if (obj === self) {
+    return { global: true };
+  }
+  throw new Error(`Cannot snapshot JS object ${obj}`);
+};
+const snapshotDeserializer = (obj: any) => (obj?.global ? self : undefined);
+
 const initialise = async (standalone: boolean) => {
+  const startTime = performance.now();
   const pyodideImportPath = standalone
-    ? "/static/cdn-mirror/pyodide/v0.28.0/full/pyodide.js"
-    : "https://cdn.jsdelivr.net/pyodide/v0.28.0/full/pyodide.js";
+    ? `/static/cdn-mirror/pyodide/${PYODIDE_VERSION}/full/pyodide.js`
+    : `https://cdn.jsdelivr.net/pyodide/${PYODIDE_VERSION}/full/pyodide.js`;
 
   const pyodideIndexUrl = standalone
-    ? "/static/cdn-mirror/pyodide/v0.28.0/full/"
-    : "https://cdn.jsdelivr.net/pyodide/v0.28.0/full/";
+    ? `/static/cdn-mirror/pyodide/${PYODIDE_VERSION}/full/`
+    : `https://cdn.jsdelivr.net/pyodide/${PYODIDE_VERSION}/full/`;
 
   // dynamically import library from pyodideImportPath
   importScripts(pyodideImportPath);
   const loadPyodide = (self as any).loadPyodide as (opts: {
     indexURL: string;
+    _makeSnapshot?: boolean;
+    _loadSnapshot?: Uint8Array;
+    _snapshotDeserializer?: (obj: any) => any;
   }) => Promise<PyodideInterface>;
 
-  // await in parallel
-  const [initPyPromise, pyodidePromise] = await Promise.all([
-    fetch("/static/js/init.py"),
-    loadPyodide({ indexURL: pyodideIndexUrl }),
-  ]);
-  const initPyCode = await initPyPromise.text();
-  workerContext.pyodide = await pyodidePromise;
-  if (workerContext.interruptBufferToSet) {
-    workerContext.pyodide?.setInterruptBuffer(
-      workerContext.interruptBufferToSet
-    );
-    workerContext.interruptBufferToSet = null;
-  }
-  await workerContext.pyodide?.runPythonAsync(initPyCode);
+  const initPyCode = await (await fetch("/static/js/init.py")).text();
+  const runtime = crypto.subtle ? await runtimeVersion(initPyCode) : null;
+  const key =
+    runtime && typeof caches !== "undefined"
+      ? `/@snapshot@/${runtime}.bin`
+      : null;
+  const snapshot = key ? await loadSnapshot(key).catch(() => null) : null;
+
+  let startMode: "snapshot" | "full" = "full";
+  if (snapshot) {
+    try {
+      workerContext.pyodide = await loadPyodide({
+        indexURL: pyodideIndexUrl,
+        _loadSnapshot: snapshot,
+        _snapshotDeserializer: snapshotDeserializer,
+      });
+      // the file system isn't part of the snapshot
+      workerContext.pyodide.globals.get("write_runtime_files")();
+      startMode = "snapshot";
+    } catch (e) {
+      console.log("Error starting from memory snapshot, discarding it", e);
+      workerContext.pyodide = null;
+      storeSnapshot(key!, null);
+    }
+  }
+  if (!workerContext.pyodide) {
+    workerContext.pyodide = await loadPyodide({
+      indexURL: pyodideIndexUrl,
+      _makeSnapshot: !!key,
+    });
+    await workerContext.pyodide.runPythonAsync(initPyCode);
+    workerContext.pyodide.runPython("import turtle");
+    if (key) {
+      try {
+        storeSnapshot(
+          key,
+          workerContext.pyodide.makeMemorySnapshot({
+            serializer: snapshotSerializer,
+          })
+        ).catch((e) => console.log("Error storing memory snapshot", e));
+      } catch (e) {
+        console.log("Error making memory snapshot", e);
+      }
+    }
+  }
+  memoryGuard.signal = workerContext.pyodide.globals.get(
+    "MEMORY_LIMIT_SIGNAL"
+  );
+  patternBudget.signal = workerContext.pyodide.globals.get(
+    "PATTERN_BUDGET_SIGNAL"
+  );
+  outputFlush.signal = workerContext.pyodide.globals.get("OUTPUT_FLUSH_SIGNAL");
+  // without shared buffers there is no interrupt, but the memory limit still works
+  setSignalBuffer(workerContext.interruptBufferToSet || new Uint8Array(1));
+  workerContext.interruptBufferToSet = null;
   initialiseSessionFolder();
-  self.postMessage({ cmd: "init-done" });
+  workerContext.homeDir = workerContext.pyodide!.FS.cwd();
+  if (workerContext.sessionBook !== null) {
+    trackBackgroundTask(openSessionFolder(workerContext.sessionBook));
+  }
+  pyFunction("capture_baseline")();
+  const startupTime = Math.round(performance.now() - startTime);
+  self.postMessage({
+    cmd: "init-done",
+    startup: { mode: startMode, time: startupTime },
+    runtime,
+  });
+};
+
+// Memory limit. Pyodide reads interruptBuffer[0] every few dozen bytecodes to
+// check for signals, so the buffer it gets is wrapped: the same check compares
+// the Wasm heap with the run's limit and raises MEMORY_LIMIT_SIGNAL in Python
+// when it is exceeded (see memory_limit_handler in init.py)
+const memoryGuard = {
+  signal: 0, // 0 if Python has no handler
+  limit: 0, // heap size in bytes at which the run is stopped, 0 for no limit
+  start: 0, // heap size when the run started
+  peak: 0, // how much the run grew the heap when it was stopped
+};
+
+// Test patterns that could backtrack for a long time run with a deadline,
+// checked in the same place (see pattern_budget_handler in init.py)
+const patternBudget = {
+  signal: 0, // 0 if Python has no handler
+  deadline: 0, // performance.now() at which the pattern is stopped, 0 for none
+};
+
+// Buffered print output is flushed once its time slice is over, checked in the
+// same place too (see output_flush_handler in init.py)
+const outputFlush = {
+  signal: 0, // 0 if Python has no handler
+  due: 0, // performance.now() at which the output is flushed, 0 for none
+};
+
+const heapSize = (): number =>
+  (workerContext.pyodide as any)._module.HEAPU8.length;
+
+const armMemoryLimit = (limit?: number) => {
+  memoryGuard.start = heapSize();
+  memoryGuard.limit =
+    limit && memoryGuard.signal ? memoryGuard.start + limit : 0;
+  memoryGuard.peak = 0;
+};
+
+const setSignalBuffer = (buffer: Uint8Array) => {
+  const signalBuffer = {
+    get 0() {
+      if (buffer[0]) {
+        return buffer[0];
+      }
+      if (memoryGuard.limit && heapSize() > memoryGuard.limit) {
+        memoryGuard.peak = heapSize() - memoryGuard.start;
+        memoryGuard.limit = 0; // raise once
+        return memoryGuard.signal;
+      }
+      if (
+        patternBudget.deadline &&
+        performance.now() > patternBudget.deadline
+      ) {
+        patternBudget.deadline = 0; // raise once
+        return patternBudget.signal;
+      }
+      if (outputFlush.due && performance.now() > outputFlush.due) {
+        outputFlush.due = 0; // raise once
+        return outputFlush.signal;
+      }
+      return 0;
+    },
+    set 0(value: number) {
+      buffer[0] = value;
+    },
+  };
+  workerContext.pyodide!.setInterruptBuffer(signalBuffer as any);
+};
+
+// Python functions of init.py. globals.get() returns a new proxy on every call,
+// so each one is looked up once and kept
+const pyFunctions = new Map<string, any>();
+const pyFunction = (name: string) => {
+  let fn = pyFunctions.get(name);
+  if (!fn) {
+    fn = workerContext.pyodide!.globals.get(name);
+    pyFunctions.set(name, fn);
+  }
+  return fn;
+};
+
+// bring Python back to its state after initialisation (see reset_run in init.py)
+// and measure what is left
+const resetRun = (): RunMemoryStats | undefined => {
+  if (!workerContext.pyodide) {
+    return undefined;
+  }
+  memoryGuard.limit = 0;
+  patternBudget.deadline = 0;
+  outputFlush.due = 0;
+  // not closed, so the last commands still reach the canvas worker; it closes
+  // the port when the next run's arrives
+  workerContext.canvasPort = null;
+  try {
+    const stats = pyFunction("reset_run")();
+    return {
+      ...stats,
+      heap: (workerContext.pyodide as any)._module.HEAPU8.length,
+    };
+  } catch (e) {
+    console.log("Error resetting after run", e);
+    return undefined;
+  }
+};
+
+// updated files are freshly read copies, so their buffers can be transferred
+const postDebugFinished = (
+  reason: string,
+  updatedSessionFiles: SessionFile[],
+  memory?: RunMemoryStats
+) => {
+  const peak = reason === "memory" ? memoryGuard.peak : undefined;
+  self.postMessage(
+    { cmd: "debug-finished", reason, updatedSessionFiles, memory, peak },
+    { transfer: updatedSessionFiles.map((f) => (f.data as Uint8Array).buffer) }
+  );
 };
 
 // js proxy posting messages. Used from Python
 function workerPostMessage(msg: any) {
   self.postMessage(msg);
 }
+// canvas commands as JSON, straight to the canvas worker when there is one.
+// The page only hears that the run draws, so it can show the canvas
+function workerDraw(msg: string) {
+  const port = workerContext.canvasPort;
+  if (!port) {
+    self.postMessage({ cmd: "draw", msg });
+    return;
+  }
+  if (!workerContext.canvasPortUsed) {
+    workerContext.canvasPortUsed = true;
+    self.postMessage({ cmd: "draw-direct" });
+  }
+  port.postMessage(msg);
+}
 function workerPrint(msg: any) {
   self.postMessage({ cmd: "print", msg: msg });
 }
@@ -307,13 +944,57 @@ function workerCheckKeyDown(keyCode: number) {
     workerContext.keyDownBuffer && workerContext.keyDownBuffer[keyCode] > 0
   );
 }
+// all input events since the last call as a flat [type, a, b, c, ...] array
+function workerPollEvents() {
+  return workerContext.eventBuffer
+    ? drainEvents(workerContext.eventBuffer)
+    : new Int32Array(0);
+}
+// copy of the whole key state, one byte per key code
+function workerKeysDown() {
+  return workerContext.keyDownBuffer
+    ? workerContext.keyDownBuffer.slice()
+    : new Uint8Array(256);
+}
+// copy-on-write for lazy files, called from Python before opening for writing.
+// The modification time is kept, so a file that is opened but not changed is
+// not reported back as updated
+function workerMaterialiseLazyFile(path: string, keepContents: boolean) {
+  if (!workerContext.pyodide || !workerContext.lazyFiles.has(path)) {
+    return;
+  }
+  const FS = workerContext.pyodide.FS as any;
+  const stat = FS.stat(path);
+  const contents = keepContents ? FS.readFile(path) : new Uint8Array(0);
+  workerContext.lazyFiles.delete(path);
+  FS.unlink(path);
+  FS.writeFile(path, contents, { canOwn: true });
+  FS.utime(path, Number(stat.atime), Number(stat.mtime));
+}
+function workerMemoryPeak() {
+  return memoryGuard.peak;
+}
+function workerArmPatternBudget(ms: number) {
+  patternBudget.deadline =
+    ms && patternBudget.signal ? performance.now() + ms : 0;
+}
+function workerArmOutputFlush(ms: number) {
+  outputFlush.due = outputFlush.signal ? performance.now() + ms : 0;
+}
 function workerInterrupted() {
   return workerContext.interruptBuffer && workerContext.interruptBuffer[0] > 2;
 }
 
 Object.assign(self as any, {
   workerPostMessage,
+  workerDraw,
   workerPrint,
   workerCheckKeyDown,
+  workerPollEvents,
+  workerKeysDown,
+  workerMaterialiseLazyFile,
+  workerMemoryPeak,
+  workerArmPatternBudget,
+  workerArmOutputFlush,
   workerInterrupted,
 });